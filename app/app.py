@@ -4,54 +4,414 @@
 Main file for running simulation for all bikes in vteam-project.
 """
 import os
+import time
 import asyncio
-import requests
+import argparse
 
 from src.bikefactory import BikeFactory
+from src.bootstrap import FleetBootstrap
+from src.fleetgen import GENERATOR_MODES, FleetGenerator
+from src.clock import ScaledClock, VirtualClock, get_clock, set_clock
+from src.perf import enable_fast_path
+from src.metrics import dump_metrics, enable_metrics, monitor_loop_lag, serve_metrics
 from src.routehandler import RouteHandler
-from src.sselistener import SSEListener
+from src.scheduler import FleetScheduler
+from src.fleetzones import FleetZoneEvaluator
+from src.sendpolicy import DeltaSendPolicy
+from src.shard import ShardSupervisor, partition, report_metrics
+from src.sselistener import SSEListener, FleetSSEListener
+from src.telemetryclient import TelemetryClient, set_client
+from src.uplink import BatchUplink
+from src.zoneregistry import ZoneRegistry
 
+# Here the interval can be changed for how often bikes should update it's position
+INTERVAL_IN_SECONDS = 3
 
-async def main():
+
+async def report_pool_stats(client: TelemetryClient, interval: int, send_policy: DeltaSendPolicy = None):
+    """ Print statistics for the connection pool, used to size the pool under load.
+
+    Args:
+        client (TelemetryClient): the client to report for
+        interval (int): seconds between each report
+        send_policy (DeltaSendPolicy): if set, sent, skipped and heartbeat messages are also printed
+    """
+    while True:
+        await asyncio.sleep(interval)
+        print(f"Pool: {client.stats()}")
+        if send_policy is not None:
+            print(f"Send policy: {send_policy.stats()}")
+
+
+def collect_metrics(bike_factory: BikeFactory, sources: dict):
+    """ Collect metrics for a shard, sent to the shard supervisor.
+
+    Args:
+        bike_factory (BikeFactory): factory with the bikes in the shard
+        sources (dict): objects with a stats() method keyed by prefix for their metrics, None is skipped
+
+    Returns:
+        dict: the metrics
+    """
+    metrics = {'bikes': len(bike_factory.bikes)}
+    for prefix, source in sources.items():
+        if source is not None:
+            metrics.update({f"{prefix}_{name}": value for name, value in source.stats().items()})
+    return metrics
+
+
+def start_instrumentation(args: argparse.Namespace, client: TelemetryClient, shard_index: int = 0):
+    """ Start the tasks exporting metrics, if enabled with --metrics-port or --metrics-file.
+
+    Each shard serves its metrics on --metrics-port plus its index, and writes its own file.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        client (TelemetryClient): client with the in-flight requests
+        shard_index (int): index of the shard, default is 0
+
+    Returns:
+        list: tasks for the loop lag monitor and the export
+    """
+    if args.metrics_port is None and args.metrics_file is None:
+        return []
+
+    metrics = enable_metrics()
+    metrics.gauge_function('in_flight_requests', lambda: client.in_flight)
+    tasks = [asyncio.create_task(monitor_loop_lag(metrics))]
+    if args.metrics_port is not None:
+        tasks.append(asyncio.create_task(serve_metrics(metrics, args.metrics_port + shard_index)))
+    if args.metrics_file is not None:
+        root, extension = os.path.splitext(args.metrics_file)
+        path = f"{root}-{shard_index}{extension}" if args.shards > 1 else args.metrics_file
+        tasks.append(asyncio.create_task(dump_metrics(metrics, path, args.metrics_interval)))
+    return tasks
+
+
+def generated_fleet(args: argparse.Namespace):
+    """ Generator for a synthetic fleet, if enabled with --generate-fleet.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+
+    Returns:
+        FleetGenerator or None: the generator, None when bikes come from server and routes from files
+    """
+    if args.generate_fleet is None:
+        return None
+    return FleetGenerator(args.generate_fleet, seed=args.generate_seed, mode=args.generate_mode)
+
+
+def load_fleet(args: argparse.Namespace, interval: int, bike_data: list = None, shard_index: int = 0):
+    """ Load routes for the fleet with RouteHandler, from the route files or from a fleet generator.
+
+    In a shard only the routes for the bikes in bike_data are kept.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        interval (int): interval in seconds for simulation
+        bike_data (list): data for the bikes in this process, default is the generated bikes of the shard or None
+        shard_index (int): index of the shard when running in a shard, default is 0
+
+    Returns:
+        tuple:
+            - Mapping: routes keyed by bike id
+            - list or None: data for the bikes, None if it should be fetched from server
+    """
+    base_dir = os.path.dirname(__file__)
+    routes_dir = args.routes_dir or os.path.join(base_dir, 'routes')
+    cache_dir = None if args.no_route_cache else os.path.join(base_dir, '.route-cache')
+    generator = generated_fleet(args)
+    if generator is not None and bike_data is None:
+        bike_data = list(generator.bikes(shard_index, max(1, args.shards)))
+    bike_ids = None
+    if generator is None and bike_data is not None and args.shards > 1:
+        bike_ids = {data_item.get('id') for data_item in bike_data}
+
+    r_handler = RouteHandler(routes_dir, interval=interval, cache_dir=cache_dir,
+                             lazy=args.lazy_routes, max_resident=args.max_resident_routes,
+                             compact=args.compact_routes, source=generator, bike_ids=bike_ids)
+    return r_handler.routes, bike_data
+
+
+def start_clock(args: argparse.Namespace):
+    """ Use a virtual clock or a faster clock for the bikes in this process, with --virtual-clock or --speedup.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+
+    Returns:
+        VirtualClock, ScaledClock or None: the clock, None when bikes run in real time
+    """
+    if args.virtual_clock:
+        clock = VirtualClock()
+    elif args.speedup != 1:
+        clock = ScaledClock(args.speedup)
+    else:
+        return None
+    set_clock(clock)
+    return clock
+
+
+async def run_tasks(tasks: list, seconds: float = None):
+    """ Run the tasks until stopped, or for a time on the process-wide clock and then stop them.
+
+    Args:
+        tasks (list): the tasks
+        seconds (float): simulated time to run, default is to run until stopped
+    """
+    if seconds is None:
+        await get_clock().wait(asyncio.gather(*tasks))
+        return
+
+    start = time.monotonic()
+    await get_clock().sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"Ran {seconds:g} s of simulated time in {time.monotonic() - start:.1f} s")
+
+
+def create_senders(args: argparse.Namespace, client: TelemetryClient):
+    """ Create the optional parts used when bikes send data.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        client (TelemetryClient): client used for requests to server
+
+    Returns:
+        tuple:
+            - BatchUplink or None: uplink for sending data in batches
+            - DeltaSendPolicy or None: policy for skipping data that hasn't changed
+    """
+    uplink = None
+    if args.batch_uplink:
+        uplink = BatchUplink(client, batch_size=args.batch_size, flush_interval=args.batch_interval)
+
+    send_policy = None
+    if args.skip_unchanged:
+        send_policy = DeltaSendPolicy(args.battery_threshold, args.max_silence)
+    return uplink, send_policy
+
+
+def parse_args():
+    """ Parse arguments from command line, all are optional.
+
+    Returns:
+        argparse.Namespace: the arguments
+    """
+    parser = argparse.ArgumentParser(description="Run the simulation for all bikes.")
+    parser.add_argument('--batch-uplink', action='store_true',
+                        help="send data from bikes to server in batches instead of one request per bike")
+    parser.add_argument('--batch-size', type=int, default=200, help="max number of bikes in one batch")
+    parser.add_argument('--batch-interval', type=float, default=0.25, help="max seconds between batches")
+    parser.add_argument('--sse-connections', type=int, default=1,
+                        help="number of SSE connections shared by the fleet, 0 for one connection per bike")
+    parser.add_argument('--startup-concurrency', type=int, default=50,
+                        help="max number of bikes fetching their data at the same time on startup")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="skip data from bikes that hasn't changed, send a heartbeat at least every --max-silence")
+    parser.add_argument('--max-silence', type=float, default=300,
+                        help="max seconds between two messages from a bike with --skip-unchanged")
+    parser.add_argument('--battery-threshold', type=float, default=0.01,
+                        help="smallest change in battery level that is sent with --skip-unchanged")
+    parser.add_argument('--gps-distance', choices=['geodesic', 'planar'], default='geodesic',
+                        help="how speed is calculated from positions, planar is faster for short distances")
+    parser.add_argument('--zone-cache-cell', type=float, default=None,
+                        help="cache speed limits in grid cells of this size in degrees, e.g. 0.0005")
+    parser.add_argument('--zone-cache-size', type=int, default=10000,
+                        help="max number of cached grid cells in each city with --zone-cache-cell")
+    parser.add_argument('--speed-limit-timeline', action='store_true',
+                        help="calculate speed limits for all points of a route when a simulation starts")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve latency metrics as Prometheus text on /metrics on this port")
+    parser.add_argument('--metrics-file', default=None,
+                        help="write latency metrics as JSON to this file every --metrics-interval")
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help="seconds between writes of --metrics-file")
+    parser.add_argument('--fast', action='store_true',
+                        help="use uvloop and orjson if they are installed (requirements-perf.txt), "
+                             "falls back to asyncio and json")
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1,
+                        help="number of processes the fleet is split into, default is the number of CPU cores")
+    parser.add_argument('--scheduler', action='store_true',
+                        help="run all bikes from one scheduler with spread send times instead of one loop per bike, "
+                             "speed limits for the bikes due in each --zone-window are looked up together")
+    parser.add_argument('--tick', type=float, default=0.1, help="seconds between ticks in the scheduler")
+    parser.add_argument('--zone-window', type=float, default=1.0,
+                        help="seconds of ticks whose bikes get their speed limits looked up together with --scheduler")
+    parser.add_argument('--no-route-cache', action='store_true',
+                        help="always process the routes from the route files, don't use the compiled route cache")
+    parser.add_argument('--lazy-routes', action='store_true',
+                        help="load the route for a bike when its simulation starts instead of all routes on start")
+    parser.add_argument('--max-resident-routes', type=int, default=100,
+                        help="max number of routes kept in memory with --lazy-routes")
+    parser.add_argument('--virtual-clock', action='store_true',
+                        help="run the simulation in virtual time, the time moves to the next event as soon as all "
+                             "bikes are waiting, so routes are replayed as fast as the server answers")
+    parser.add_argument('--speedup', type=float, default=1,
+                        help="run the simulation this many times faster than real time, intervals, breaks and "
+                             "loops are shortened while speeds and battery drain follow the simulated time")
+    parser.add_argument('--run-for', type=float, default=None,
+                        help="stop after this many seconds of simulated time, default is to run until stopped")
+    parser.add_argument('--compact-routes', action='store_true',
+                        help="store route coordinates as int32 microdegrees, halves the memory used by routes")
+    parser.add_argument('--routes-dir', default=None,
+                        help="directory with route files, ex. written by src.fleetgen, default is the routes-directory")
+    parser.add_argument('--generate-fleet', type=int, default=None,
+                        help="run this many generated bikes instead of bikes from server, routes are generated "
+                             "when used, run the server with the same fleet with: python -m src.mockapi --bikes N")
+    parser.add_argument('--generate-seed', type=int, default=1, help="seed for --generate-fleet")
+    parser.add_argument('--generate-mode', choices=GENERATOR_MODES, default='walk',
+                        help="random walks or lines between origin and destination for --generate-fleet")
+    args = parser.parse_args()
+    if args.speedup <= 0:
+        parser.error("--speedup must be positive")
+    if args.virtual_clock and args.speedup != 1:
+        parser.error("--speedup can't be used with --virtual-clock")
+    return args
+
+
+async def main(args: argparse.Namespace, bike_data: list = None, metrics_queue=None, shard_index: int = 0):
     """ Main program to start up all bikes for simulation.
 
     Gets simulation data from json-files and bike-data from server.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        bike_data (list): data for the bikes to run, fetched from server if None
+        metrics_queue (multiprocessing.Queue): if set, metrics are sent to the shard supervisor
+        shard_index (int): index of the shard when running in a shard, default is 0
     """
-    # Here the interval can be changed for how often bikes should update it's position
-    interval_in_seconds = 3
+    clock = start_clock(args)
+    # The time shouldn't move while the fleet is started, the main task holds it until it waits on the clock
+    get_clock().register()
 
     # API-URL
     base_url = os.environ.get('API_URL', '')
 
-    # API-key
-    api_key = os.environ.get('API_KEY', '')
+    # Shared client for all requests to server, pool size can be changed with env-variables
+    client = TelemetryClient(
+        limit=int(os.environ.get('POOL_LIMIT', 100)),
+        limit_per_host=int(os.environ.get('POOL_LIMIT_PER_HOST', 100)),
+        timeout=float(os.environ.get('POOL_TIMEOUT', 10))
+    )
+    set_client(client)
 
-    # Load routes with RouteHandler
-    base_dir = os.path.dirname(__file__)
-    routes_dir = os.path.join(base_dir, 'routes')
-    r_handler = RouteHandler(routes_dir, interval=interval_in_seconds)
-    routes = r_handler.routes
+    routes, bike_data = load_fleet(args, INTERVAL_IN_SECONDS, bike_data, shard_index)
 
-    # Get bike_data from server
-    headers = {'x-api-key': api_key}
-    response = requests.get(f"{base_url}/bikes", headers=headers, timeout=1.5)
-    bike_data = response.json()
+    uplink, send_policy = create_senders(args, client)
 
-    # Initialize bikes with BikeFactory
-    bike_factory = BikeFactory(bike_data, routes, interval=interval_in_seconds)
+    # BikeFactory starts empty, bikes are added by the bootstrap when their data is ready
+    bike_factory = BikeFactory([], routes, interval=INTERVAL_IN_SECONDS, client=client, uplink=uplink,
+                               zone_registry=ZoneRegistry(args.zone_cache_cell, args.zone_cache_size),
+                               send_policy=send_policy, distance_backend=args.gps_distance,
+                               speed_limit_timeline=args.speed_limit_timeline)
 
     # Start listeners to use for simulation.
-    tasks = []
-    for bike in bike_factory.bikes.values():
+    tasks = [asyncio.create_task(report_pool_stats(client, 60, send_policy))]
+    tasks.extend(start_instrumentation(args, client, shard_index))
+    if uplink is not None:
+        tasks.append(get_clock().create_task(uplink.run()))
+    sse_url = f"{base_url}/bikes/instructions"
+    if args.sse_connections > 0:
+        fleet_listener = FleetSSEListener(bike_factory.bikes, sse_url, args.sse_connections, shards=args.shards,
+                                          zone_registry=bike_factory.zone_registry)
+        tasks.append(asyncio.create_task(fleet_listener.listen()))
+    scheduler = None
+    zone_evaluator = None
+    if args.scheduler:
+        zone_evaluator = FleetZoneEvaluator()
+        scheduler = FleetScheduler(args.tick, zone_evaluator=zone_evaluator, zone_window=args.zone_window)
+        tasks.append(get_clock().create_task(scheduler.run()))
+
+    if metrics_queue is not None:
+        sources = {'pool': client, 'uplink': uplink, 'scheduler': scheduler, 'send_policy': send_policy,
+                   'zones': zone_evaluator, 'zone_cache': bike_factory.zone_registry,
+                   'clock': clock}
+        tasks.append(asyncio.create_task(report_metrics(
+            metrics_queue, shard_index, lambda: collect_metrics(bike_factory, sources), 10
+        )))
+
+    def start_bike(bike):
         internal_loop_interval = 10  # Used when simulating bikes not moving on map
-        sse_url = f"{base_url}/bikes/instructions"
-        listener = SSEListener(bike, sse_url)
-        tasks.append(listener.listen())
-        tasks.append(bike.start(internal_loop_interval))
+        if args.sse_connections == 0:
+            listener = SSEListener(bike, sse_url)
+            tasks.append(asyncio.create_task(listener.listen()))
+        if scheduler is not None:
+            scheduler.add(bike)
+        else:
+            tasks.append(get_clock().create_task(bike.start(internal_loop_interval)))
+
+    try:
+        # Fetch bikes and zones concurrently, each bike is started as soon as it is ready
+        bootstrap = FleetBootstrap(bike_factory, client, concurrency=args.startup_concurrency)
+        await bootstrap.run(start_bike, bike_data)
+        print(f"Running {len(bike_factory.bikes)} bikes")
+
+        await run_tasks(tasks, args.run_for)
+    finally:
+        await client.close()
+
+
+def run_shard(index: int, bike_data: list, metrics_queue, args: argparse.Namespace):
+    """ Run the bikes for one shard, started in its own process by the shard supervisor.
+
+    Args:
+        index (int): index of the shard
+        bike_data (list): data for the bikes in the shard, None for a generated fleet
+        metrics_queue (multiprocessing.Queue): queue for sending metrics to the supervisor
+        args (argparse.Namespace): arguments from command line
+    """
+    if args.fast:
+        enable_fast_path()
+    asyncio.run(main(args, bike_data, metrics_queue, index))
+
+
+async def fetch_fleet():
+    """ Fetch data for all bikes from server, used before the fleet is split into shards.
+
+    Returns:
+        list: data for each bike
+    """
+    client = TelemetryClient()
+    headers = {'x-api-key': os.environ.get('API_KEY', '')}
+    try:
+        bike_data = await client.get_json(f"{os.environ.get('API_URL', '')}/bikes", headers=headers)
+    finally:
+        await client.close()
+    if bike_data is None:
+        raise RuntimeError("Couldn't fetch bikes from server")
+    return bike_data
+
 
-    print("Running")
+def run_sharded(args: argparse.Namespace):
+    """ Split the fleet by bike id and run each part in its own process.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+    """
+    generator = generated_fleet(args)
+    if generator is not None:
+        # Each shard generates its own bikes, the fleet is never built here
+        shard_data = [None] * args.shards
+        print(f"Running {len(generator)} generated bikes in {args.shards} shards")
+    else:
+        bike_data = asyncio.run(fetch_fleet())
+        shard_data = partition(bike_data, args.shards)
+        if not args.lazy_routes and not args.no_route_cache:
+            # Build the route cache once here, the shards load it and keep the routes for their own bikes
+            load_fleet(args, INTERVAL_IN_SECONDS)
+        print(f"Running {len(bike_data)} bikes in {args.shards} shards")
+    supervisor = ShardSupervisor(run_shard, shard_data, args=(args,))
+    supervisor.run()
 
-    await asyncio.gather(*tasks)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    arguments = parse_args()
+    if arguments.fast:
+        print(f"Fast path: {enable_fast_path()}")
+    if arguments.shards > 1:
+        run_sharded(arguments)
+    else:
+        asyncio.run(main(arguments))
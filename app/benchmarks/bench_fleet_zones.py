@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for speed limits for a whole fleet, bike by bike compared with FleetZoneEvaluator.
+
+The bikes are spread randomly over a city with 50 zones, the same city as in bench_zone.
+Bike by bike calls CityZone.get_speed_limit() once for each bike, the evaluator looks up
+all positions in the city with one vectorized call.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_fleet_zones
+"""
+import time
+from src.fleetzones import FleetZoneEvaluator
+from benchmarks.bench_zone import create_city_data, create_city_zone, create_points
+
+
+def run(fleet_sizes: tuple = (1_000, 10_000, 100_000), zone_count: int = 50):
+    """ Run the benchmark and print the result.
+
+    Args:
+        fleet_sizes (tuple): number of bikes in each run, default is 1k, 10k and 100k
+        zone_count (int): number of zones in the city, default is 50
+
+    Returns:
+        list[dict]: time in milliseconds for one evaluation of the whole fleet, for each fleet size
+    """
+    city_zone = create_city_zone(create_city_data(zone_count))
+    results = []
+    print(f"{'bikes':>8} {'per bike ms':>12} {'fleet ms':>10} {'speedup':>8}")
+    for size in fleet_sizes:
+        positions = create_points(size)
+
+        start = time.perf_counter()
+        per_bike = [city_zone.get_speed_limit(position) for position in positions]
+        per_bike_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        fleet = FleetZoneEvaluator.speed_limits(city_zone, positions)
+        fleet_ms = (time.perf_counter() - start) * 1000
+        assert fleet.tolist() == per_bike, "Fleet evaluation gives another result than bike by bike"
+
+        print(f"{size:>8} {per_bike_ms:>12.1f} {fleet_ms:>10.1f} {per_bike_ms / fleet_ms:>7.1f}x")
+        results.append({'bikes': size, 'per_bike_ms': per_bike_ms, 'fleet_ms': fleet_ms})
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for position updates in GpsSimulator, updates per second with each distance backend.
+
+Uses the points of the densified routes in the routes-directory, so the distances are the same
+short hops as in the simulation.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_gps
+"""
+import time
+from src.gps import DISTANCE_BACKENDS, GpsSimulator
+from src.routehandler import RouteHandler, trip_positions
+from benchmarks.bench_routes import ROUTES_DIR
+
+
+def load_positions(directory: str, interval: int, limit: int):
+    """ Positions from the trips of all routes, in order.
+
+    Args:
+        directory (str): directory with route files
+        interval (int): interval in seconds used for simulation
+        limit (int): max number of positions
+
+    Returns:
+        list: positions as [longitude, latitude]
+    """
+    positions = []
+    for route in RouteHandler(directory, interval).routes.values():
+        for trip in route['trips']:
+            positions.extend(trip_positions(trip['coords']))
+            if len(positions) >= limit:
+                return positions[:limit]
+    return positions
+
+
+def update_rate(positions: list, backend: str):
+    """ Position updates per second for one distance backend.
+
+    Args:
+        positions (list): positions to move the gps to
+        backend (str): name of the distance backend
+
+    Returns:
+        float: updates per second
+    """
+    gps_sim = GpsSimulator(positions[0], backend)
+    start = time.perf_counter()
+    for position in positions:
+        gps_sim.position = (position, 3)
+    return len(positions) / (time.perf_counter() - start)
+
+
+def run(directory: str = ROUTES_DIR, interval: int = 3, updates: int = 50_000):
+    """ Run the benchmark and print the result.
+
+    Args:
+        directory (str): directory with route files, default is the routes-directory
+        interval (int): interval in seconds used for simulation, default is 3
+        updates (int): number of position updates, default is 50 000
+
+    Returns:
+        dict: updates per second for each backend
+    """
+    positions = load_positions(directory, interval, updates)
+    result = {backend: update_rate(positions, backend) for backend in DISTANCE_BACKENDS}
+
+    for backend, rate in result.items():
+        print(f"{backend:9} {rate:>11,.0f} updates/s")
+    print(f"planar is {result['planar'] / result['geodesic']:.1f}x faster than geodesic")
+    return result
+
+
+if __name__ == '__main__':
+    run()
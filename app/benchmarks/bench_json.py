@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for the fast path, messages per second with the json module and with orjson and uvloop.
+
+Measures encoding of telemetry and decoding of SSE events with each codec, and telemetry sent
+through TelemetryClient to a local server with each setup.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_json
+"""
+import json
+import time
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src import perf
+from src.perf import JsonCodec, set_codec
+from src.telemetryclient import TelemetryClient
+
+TELEMETRY = {'id': 1, 'city_id': 'KSD', 'status_id': 2, 'charge_perc': 0.87, 'coords': [13.503, 59.3801], 'speed': 18}
+SSE_EVENT = json.dumps({'bike_id': 1, 'instruction': 'set_status', 'args': [2]})
+
+
+def codec_rate(codec: JsonCodec, messages: int):
+    """ Messages per second for encoding telemetry and decoding SSE events.
+
+    Args:
+        codec (JsonCodec): the codec to measure
+        messages (int): number of messages
+
+    Returns:
+        tuple:
+            - float: encoded messages per second
+            - float: decoded messages per second
+    """
+    start = time.perf_counter()
+    for _ in range(messages):
+        codec.dumps(TELEMETRY)
+    encode_rate = messages / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        codec.loads(SSE_EVENT)
+    decode_rate = messages / (time.perf_counter() - start)
+    return encode_rate, decode_rate
+
+
+async def send_rate(messages: int, concurrency: int):
+    """ Messages per second sent with TelemetryClient to a local server.
+
+    Args:
+        messages (int): number of messages
+        concurrency (int): number of messages sent at the same time
+
+    Returns:
+        float: messages per second
+    """
+    async def put_bike(request):
+        await request.read()
+        return web.Response()
+
+    application = web.Application()
+    application.router.add_put('/bikes/{id}', put_bike)
+    server = TestServer(application)
+    await server.start_server()
+    client = TelemetryClient(limit=concurrency, limit_per_host=concurrency)
+    req_url = str(server.make_url('/bikes/1'))
+
+    async def sender(count: int):
+        for _ in range(count):
+            async with client.put(req_url, json=TELEMETRY) as response:
+                await response.read()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(messages // concurrency) for _ in range(concurrency)))
+    rate = messages / (time.perf_counter() - start)
+
+    await client.close()
+    await server.close()
+    return rate
+
+
+def run(messages: int = 200_000, http_messages: int = 10_000, concurrency: int = 50):
+    """ Run the benchmark and print the result.
+
+    Args:
+        messages (int): number of messages for the codecs, default is 200 000
+        http_messages (int): number of messages sent to the local server, default is 10 000
+        concurrency (int): number of messages sent at the same time, default is 50
+
+    Returns:
+        dict: messages per second for each path
+    """
+    result = {}
+    setups = {'stdlib': (False, False), 'fast': (True, True)}
+    for name, (fast_json, use_uvloop) in setups.items():
+        codec = JsonCodec(fast=fast_json)
+        if fast_json and not codec.fast:
+            print("orjson is not installed, fast uses the json module")
+        result[f"{name}_encode"], result[f"{name}_decode"] = codec_rate(codec, messages)
+
+        set_codec(codec)
+        if use_uvloop and perf.uvloop is not None:
+            asyncio.set_event_loop_policy(perf.uvloop.EventLoopPolicy())
+        elif use_uvloop:
+            print("uvloop is not installed, fast uses the asyncio event loop")
+        result[f"{name}_http"] = asyncio.run(send_rate(http_messages, concurrency))
+        asyncio.set_event_loop_policy(None)
+        set_codec(JsonCodec())
+
+    for name in setups:
+        print(f"{name:7} encode {result[f'{name}_encode']:>11,.0f} msg/s, "
+              f"decode {result[f'{name}_decode']:>11,.0f} msg/s, http {result[f'{name}_http']:>7,.0f} msg/s")
+    return result
+
+
+if __name__ == '__main__':
+    run()
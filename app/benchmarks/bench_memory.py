@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for the memory used by all loaded routes in the routes-directory.
+
+Compares trip coordinates stored as lists of lists of floats, as before, with the float64
+and the compact int32 arrays used by RouteHandler. Memory is measured with tracemalloc
+as the memory still allocated after the routes are loaded.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_memory
+"""
+import gc
+import tracemalloc
+from benchmarks.bench_routes import ROUTES_DIR, legacy_load
+from src.routehandler import RouteHandler
+
+
+def measure(load):
+    """ Measure memory still allocated by the result of load.
+
+    Args:
+        load (callable): called without arguments, returns the loaded routes
+
+    Returns:
+        tuple:
+            - mixed: the loaded routes
+            - int: allocated bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    routes = load()
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return routes, allocated
+
+
+def run(directory: str = ROUTES_DIR, interval: int = 3):
+    """ Run the benchmark and print the result.
+
+    Args:
+        directory (str): directory with route files, default is the routes-directory
+        interval (int): interval in seconds used for simulation, default is 3
+
+    Returns:
+        dict: allocated bytes for each way of storing the routes
+    """
+    result = {}
+    _, result['lists'] = measure(lambda: legacy_load(directory, interval))
+    routes, result['float64'] = measure(lambda: RouteHandler(directory, interval).routes)
+    _, result['int32'] = measure(lambda: RouteHandler(directory, interval, compact=True).routes)
+
+    points = sum(len(trip['coords']) for route in routes.values() for trip in route['trips'])
+    print(f"Routes: {len(routes)}, points: {points}")
+    for name, allocated in result.items():
+        print(f"{name:8} {allocated / 2**20:7.2f} MiB ({allocated / points:6.1f} bytes per point incl. trip data)")
+    print(f"Coordinate arrays only: float64 {points * 16 / 2**20:.2f} MiB, int32 {points * 8 / 2**20:.2f} MiB")
+    return result
+
+
+if __name__ == '__main__':
+    run()
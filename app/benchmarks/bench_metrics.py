@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for the cost of measuring a stage, with metrics disabled and enabled.
+
+Measures a stage the same way as the bike loop does, with get_metrics(), start() and observe(),
+around a call that does nothing, so the result is the cost the instrumentation adds to each stage.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_metrics
+"""
+import time
+from src.metrics import Metrics, NullMetrics, get_metrics, set_metrics
+
+
+def stage_cost(calls: int):
+    """ Nanoseconds for measuring one stage with the process-wide metrics.
+
+    Args:
+        calls (int): number of measured stages
+
+    Returns:
+        float: nanoseconds for each stage
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        metrics = get_metrics()
+        stage_start = metrics.start()
+        metrics.observe('stage', stage_start)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def run(calls: int = 1_000_000):
+    """ Run the benchmark and print the result.
+
+    Args:
+        calls (int): number of measured stages, default is 1 000 000
+
+    Returns:
+        dict: nanoseconds for each stage, disabled and enabled
+    """
+    old_metrics = get_metrics()
+    set_metrics(NullMetrics())
+    result = {'disabled': stage_cost(calls)}
+    set_metrics(Metrics())
+    result['enabled'] = stage_cost(calls)
+    set_metrics(old_metrics)
+
+    for name, cost in result.items():
+        print(f"{name:8} {cost:>7.0f} ns per stage")
+    return result
+
+
+if __name__ == '__main__':
+    run()
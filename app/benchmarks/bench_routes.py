@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for loading and densifying the routes in the routes-directory.
+
+Compares the old densification (geodesic distance and a Python loop for each pair of points)
+with the numpy densification used by RouteHandler, and checks the error of the segment lengths.
+Also measures loading the routes from the compiled route cache.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_routes
+"""
+import os
+import json
+import math
+import time
+import tempfile
+import numpy as np
+from geopy.distance import lonlat, distance
+from src.geo import segment_lengths
+from src.routehandler import RouteHandler
+
+ROUTES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'routes')
+MAX_SPEED_M_IN_SECONDS = 5.5
+
+
+def legacy_densify(coordinates: list, max_length: float):
+    """ The old densification of one trip, with geodesic distance for each pair of points.
+
+    Args:
+        coordinates (list): points for the trip
+        max_length (float): max length between two points
+
+    Returns:
+        list: points with extra points added
+    """
+    updated_cords = []
+    for j, coords in enumerate(coordinates):
+        updated_cords.append(coords)
+        if j + 1 == len(coordinates):
+            break
+        next_point = coordinates[j + 1]
+        coords_distance = distance(lonlat(*coords), lonlat(*next_point)).meters
+        if coords_distance / max_length > 1:
+            split_by = math.ceil(coords_distance / max_length)
+            lng_distance = (next_point[0] - coords[0]) / split_by
+            lat_distance = (next_point[1] - coords[1]) / split_by
+            for multiply_by in range(1, split_by):
+                updated_cords.append([
+                    round(coords[0] + lng_distance * multiply_by, 6),
+                    round(coords[1] + lat_distance * multiply_by, 6)
+                ])
+    return updated_cords
+
+
+def read_routes(directory: str):
+    """ Read all route files without densifying them.
+
+    Args:
+        directory (str): directory with route files
+
+    Returns:
+        dict: routes keyed by bike id
+    """
+    routes = {}
+    for filename in os.listdir(directory):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), 'r', encoding="UTF-8") as file:
+                routes[int(filename[:-5])] = json.load(file)
+    return routes
+
+
+def legacy_load(directory: str, interval: int):
+    """ Load and densify all routes the old way.
+
+    Args:
+        directory (str): directory with route files
+        interval (int): interval in seconds used for simulation
+
+    Returns:
+        dict: routes keyed by bike id
+    """
+    routes = read_routes(directory)
+    max_length = MAX_SPEED_M_IN_SECONDS * interval
+    for route in routes.values():
+        for trip in route['trips']:
+            trip['coords'] = legacy_densify(trip['coords'], max_length)
+    return routes
+
+
+def max_length_error(routes: dict):
+    """ Largest relative error of segment lengths against geodesic distance.
+
+    Args:
+        routes (dict): routes keyed by bike id, not densified
+
+    Returns:
+        float: max relative error
+    """
+    worst = 0.0
+    for route in routes.values():
+        for trip in route['trips']:
+            coords = trip['coords']
+            if len(coords) < 2:
+                continue
+            lengths = segment_lengths(np.asarray(coords))
+            for j, length in enumerate(lengths):
+                geodesic = distance(lonlat(*coords[j]), lonlat(*coords[j + 1])).meters
+                if geodesic > 0:
+                    worst = max(worst, abs(length - geodesic) / geodesic)
+    return worst
+
+
+def max_point_difference(legacy_routes: dict, routes: dict):
+    """ Largest difference in degrees between points from the old and the numpy densification.
+
+    Numpy rounds halves to even while round() rounds the decimal value, so extra points
+    can differ in the sixth decimal.
+
+    Args:
+        legacy_routes (dict): routes densified the old way
+        routes (dict): routes densified with numpy
+
+    Returns:
+        float: max difference in degrees
+    """
+    worst = 0.0
+    for bike_id, route in legacy_routes.items():
+        for legacy_trip, trip in zip(route['trips'], routes[bike_id]['trips']):
+            difference = np.abs(np.asarray(legacy_trip['coords']) - np.asarray(trip['coords']))
+            worst = max(worst, float(difference.max(initial=0)))
+    return worst
+
+
+def count_points(routes: dict):
+    """ Count the number of points in all trips.
+
+    Args:
+        routes (dict): routes keyed by bike id
+
+    Returns:
+        int: number of points
+    """
+    return sum(len(trip['coords']) for route in routes.values() for trip in route['trips'])
+
+
+def run(directory: str = ROUTES_DIR, interval: int = 3):
+    """ Run the benchmark and print the result.
+
+    Args:
+        directory (str): directory with route files, default is the routes-directory
+        interval (int): interval in seconds used for simulation, default is 3
+
+    Returns:
+        dict: wall time for all ways and the max error
+    """
+    start = time.perf_counter()
+    legacy_routes = legacy_load(directory, interval)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    routes = RouteHandler(directory, interval).routes
+    numpy_time = time.perf_counter() - start
+
+    assert count_points(legacy_routes) == count_points(routes), "Different number of points"
+    assert max_point_difference(legacy_routes, routes) <= 1.5e-6, "Points differ more than rounding"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        RouteHandler(directory, interval, cache_dir=cache_dir)  # Write the cache
+        start = time.perf_counter()
+        cached = RouteHandler(directory, interval, cache_dir=cache_dir)
+        cached_time = time.perf_counter() - start
+        assert cached.from_cache and count_points(cached.routes) == count_points(routes), "Cache not used"
+
+    error = max_length_error(read_routes(directory))
+    print(f"Routes: {len(routes)}, points after densify: {count_points(routes)}")
+    print(f"Legacy (geodesic + loop): {legacy_time:.2f} s")
+    print(f"Numpy:                    {numpy_time:.2f} s ({legacy_time / numpy_time:.1f}x faster)")
+    print(f"Route cache:              {cached_time:.2f} s ({numpy_time / cached_time:.1f}x faster than numpy)")
+    print(f"Max relative error of segment lengths against geodesic: {error:.2e}")
+    return {
+        'legacy_seconds': legacy_time, 'numpy_seconds': numpy_time, 'cached_seconds': cached_time, 'max_error': error
+    }
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark for speed limit lookups in CityZone.
+
+Compares the old lookup (new Polygon for each check and a linear scan of all zones)
+with the prepared polygons and spatial index used by CityZone, and with all points
+looked up in one batched call as done for the speed limits of a route. Cached is the
+grid cell cache, measured on the second lookup of each point like a parked bike.
+
+Run from the app-directory with:
+    python -m benchmarks.bench_zone
+"""
+import random
+import time
+from shapely.geometry import Point, Polygon
+from src.zone import CityZone, Zone
+
+# Bounding box for the test city, roughly 8 x 8 km
+CITY_BOUNDS = (13.44, 59.35, 13.58, 59.42)
+
+
+def square(lng: float, lat: float, size: float):
+    """ Coordinates for a square zone.
+
+    Args:
+        lng (float): longitude for lower left corner
+        lat (float): latitude for lower left corner
+        size (float): length of the sides in degrees
+
+    Returns:
+        list: coordinates for the polygon
+    """
+    return [[lng, lat], [lng + size * 2, lat], [lng + size * 2, lat + size], [lng, lat + size], [lng, lat]]
+
+
+def create_city_data(zone_count: int, seed: int = 1):
+    """ Create zone data for a city with randomly placed zones.
+
+    Args:
+        zone_count (int): number of zones in the city
+        seed (int): seed for the random placement, default is 1
+
+    Returns:
+        dict: data in the same format as from /bikes/{id}/zones
+    """
+    generator = random.Random(seed)
+    min_lng, min_lat, max_lng, max_lat = CITY_BOUNDS
+    zones = []
+    for zone_id in range(zone_count):
+        size = generator.uniform(0.0005, 0.004)  # About 50 - 450 m
+        longitude = generator.uniform(min_lng, max_lng - size * 2)
+        latitude = generator.uniform(min_lat, max_lat - size)
+        zones.append({
+            'zone_id': zone_id,
+            'geometry': {'coordinates': [square(longitude, latitude, size)]},
+            'speed_limit': generator.choice([0, 5, 10, 15])
+        })
+
+    city = [[min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]]
+    return {'city_id': 'BENCH', 'geometry': {'coordinates': [city]}, 'speed_limit': 20, 'zones': zones}
+
+
+def create_points(count: int, seed: int = 2):
+    """ Create random points inside the city bounds.
+
+    Args:
+        count (int): number of points
+        seed (int): seed for the random points, default is 2
+
+    Returns:
+        list: points as [longitude, latitude]
+    """
+    generator = random.Random(seed)
+    min_lng, min_lat, max_lng, max_lat = CITY_BOUNDS
+    return [[generator.uniform(min_lng, max_lng), generator.uniform(min_lat, max_lat)] for _ in range(count)]
+
+
+def legacy_speed_limit(city_data: dict, point: list):
+    """ The old lookup, creates each polygon again and checks all zones in order.
+
+    Args:
+        city_data (dict): zone data for the city
+        point (list): [longitude, latitude]
+
+    Returns:
+        int: speed limit for the point
+    """
+    if not Polygon(city_data['geometry']['coordinates'][0]).contains(Point(*point)):
+        return 0
+    for zone in city_data['zones']:
+        if Polygon(zone['geometry']['coordinates'][0]).contains(Point(*point)):
+            return zone.get('speed_limit', city_data['speed_limit'])
+    return city_data['speed_limit']
+
+
+def create_city_zone(city_data: dict):
+    """ Create an indexed CityZone from zone data.
+
+    Args:
+        city_data (dict): zone data for the city
+
+    Returns:
+        CityZone: city with all zones added
+    """
+    city_zone = CityZone(city_data)
+    city_zone.add_zones_list([Zone(zone, city_zone.speed_limit) for zone in city_data['zones']])
+    return city_zone
+
+
+def lookups_per_second(lookup, points: list):
+    """ Run a lookup for all points and measure the speed.
+
+    Args:
+        lookup (callable): function taking a point and returning a speed limit
+        points (list): points to look up
+
+    Returns:
+        tuple:
+            - float: lookups per second
+            - list: the speed limits, used to check that both paths give the same result
+    """
+    start = time.perf_counter()
+    result = [lookup(point) for point in points]
+    elapsed = time.perf_counter() - start
+    return len(points) / elapsed, result
+
+
+def run(zone_counts: tuple = (10, 50, 200), point_count: int = 2000):
+    """ Run the benchmark and print the result.
+
+    Args:
+        zone_counts (tuple): number of zones in each run
+        point_count (int): number of lookups in each run
+
+    Returns:
+        list[dict]: result for each zone count
+    """
+    points = create_points(point_count)
+    results = []
+    print(f"{'zones':>6} {'legacy/s':>12} {'indexed/s':>12} {'batched/s':>12} {'cached/s':>12} {'speedup':>8}")
+    for zone_count in zone_counts:
+        city_data = create_city_data(zone_count)
+        city_zone = create_city_zone(city_data)
+
+        legacy, legacy_result = lookups_per_second(
+            lambda point, data=city_data: legacy_speed_limit(data, point), points
+        )
+        indexed, indexed_result = lookups_per_second(city_zone.get_speed_limit, points)
+        assert legacy_result == indexed_result, "Indexed lookup gives another result than legacy"
+
+        start = time.perf_counter()
+        batched_result = city_zone.get_speed_limits(points)
+        batched = len(points) / (time.perf_counter() - start)
+        assert batched_result.tolist() == indexed_result, "Batched lookup gives another result than indexed"
+
+        city_zone.enable_cache()
+        lookups_per_second(city_zone.get_speed_limit, points)  # Fill the cache
+        cached, cached_result = lookups_per_second(city_zone.get_speed_limit, points)
+        assert cached_result == indexed_result, "Cached lookup gives another result than indexed"
+
+        print(f"{zone_count:>6} {legacy:>12.0f} {indexed:>12.0f} {batched:>12.0f} {cached:>12.0f} "
+              f"{indexed / legacy:>7.1f}x")
+        results.append({'zones': zone_count, 'legacy_per_second': legacy, 'indexed_per_second': indexed,
+                        'batched_per_second': batched, 'cached_per_second': cached,
+                        'cache': city_zone.cache.stats()})
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmark suite, runs one short benchmark for each part of the bike brain and compares with a baseline.
+
+Results are written as JSON, by default to .benchmarks/latest.json. Save a run as the baseline and
+compare later runs with it, a metric that is worse than the baseline by more than the threshold is
+reported as a regression and the command exits with code 1.
+
+Run from the app-directory with:
+    python -m benchmarks.suite run --output .benchmarks/baseline.json
+    python -m benchmarks.suite run --baseline .benchmarks/baseline.json
+    python -m benchmarks.suite compare .benchmarks/baseline.json .benchmarks/latest.json --threshold 10
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import loadgen
+from src.battery import BatterySimulator
+from src.bike import Bike
+from src.gps import DISTANCE_BACKENDS, GpsSimulator
+from src.perf import get_codec
+from src.routehandler import RouteHandler
+from benchmarks.bench_gps import load_positions, update_rate
+from benchmarks.bench_routes import ROUTES_DIR
+from benchmarks.bench_zone import create_city_data, create_city_zone, create_points, lookups_per_second
+
+RESULTS_DIR = '.benchmarks'
+FORMAT_VERSION = 1
+SSE_EVENT = {'bike_id': 1, 'instruction': 'set_status', 'args': [2]}
+
+
+def metric(value: float, unit: str, higher_is_better: bool = True):
+    """ One measured value in the results.
+
+    Args:
+        value (float): the value
+        unit (str): unit of the value, ex. ops/s
+        higher_is_better (bool): if a higher value is better, default is True
+
+    Returns:
+        dict: the metric
+    """
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def best_rate(func, calls: int, repeat: int):
+    """ Calls per second for the fastest of some runs, which is the least disturbed by other load.
+
+    Args:
+        func (callable): called without arguments
+        calls (int): number of calls in each run
+        repeat (int): number of runs
+
+    Returns:
+        float: calls per second
+    """
+    fastest = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        fastest = min(fastest, time.perf_counter() - start)
+    return calls / fastest
+
+
+def timed(func, *args):
+    """ Seconds for one call.
+
+    Args:
+        func (callable): the function
+        *args: arguments for the function
+
+    Returns:
+        float: seconds
+    """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench_routes(quick: bool):
+    """ Time to load all routes, processed from the route files and from the route cache. """
+    repeat = 1 if quick else 3
+    processed = cached = math.inf
+    with tempfile.TemporaryDirectory() as cache_dir:
+        RouteHandler(ROUTES_DIR, 3, cache_dir=cache_dir)  # Creates the cache
+        for _ in range(repeat):
+            start = time.perf_counter()
+            RouteHandler(ROUTES_DIR, 3)
+            processed = min(processed, time.perf_counter() - start)
+            start = time.perf_counter()
+            RouteHandler(ROUTES_DIR, 3, cache_dir=cache_dir)
+            cached = min(cached, time.perf_counter() - start)
+    return {'processed': metric(processed, 's', False), 'cached': metric(cached, 's', False)}
+
+
+def bench_zones(quick: bool):
+    """ Speed limit lookups in a city with 50 zones, one point at a time and all points at once. """
+    city_zone = create_city_zone(create_city_data(50))
+    points = create_points(2000 if quick else 10_000)
+    lookups = max(lookups_per_second(city_zone.get_speed_limit, points)[0] for _ in range(1 if quick else 3))
+    batched = len(points) / min(timed(city_zone.get_speed_limits, points) for _ in range(1 if quick else 3))
+    return {'lookups': metric(lookups, 'lookups/s'), 'batched': metric(batched, 'lookups/s')}
+
+
+def bench_gps(quick: bool):
+    """ Position updates in GpsSimulator with each distance backend. """
+    positions = load_positions(ROUTES_DIR, 3, 10_000 if quick else 50_000)
+    return {backend: metric(max(update_rate(positions, backend) for _ in range(1 if quick else 3)), 'updates/s')
+            for backend in DISTANCE_BACKENDS}
+
+
+def bench_payload(quick: bool):
+    """ Building the data a bike sends, and building and encoding it. """
+    bike = Bike({'id': 1, 'status_id': 2, 'city_id': 'KSD'}, BatterySimulator(0.8), GpsSimulator([13.5, 59.38]))
+    codec = get_codec()
+    calls = 20_000 if quick else 200_000
+    repeat = 1 if quick else 3
+    return {
+        'get_data': metric(best_rate(bike.get_data, calls, repeat), 'payloads/s'),
+        'encoded': metric(best_rate(lambda: codec.dumps(bike.get_data()), calls, repeat), 'payloads/s')
+    }
+
+
+def bench_sse(quick: bool):
+    """ Dispatching instructions from server to a bike with SSEListener._control_bike. """
+    try:
+        from src.sselistener import SSEListener  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None  # aiosseclient is not installed
+
+    bike = Bike({'id': 1, 'status_id': 1}, BatterySimulator(0.8), GpsSimulator([13.5, 59.38]))
+    listener = SSEListener(bike, '')
+    events = 20_000 if quick else 200_000
+
+    async def dispatch():
+        start = time.perf_counter()
+        for _ in range(events):
+            await listener._control_bike(SSE_EVENT)  # pylint: disable=protected-access
+        return events / (time.perf_counter() - start)
+
+    return {'control_bike': metric(asyncio.run(dispatch()), 'events/s')}
+
+
+def bench_fleet(bikes: int, quick: bool):
+    """ Full fleet against the in-process stand-in server, with the load generator. """
+    args = loadgen.parse_args(['--bikes', str(bikes), '--duration', '3' if quick else '10', '--warmup', '2',
+                               '--sse-connections', '0'])
+    report = asyncio.run(loadgen.run(args))
+    return {
+        'updates': metric(report['updates_per_second'], 'updates/s'),
+        'request_p99': metric(report['request_p99_ms'], 'ms', False),
+        'dropped': metric(report['updates_dropped'], 'updates', False),
+        'loop_lag_p99': metric(report['loop_lag_p99_ms'], 'ms', False)
+    }
+
+
+CASES = {
+    'routes': bench_routes,
+    'zones': bench_zones,
+    'gps': bench_gps,
+    'payload': bench_payload,
+    'sse': bench_sse,
+    'fleet_1k': lambda quick: bench_fleet(1_000, quick),
+    'fleet_10k': lambda quick: bench_fleet(10_000, quick)
+}
+
+
+def run_suite(cases: list, quick: bool = False):
+    """ Run benchmark cases.
+
+    Args:
+        cases (list): names of the cases to run
+        quick (bool): fewer and shorter runs, less exact, default is False
+
+    Returns:
+        dict: the results with information about the run, cases that can't run are listed as skipped
+    """
+    results = {}
+    skipped = []
+    for name in cases:
+        print(f"Running {name}...", flush=True)
+        result = CASES[name](quick)
+        if result is None:
+            skipped.append(name)
+        else:
+            results[name] = result
+    return {
+        'version': FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'quick': quick,
+        'results': results,
+        'skipped': skipped
+    }
+
+
+def change_status(old: float, new: float, higher_is_better: bool, threshold: float):
+    """ Change of a metric and if it is a regression.
+
+    Args:
+        old (float): value in the baseline
+        new (float): value in the new run
+        higher_is_better (bool): if a higher value is better
+        threshold (float): percent a metric can be worse than the baseline before it is a regression
+
+    Returns:
+        tuple:
+            - float or None: change in percent, None if the baseline is 0
+            - str: regression, improved or ok
+    """
+    if old == 0:
+        # Ex. no dropped updates in the baseline, any dropped update is a regression
+        worse = new < 0 if higher_is_better else new > 0
+        return None, 'regression' if worse else 'ok'
+
+    change = (new - old) / abs(old) * 100
+    worse = -change if higher_is_better else change
+    if worse > threshold:
+        return change, 'regression'
+    if worse < -threshold:
+        return change, 'improved'
+    return change, 'ok'
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """ Compare results with a baseline.
+
+    Args:
+        baseline (dict): results from the baseline run
+        current (dict): results from the new run
+        threshold (float): percent a metric can be worse than the baseline before it is a regression
+
+    Returns:
+        list[dict]: one row for each metric in both runs, with the change in percent and a status
+    """
+    rows = []
+    for case, metrics in current['results'].items():
+        for name, value in metrics.items():
+            previous = baseline['results'].get(case, {}).get(name)
+            if previous is None:
+                continue
+            change, status = change_status(previous['value'], value['value'], value['higher_is_better'], threshold)
+            rows.append({'metric': f"{case}.{name}", 'unit': value['unit'], 'baseline': previous['value'],
+                         'current': value['value'], 'change': change, 'status': status})
+    return rows
+
+
+def print_comparison(rows: list, threshold: float):
+    """ Print the comparison as a table.
+
+    Args:
+        rows (list[dict]): rows from compare()
+        threshold (float): the threshold in percent
+
+    Returns:
+        int: number of regressions
+    """
+    print(f"{'metric':<26} {'baseline':>14} {'current':>14} {'change':>9}  status (threshold {threshold:g}%)")
+    for line in rows:
+        change = 'n/a' if line['change'] is None else f"{line['change']:+.1f}%"
+        print(f"{line['metric']:<26} {line['baseline']:>14,.2f} {line['current']:>14,.2f} {change:>9} ",
+              line['status'])
+    regressions = sum(line['status'] == 'regression' for line in rows)
+    print(f"{regressions} regressions")
+    return regressions
+
+
+def print_results(results: dict):
+    """ Print the results of a run.
+
+    Args:
+        results (dict): results from run_suite()
+    """
+    for case, metrics in results['results'].items():
+        for name, value in metrics.items():
+            print(f"{case + '.' + name:<26} {value['value']:>14,.2f} {value['unit']}")
+    for case in results['skipped']:
+        print(f"{case:<26} skipped")
+
+
+def load_results(path: str):
+    """ Read results from a file.
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        dict: the results
+    """
+    with open(path, 'r', encoding='UTF-8') as file:
+        return json.load(file)
+
+
+def save_results(results: dict, path: str):
+    """ Write results to a file, the directory is created if needed.
+
+    Args:
+        results (dict): results from run_suite()
+        path (str): path to the file
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='UTF-8') as file:
+        json.dump(results, file, indent=2)
+
+
+def parse_args(argv: list = None):
+    """ Parse arguments from command line.
+
+    Args:
+        argv (list): arguments, default is sys.argv
+
+    Returns:
+        argparse.Namespace: the arguments
+    """
+    parser = argparse.ArgumentParser(description="Run the benchmark suite or compare results.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks and write the results")
+    run_parser.add_argument('--cases', default=','.join(CASES),
+                            help=f"comma separated cases to run, default is all: {','.join(CASES)}")
+    run_parser.add_argument('--quick', action='store_true', help="fewer and shorter runs, less exact")
+    run_parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'),
+                            help="file for the results, default is .benchmarks/latest.json")
+    run_parser.add_argument('--baseline', default=None, help="compare the results with this file")
+    run_parser.add_argument('--threshold', type=float, default=10, help="percent worse that is a regression")
+
+    compare_parser = commands.add_parser('compare', help="compare results with a baseline")
+    compare_parser.add_argument('baseline', help="file with the baseline results")
+    compare_parser.add_argument('current', nargs='?', default=os.path.join(RESULTS_DIR, 'latest.json'),
+                                help="file with the new results, default is .benchmarks/latest.json")
+    compare_parser.add_argument('--threshold', type=float, default=10, help="percent worse that is a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        unknown = set(args.cases.split(',')) - set(CASES)
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: list = None):
+    """ Run the command from command line.
+
+    Args:
+        argv (list): arguments, default is sys.argv
+
+    Returns:
+        int: exit code, 1 if there are regressions
+    """
+    args = parse_args(argv)
+    if args.command == 'run':
+        current = run_suite(args.cases.split(','), args.quick)
+        save_results(current, args.output)
+        print_results(current)
+        print(f"Results written to {args.output}")
+        if args.baseline is None:
+            return 0
+        baseline = load_results(args.baseline)
+    else:
+        baseline = load_results(args.baseline)
+        current = load_results(args.current)
+
+    regressions = print_comparison(compare(baseline, current, args.threshold), args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
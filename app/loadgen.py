@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+Load generator, runs synthetic bikes against the local stand-in server and reports the achieved load.
+
+Used as the reference harness for performance changes to Bike, BikeSimulator and the SSE listeners.
+By default the stand-in server from src.mockapi is started in the same process, use --api-url to run
+against a server in another process, ex. started with:
+    python -m src.mockapi --bikes 1000
+
+Run from the app-directory with:
+    python loadgen.py --bikes 1000 --duration 30
+"""
+import json
+import random
+import asyncio
+import argparse
+from aiohttp import web
+from src.bike import Bike
+from src.bikefactory import BikeFactory
+from src.bikesimulator import BikeSimulator
+from src.bootstrap import FleetBootstrap
+from src.fleetgen import CITY_BOUNDS
+from src.metrics import FINE_BUCKETS, Metrics, NullMetrics, monitor_loop_lag, set_metrics
+from src.mockapi import create_app, synthetic_fleet
+from src.perf import enable_fast_path
+from src.scheduler import FleetScheduler
+from src.sendpolicy import DeltaSendPolicy
+from src.telemetryclient import TelemetryClient, set_client
+from src.uplink import BatchUplink
+from src.zoneregistry import ZoneRegistry
+
+PERCENTILES = (0.5, 0.9, 0.99)
+API_CLASSES = (Bike, BikeSimulator, BatchUplink, FleetBootstrap, ZoneRegistry)
+
+
+def use_api(api_url: str):
+    """ Send all requests from bikes, simulations, uplink and zones to the api.
+
+    Args:
+        api_url (str): base url for the api
+
+    Returns:
+        dict: the url used before for each class, used to restore them
+    """
+    previous = {api_class: api_class.API_URL for api_class in API_CLASSES}
+    for api_class in API_CLASSES:
+        api_class.API_URL = api_url
+    return previous
+
+
+def create_routes(fleet: list, count: int, points: int, seed: int = 2):
+    """ Create routes with one trip for the first bikes, a random walk from where the bike is.
+
+    Args:
+        fleet (list): data for the bikes
+        count (int): number of bikes with a route
+        points (int): number of points in each trip
+        seed (int): seed for the random walks, default is 2
+
+    Returns:
+        dict: routes keyed by bike id
+    """
+    generator = random.Random(seed)
+    west, south, east, north = CITY_BOUNDS
+    routes = {}
+    for data in fleet[:count]:
+        longitude, latitude = data['coords']
+        coords = []
+        for _ in range(points):
+            longitude = min(max(longitude + generator.uniform(-0.0002, 0.0002), west), east)
+            latitude = min(max(latitude + generator.uniform(-0.0001, 0.0001), south), north)
+            coords.append([longitude, latitude])
+        routes[data['id']] = {'trips': [{'coords': coords, 'user': {'id': data['id'], 'token': ''}}]}
+    return routes
+
+
+async def fetch_stats(client: TelemetryClient, api_url: str):
+    """ Get the counters from the stand-in server.
+
+    Args:
+        client (TelemetryClient): client used for the request
+        api_url (str): base url for the api
+
+    Returns:
+        dict: the counters, empty if the server has no /stats
+    """
+    return await client.get_json(f"{api_url}/stats", retries=0) or {}
+
+
+def start_listener(bikes: dict, api_url: str, connections: int):
+    """ Start listening for instructions on /bikes/instructions, if aiosseclient is installed.
+
+    Args:
+        bikes (dict[Bike]): the bikes to control
+        api_url (str): base url for the api
+        connections (int): number of connections
+
+    Returns:
+        asyncio.Task or None: the listener task, None if no listener is used
+    """
+    if connections <= 0:
+        return None
+    try:
+        from src.sselistener import FleetSSEListener  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        print("aiosseclient is not installed, running without SSE")
+        return None
+    return asyncio.create_task(FleetSSEListener(bikes, f"{api_url}/bikes/instructions", connections).listen())
+
+
+def summarize(args: argparse.Namespace, metrics: Metrics, counters: dict):
+    """ Create the report for the measured window.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        metrics (Metrics): metrics measured in the window
+        counters (dict): changes in the window for the server, send policy and uplink counters
+
+    Returns:
+        dict: the report
+    """
+    request = metrics.histogram('request')
+    update = metrics.histogram('update_bike_data')
+    loop_lag = metrics.histogram('loop_lag')
+    encode = metrics.histogram('encode')
+    requests = counters.get('single_requests', 0) + counters.get('bulk_requests', 0)
+    attempted = 0 if update is None else update.snapshot()['count']
+    # Updates still waiting in the uplink at the end of the window aren't dropped
+    sent = attempted - counters.get('skipped', 0) - counters.get('coalesced', 0) - counters.get('pending', 0)
+
+    report = {
+        'bikes': args.bikes,
+        'duration': args.duration,
+        'requests': requests,
+        'requests_per_second': requests / args.duration,
+        'updates_attempted': attempted,
+        'updates_received': counters.get('updates', 0),
+        'updates_per_second': counters.get('updates', 0) / args.duration,
+        'updates_skipped': counters.get('skipped', 0),
+        'updates_coalesced': counters.get('coalesced', 0),
+        'updates_dropped': max(0, sent - counters.get('updates', 0)),
+        'errors': sum(count for name, count in metrics.snapshot()['counters'].items()
+                      if name.startswith('http_errors_total')),
+        'rentals': counters.get('rentals', 0),
+        'events': counters.get('events', 0),
+        'loop_lag_p99_ms': 0.0 if loop_lag is None else loop_lag.quantile(0.99) * 1000,
+        'encode_p99_ms': 0.0 if encode is None else encode.quantile(0.99) * 1000
+    }
+    for fraction in PERCENTILES:
+        name = f"p{round(fraction * 100)}"
+        report[f"request_{name}_ms"] = 0.0 if request is None else request.quantile(fraction) * 1000
+    return report
+
+
+def print_report(report: dict):
+    """ Print the report in a readable form.
+
+    Args:
+        report (dict): report from summarize()
+    """
+    percentiles = ", ".join(f"p{round(fraction * 100)} {report[f'request_p{round(fraction * 100)}_ms']:.1f} ms"
+                            for fraction in PERCENTILES)
+    print(f"{report['bikes']} bikes for {report['duration']:.0f} s")
+    print(f"requests:  {report['requests_per_second']:,.0f} req/s, {report['errors']} errors")
+    print(f"latency:   {percentiles}")
+    print(f"updates:   {report['updates_per_second']:,.0f} updates/s, attempted {report['updates_attempted']}, "
+          f"received {report['updates_received']}, skipped {report['updates_skipped']}, "
+          f"coalesced {report['updates_coalesced']}, dropped {report['updates_dropped']}")
+    print(f"trips:     {report['rentals']} rentals, {report['events']} events")
+    print(f"loop lag:  p99 {report['loop_lag_p99_ms']:.1f} ms")
+    print(f"encoding:  p99 {report['encode_p99_ms']:.3f} ms")
+
+
+class LoadGenerator:
+    """ Class that starts a synthetic fleet against an api and measures the load it creates.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+        api_url (str): base url for the api
+        fleet (list): data for the bikes
+    """
+
+    def __init__(self, args: argparse.Namespace, api_url: str, fleet: list):
+        self._args = args
+        self._api_url = api_url
+        self._fleet = fleet
+        self._client = TelemetryClient(limit=args.pool_limit, limit_per_host=args.pool_limit)
+        self._uplink = None
+        if args.batch_uplink:
+            self._uplink = BatchUplink(self._client, batch_size=args.batch_size, flush_interval=args.batch_interval)
+        self._send_policy = DeltaSendPolicy() if args.skip_unchanged else None
+        self._scheduler = FleetScheduler(args.tick) if args.scheduler else None
+        self._tasks = []
+        self._previous_urls = {}
+
+    async def _counters(self):
+        """ Current counters from the server, the send policy and the uplink. """
+        counters = await fetch_stats(self._client, self._api_url)
+        for source in (self._send_policy, self._uplink):
+            if source is not None:
+                counters.update(source.stats())
+        return counters
+
+    def _start_bike(self, bike: Bike):
+        """ Start a bike when it is ready, rented so it sends data at the fast interval. """
+        bike.set_status(2)
+        if self._scheduler is not None:
+            self._scheduler.add(bike)
+        else:
+            self._tasks.append(asyncio.create_task(bike.start(1)))
+        if bike.id <= self._args.simulate:
+            self._tasks.append(asyncio.create_task(bike.run_simulation()))
+
+    async def start(self):
+        """ Create and start all bikes, returns when all bikes are started. """
+        self._previous_urls = use_api(self._api_url)
+        set_client(self._client)
+        routes = create_routes(self._fleet, self._args.simulate, self._args.trip_points)
+        factory = BikeFactory([], routes, interval=self._args.interval, client=self._client, uplink=self._uplink,
+                              send_policy=self._send_policy)
+        if self._uplink is not None:
+            self._tasks.append(asyncio.create_task(self._uplink.run()))
+        if self._scheduler is not None:
+            self._tasks.append(asyncio.create_task(self._scheduler.run()))
+        listener = start_listener(factory.bikes, self._api_url, self._args.sse_connections)
+        if listener is not None:
+            self._tasks.append(listener)
+
+        bootstrap = FleetBootstrap(factory, self._client, concurrency=self._args.startup_concurrency)
+        await bootstrap.run(self._start_bike, self._fleet)
+        return factory.bikes
+
+    async def measure(self):
+        """ Measure the load for the duration, after the warmup.
+
+        Returns:
+            dict: counters changed in the measured window and the metrics for the window
+        """
+        await asyncio.sleep(self._args.warmup)
+        metrics = Metrics(FINE_BUCKETS)
+        set_metrics(metrics)
+        self._tasks.append(asyncio.create_task(monitor_loop_lag(metrics, 0.1)))
+        before = await self._counters()
+        await asyncio.sleep(self._args.duration)
+        after = await self._counters()
+        counters = {name: value - before.get(name, 0) for name, value in after.items() if isinstance(value, int)}
+        return counters, metrics
+
+    async def stop(self):
+        """ Stop all bikes and tasks and close the client. """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._client.close()
+        for api_class, api_url in self._previous_urls.items():
+            api_class.API_URL = api_url
+
+
+async def run(args: argparse.Namespace):
+    """ Run the load generator.
+
+    Args:
+        args (argparse.Namespace): arguments from command line
+
+    Returns:
+        dict: the report
+    """
+    fleet, city_zones = synthetic_fleet(args.bikes)
+    runner = None
+    api_url = args.api_url
+    if api_url is None:
+        runner = web.AppRunner(create_app(fleet=fleet, city_zones=city_zones, latency=args.latency))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        api_url = f"http://127.0.0.1:{port}"
+
+    generator = LoadGenerator(args, api_url, fleet)
+    try:
+        await generator.start()
+        counters, metrics = await generator.measure()
+    finally:
+        await generator.stop()
+        set_metrics(NullMetrics())
+        if runner is not None:
+            await runner.cleanup()
+    return summarize(args, metrics, counters)
+
+
+def parse_args(argv: list = None):
+    """ Parse arguments from command line, all are optional.
+
+    Args:
+        argv (list): arguments, default is sys.argv
+
+    Returns:
+        argparse.Namespace: the arguments
+    """
+    parser = argparse.ArgumentParser(description="Run synthetic bikes against a stand-in server and report the load.")
+    parser.add_argument('--bikes', type=int, default=1000, help="number of bikes")
+    parser.add_argument('--duration', type=float, default=30, help="seconds measured after the warmup")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds after startup before measuring")
+    parser.add_argument('--interval', type=int, default=3, help="seconds between updates from each bike")
+    parser.add_argument('--api-url', default=None, help="run against this api instead of an in-process server")
+    parser.add_argument('--latency', type=float, default=0, help="seconds added by the in-process server")
+    parser.add_argument('--simulate', type=int, default=0, help="number of bikes that rent and ride a trip")
+    parser.add_argument('--trip-points', type=int, default=20, help="number of points in each simulated trip")
+    parser.add_argument('--sse-connections', type=int, default=1,
+                        help="connections listening for instructions, 0 for none, needs aiosseclient")
+    parser.add_argument('--pool-limit', type=int, default=100, help="max number of open connections")
+    parser.add_argument('--startup-concurrency', type=int, default=50,
+                        help="max number of bikes fetching their data at the same time on startup")
+    parser.add_argument('--batch-uplink', action='store_true', help="send data from bikes in batches")
+    parser.add_argument('--batch-size', type=int, default=200, help="max number of bikes in one batch")
+    parser.add_argument('--batch-interval', type=float, default=0.25, help="max seconds between batches")
+    parser.add_argument('--skip-unchanged', action='store_true', help="skip data from bikes that hasn't changed")
+    parser.add_argument('--scheduler', action='store_true', help="run all bikes from one scheduler")
+    parser.add_argument('--tick', type=float, default=0.1, help="seconds between ticks in the scheduler")
+    parser.add_argument('--fast', action='store_true', help="use uvloop and orjson if they are installed")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    if arguments.fast:
+        enable_fast_path()
+    result = asyncio.run(run(arguments))
+    if arguments.json:
+        print(json.dumps(result))
+    else:
+        print_report(result)
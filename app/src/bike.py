@@ -4,15 +4,24 @@ Bike module
 """
 import os
 import asyncio
-import aiohttp
+import functools
+from collections.abc import Mapping
+import numpy as np
 import requests
 from src.bikesimulator import BikeSimulator
 from src.battery import BatteryBase
 from src.gps import GpsBase
-from src.zone import Zone, CityZone
+from src.zone import CityZone
+from src.telemetryclient import TelemetryClient, get_client
+from src.uplink import BatchUplink
+from src.zoneregistry import ZoneRegistry
+from src.sendpolicy import DeltaSendPolicy, SEND, SKIP
+from src.routehandler import trip_degrees
+from src.metrics import get_metrics
+from src.clock import get_clock
 
 
-class Bike:
+class Bike:  # pylint: disable=too-many-instance-attributes,too-many-arguments
     """
     Class that represents the bike and it's brain (functionality)
 
@@ -22,19 +31,37 @@ class Bike:
         gps (GpsBase): the gps for the bike, used for position and speed
         simulation (dict=None): simulation data for bike, default is None
         interval (int=10): interval in seconds for the bike to send data to server when moving, default is 10
+        client (TelemetryClient=None): client used for requests to server, default is the shared client
+        uplink (BatchUplink=None): if set, data is sent to server in batches through the uplink
+        zone_registry (ZoneRegistry=None): if set, zones are shared with other bikes in the same city
+        routes (Mapping=None): routes keyed by bike id, used when simulation is None. The route is looked up
+            when a simulation is started, so routes can be loaded lazily.
+        send_policy (DeltaSendPolicy=None): if set, unchanged data is skipped or sent as a heartbeat
+        speed_limit_timeline (bool=False): if True, the speed limit for every point of a route is calculated
+            in one pass when a simulation starts and saved with the route, the simulation then sets the
+            speed limit for each point without checking zones
     """
     API_URL = os.environ.get('API_URL', '')
     API_KEY = os.environ.get('API_KEY', '')
     SLOW_INTERVAL = 30
 
-    def __init__(self, data: dict, battery: BatteryBase, gps: GpsBase, simulation: dict = None, interval: int = 10):
+    def __init__(self, data: dict, battery: BatteryBase, gps: GpsBase, simulation: dict = None, interval: int = 10,
+                 *, client: TelemetryClient = None, uplink: BatchUplink = None, zone_registry: ZoneRegistry = None,
+                 routes: Mapping = None, send_policy: DeltaSendPolicy = None, speed_limit_timeline: bool = False):
         self._status = data.get('status_id')
         self._id = data.get('id')
+        self._city_id = data.get('city_id')
+        self._zone_registry = zone_registry
         self._gps = gps
         self._battery = battery
         self._city_zone = None
         self._speed_limit = 20  # Fallback speed limit, speed limit is set automatically by position
         self._simulation = simulation
+        self._routes = routes
+        self._send_policy = send_policy
+        self._speed_limit_timeline = speed_limit_timeline
+        self._client = client if client is not None else get_client()
+        self._uplink = uplink
 
         # Intervals in bike, _used_interval is the one that is used in loops
         self._fast_interval = interval  # interval in seconds when bike is moving.
@@ -44,6 +71,7 @@ class Bike:
         self._running = False
         self._simulation_event_off = asyncio.Event()
         self._simulation_event_off.set()  # This sets the event to true, meaning simulation is NOT running
+        self._first_update = asyncio.Event()  # Set when the first data has been sent to server
 
     @property
     def id(self):
@@ -65,24 +93,60 @@ class Bike:
         """ BatteryBase: Returns the Battery-instance for the bike. """
         return self._battery
 
+    @property
+    def interval(self):
+        """ int: current interval in seconds between sending data to server, depends on status """
+        return self._interval
+
+    @property
+    def city_zone(self):
+        """ CityZone: zones for the city the bike is in, None if zones aren't loaded.
+
+        With a zone registry the latest zones for the city are used, so a refreshed city reaches the bike
+        as soon as any bike has fetched it again.
+        """
+        if self._zone_registry is not None and self._city_zone is not None:
+            city_zone = self._zone_registry.cities.get(self._city_id)
+            if city_zone is not None:
+                self._city_zone = city_zone
+        return self._city_zone
+
+    @property
+    def speed_limit(self):
+        """ int: current speed limit for the bike """
+        return self._speed_limit
+
+    @property
+    def simulating(self):
+        """ bool: True while a simulation is running, the simulation sends data to server itself """
+        return not self._simulation_event_off.is_set()
+
+    @property
+    def first_update(self):
+        """ asyncio.Event: set when the bike has sent its first data to server """
+        return self._first_update
+
+    @property
+    def client(self):
+        """ TelemetryClient: Returns the client used for requests to server. """
+        return self._client
+
     def _add_zones(self, city_zone_data: dict):
         """ Method to add zones to bike.
 
         Args:
             city_zone_data (dict): data needed for setting up zones
         """
-        city_zone = CityZone(city_zone_data)
-        backup_speed_limit = city_zone.speed_limit  # Used for zones without a speed limit
-
-        zones = []
-        for zone in city_zone_data.get('zones'):
-            zones.append(Zone(zone, backup_speed_limit))
-
-        city_zone.add_zones_list(zones)
-        self._city_zone = city_zone
+        self._city_zone = CityZone.from_data(city_zone_data)
 
     def update_zones(self):
-        """ Method to update zones from server. """
+        """ Method to update zones from server. Uses shared zones for the city if bike has a zone registry. """
+        if self._zone_registry is not None and self._city_id:
+            city_zone = self._zone_registry.get(self._city_id, self.id)
+            if city_zone is not None:
+                self._city_zone = city_zone
+            return
+
         route = f"/bikes/{self.id}/zones"
         req_url = self.API_URL + route
         headers = {'x-api-key': self.API_KEY}
@@ -98,6 +162,20 @@ class Bike:
             # Do nothing, just catch execept error
             print("Error", error)
 
+    async def update_zones_async(self):
+        """ Asynchronous method to update zones from server, used when many bikes are started at once. """
+        if self._zone_registry is not None and self._city_id:
+            city_zone = await self._zone_registry.get_async(self._city_id, self.id, self._client)
+            if city_zone is not None:
+                self._city_zone = city_zone
+            return
+
+        req_url = self.API_URL + f"/bikes/{self.id}/zones"
+        headers = {'x-api-key': self.API_KEY}
+        city_zone_data = await self._client.get_json(req_url, headers=headers)
+        if city_zone_data is not None:
+            self._add_zones(city_zone_data)
+
     def set_status(self, status: int):
         """ Set the status of the bike, set_status is used instead of a setter to access method from SSE-listener.
         Possible statuscodes:
@@ -141,9 +219,70 @@ class Bike:
     def _update_speed_limit(self):
         """ Updates the speedlimit for the bike. """
         # Only update speedlimit if there is a cityzone in bike.
-        if self._city_zone is not None:
+        city_zone = self.city_zone
+        if city_zone is not None:
             position = self._gps.position
-            self._speed_limit = self._city_zone.get_speed_limit(position)
+            self._speed_limit = city_zone.get_speed_limit(position)
+
+    def set_speed_limit(self, speed_limit: int):
+        """ Set the speed limit, used by the simulation with speed limits calculated for the route.
+
+        Args:
+            speed_limit (int): the new speed limit
+        """
+        self._speed_limit = speed_limit
+
+    def _get_speed_limit_timeline(self, simulation: dict):
+        """ Speed limits for every point of every trip in a route, calculated in one pass for all points.
+
+        The speed limits are saved with the route together with the zones used, and are calculated again
+        when the zones for the city are changed or refreshed.
+
+        Args:
+            simulation (dict): the route with trips
+
+        Returns:
+            list[np.ndarray] or None: speed limit for each point in each trip, None if the bike has no zones
+        """
+        current_zone = self.city_zone
+        if current_zone is None or not isinstance(simulation, dict):
+            return None
+
+        city_zone, revision, timeline = simulation.get('speed_limits', (None, None, None))
+        if city_zone is current_zone and revision == current_zone.revision:
+            return timeline
+
+        trips = [trip_degrees(trip.get('coords', [])) for trip in simulation.get('trips', [])]
+        if not trips:
+            return None
+        limits = current_zone.get_speed_limits(np.concatenate(trips))
+        timeline = np.split(limits, np.cumsum([len(coords) for coords in trips])[:-1])
+        simulation['speed_limits'] = (current_zone, current_zone.revision, timeline)
+        return timeline
+
+    def check_state(self, update_speed_limit: bool = True):
+        """ Check battery and speed limit, one step of the bikes internal loop.
+
+        Used by _run_bike() and by a FleetScheduler when it runs the bike.
+
+        Args:
+            update_speed_limit (bool): look up the speed limit for the position, default is True.
+                False when the speed limit is set for many bikes at once by a FleetZoneEvaluator.
+        """
+        # if self.is_unlocked():
+        # #   Whatever a bike should be able to do if a bike is unlocked can be done here.
+        # #   Making the accelerator work, a green light showing bike is unlocked etc.
+        # #   It's depnding on hardware of a bike and customers needs.
+
+        metrics = get_metrics()
+        start = metrics.start()
+        if self._battery.needs_charging():
+            # 4 is the status for maintenance required, changes to 5 in method if bike is unlocked
+            self.set_status(4)
+
+        if update_speed_limit:
+            self._update_speed_limit()
+        metrics.observe('check_state', start)
 
     def get_data(self):
         """ Get data to send to server
@@ -151,9 +290,10 @@ class Bike:
         Returns:
             dict: with data needed for the server
         """
+        city_zone = self.city_zone
         return {
             'id': self.id,
-            'city_id': '' if self._city_zone is None else self._city_zone.city_id,
+            'city_id': '' if city_zone is None else city_zone.city_id,
             'status_id': self._status,
             'charge_perc': round(self._battery.level, 2),
             'coords': self._gps.position,
@@ -167,27 +307,19 @@ class Bike:
         """
         # count controls each loop iteration. Will be set to same as interval for first loop
         count = self._interval
+        clock = get_clock()
         while self._running:
             # This is needed to hold loop if a simulation is running.
-            await self._simulation_event_off.wait()
+            await clock.wait(self._simulation_event_off.wait())
 
-            # if self.is_unlocked():
-            # #   Whatever a bike should be able to do if a bike is unlocked can be done here.
-            # #   Making the accelerator work, a green light showing bike is unlocked etc.
-            # #   It's depnding on hardware of a bike and customers needs.
-
-            if self._battery.needs_charging():
-                # 4 is the status for maintenance required, changes to 5 in method if bike is unlocked
-                self.set_status(4)
-
-            self._update_speed_limit()
+            self.check_state()
 
             # When count is same or bigger as interval, send data to server.
             if count >= self._interval:
                 await self.update_bike_data()
                 count = 0
 
-            await asyncio.sleep(loop_interval)
+            await clock.sleep(loop_interval)
             count += loop_interval
 
     async def run_simulation(self):
@@ -197,27 +329,75 @@ class Bike:
 
         self._simulation_event_off.clear()
 
-        simulator = BikeSimulator(self, self._simulation, self._fast_interval)
+        simulation = self._simulation
+        if simulation is None and self._routes is not None:
+            simulation = self._routes.get(self._id)
+
+        speed_limits = self._get_speed_limit_timeline(simulation) if self._speed_limit_timeline else None
+        simulator = BikeSimulator(self, simulation, self._fast_interval, speed_limits)
         await simulator.start_simulation()
 
         self._simulation_event_off.set()
 
     async def update_bike_data(self):
         """ Asynchronous method to send data to server. """
+        metrics = get_metrics()
+        start = metrics.start()
+        await self._send_bike_data()
+        metrics.observe('update_bike_data', start)
+
+    async def _send_bike_data(self):
+        """ Send data to server through the send policy and uplink, if the bike has them. """
+        data = self.get_data()
+        decision, payload = SEND, data
+        if self._send_policy is not None:
+            decision, payload = self._send_policy.decide(data, get_clock().time())
+            if decision == SKIP:
+                self._first_update.set()
+                return
+
+        if self._uplink is not None:
+            # Acknowledged when the uplink has sent the data, a failed batch is sent again next time
+            await self._uplink.submit(payload, functools.partial(self._uplink_sent, data, decision))
+            self._first_update.set()
+            return
+
         route = f"/bikes/{self.id}"
         req_url = self.API_URL + route
         headers = {'x-api-key': self.API_KEY}
-        data = self.get_data()
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.put(req_url, json=data, headers=headers, timeout=10) as response:
-                    if response.status >= 300:
-                        response_data = await response.json()
-                        print(f"Updating data, errorcode: {response.status}")
-                        print(response_data)
-            except asyncio.TimeoutError:
-                pass
+        try:
+            async with self._client.put(req_url, json=payload, headers=headers) as response:
+                if response.status >= 300:
+                    response_data = await response.json()
+                    print(f"Updating data, errorcode: {response.status}")
+                    print(response_data)
+                else:
+                    self._acknowledge(data, decision)
+        except asyncio.TimeoutError:
+            pass
+        self._first_update.set()
+
+    def _acknowledge(self, data: dict, decision: str):
+        """ Tell the send policy that the server got the data.
+
+        Args:
+            data (dict): data from get_data()
+            decision (str): what was sent, from the send policy
+        """
+        if self._send_policy is not None:
+            self._send_policy.acknowledge(data, decision, get_clock().time())
+
+    def _uplink_sent(self, data: dict, decision: str, sent: bool):
+        """ Called by the uplink when the data has been sent, acknowledged if the server got it.
+
+        Args:
+            data (dict): data from get_data()
+            decision (str): what was sent, from the send policy
+            sent (bool): True if the server got the data
+        """
+        if sent:
+            self._acknowledge(data, decision)
 
     def start(self, loop_interval: int = 1):
         """ Start the bikes program
@@ -6,9 +6,14 @@ Bikefactory module, used for creating each bike with injections
 import os
 import json
 import random
+from collections.abc import Mapping
 from src.bike import Bike
 from src.battery import BatterySimulator
 from src.gps import GpsSimulator
+from src.telemetryclient import TelemetryClient
+from src.uplink import BatchUplink
+from src.zoneregistry import ZoneRegistry
+from src.sendpolicy import DeltaSendPolicy
 
 
 class BikeFactory:
@@ -16,32 +21,68 @@ class BikeFactory:
 
     Args:
         bike_data (list): list with data used for initialization of the bikes
-        routes (dict): route-data used for simulation
+        routes (Mapping): route-data used for simulation, keyed by bike id
         interval (int=10): interval in seconds for simulation (in movement)
+        client (TelemetryClient=None): client shared by all bikes, default is the process-wide client
+        uplink (BatchUplink=None): uplink for sending data in batches, default is one request per bike
+        zone_registry (ZoneRegistry=None): registry for sharing zones between bikes in a city, a new is created if None
+        send_policy (DeltaSendPolicy=None): policy shared by all bikes for skipping unchanged data
+        distance_backend (str='geodesic'): how the gps in each bike calculates distance, 'geodesic' or 'planar'
+        speed_limit_timeline (bool=False): calculate speed limits for each route once instead of on each move
     """
 
     def __init__(
             self,
             bike_data: list,
-            routes: dict,
-            interval: int = 10
+            routes: Mapping,
+            interval: int = 10,
+            *,
+            client: TelemetryClient = None,
+            uplink: BatchUplink = None,
+            zone_registry: ZoneRegistry = None,
+            send_policy: DeltaSendPolicy = None,
+            distance_backend: str = 'geodesic',
+            speed_limit_timeline: bool = False
             ):
         """ Initialize the bike and inject gps, battery and data """
 
         self._bikes = {}
+        self._routes = routes
+        self._interval = interval
+        self._client = client
+        self._uplink = uplink
+        self._zone_registry = zone_registry if zone_registry is not None else ZoneRegistry()
+        self._send_policy = send_policy
+        self._distance_backend = distance_backend
+        self._speed_limit_timeline = speed_limit_timeline
 
-        good_routes = self._load_good_routes()
+        self._good_routes = self._load_good_routes()
 
         for data_item in bike_data:
-            bike_id = data_item.get('id')
-            status_id = data_item.get('status_id')
-            simulation = routes[bike_id] if bike_id in routes else None
-            battery_level, level_reduction = self._decide_battery_level(bike_id, good_routes, status_id)
-            gps_sim = GpsSimulator(data_item.get('coords'))
-            battery_sim = BatterySimulator(battery_level, level_reduction)
-            new_bike = Bike(data_item, battery_sim, gps_sim, simulation, interval)
+            new_bike = self.create_bike(data_item)
             new_bike.update_zones()
-            self._bikes[bike_id] = new_bike
+
+    def create_bike(self, data_item: dict):
+        """ Create one bike and add it to the factory, zones are not loaded for the bike.
+
+        Args:
+            data_item (dict): data used for initialization of the bike
+
+        Returns:
+            Bike: the created bike
+        """
+        bike_id = data_item.get('id')
+        status_id = data_item.get('status_id')
+        battery_level, level_reduction = self._decide_battery_level(bike_id, self._good_routes, status_id)
+        gps_sim = GpsSimulator(data_item.get('coords'), self._distance_backend)
+        battery_sim = BatterySimulator(battery_level, level_reduction)
+        new_bike = Bike(
+            data_item, battery_sim, gps_sim, interval=self._interval,
+            client=self._client, uplink=self._uplink, zone_registry=self._zone_registry, routes=self._routes,
+            send_policy=self._send_policy, speed_limit_timeline=self._speed_limit_timeline
+        )
+        self._bikes[bike_id] = new_bike
+        return new_bike
 
     def _load_good_routes(self):
         """ This loads the good routes bike id for simulation.
@@ -83,6 +124,11 @@ class BikeFactory:
 
         return battery_level, level_reduction
 
+    @property
+    def zone_registry(self):
+        """ ZoneRegistry: registry with zones shared by the bikes """
+        return self._zone_registry
+
     @property
     def bikes(self):
         """ dict[Bike]: dict of all created bikes in factory """
@@ -7,7 +7,9 @@ from __future__ import annotations
 import os
 import asyncio
 import random
-import aiohttp
+from src.routehandler import trip_positions
+from src.metrics import get_metrics
+from src.clock import get_clock
 
 
 class BikeSimulator:
@@ -18,23 +20,26 @@ class BikeSimulator:
         bike (Bike): the Bike to simulate.
         simulation (dict): simulation data needed for simulation.
         interval (int): interval in seconds for the bike to send data to server when moving.
+        speed_limits (list=None): speed limit for each point in each trip, set on the bike as it moves.
     """
     API_URL = os.environ.get('API_URL', '')
     API_KEY = os.environ.get('API_KEY', '')
 
-    def __init__(self, bike: 'Bike', simulation: dict, interval: int):  # noqa: F821
+    def __init__(self, bike: 'Bike', simulation: dict, interval: int, speed_limits: list = None):  # noqa: F821
         self._bike = bike
         self._simulation = simulation
         self._interval = interval
+        self._speed_limits = speed_limits
 
     async def start_simulation(self):
         """ Asynchronous method to start the simulation for a bike. """
         try:
-            for trip in self._simulation.get('trips', []):
+            for index, trip in enumerate(self._simulation.get('trips', [])):
                 response_ok, trip_id = await self._start_renting(trip)
                 if response_ok:
                     self._bike.set_status(2)  # This also is done through SSE, but isn't fast enough for simulation
-                    await self._simulate_trip(trip, trip_id)
+                    limits = None if self._speed_limits is None else self._speed_limits[index]
+                    await self._simulate_trip(trip, trip_id, limits)
         except AttributeError:
             pass
 
@@ -53,31 +58,42 @@ class BikeSimulator:
         user = trip.get('user', {})
         headers, data = self._prepare_request(user)
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(req_url, json=data, headers=headers, timeout=10) as response:
-                    if response.status < 300:
-                        response_data = await response.json()
-                        return 'errors' not in response_data, response_data.get('id')
-                    return False, None
-            except asyncio.TimeoutError:
+        try:
+            async with self._bike.client.post(req_url, json=data, headers=headers) as response:
+                if response.status < 300:
+                    response_data = await response.json()
+                    return 'errors' not in response_data, response_data.get('id')
                 return False, None
+        except asyncio.TimeoutError:
+            return False, None
 
-    async def _simulate_trip(self, trip: dict, trip_id: int):
+    async def _simulate_trip(self, trip: dict, trip_id: int, limits=None):
         """ Simulate the trip.
 
         Args:
             trip (dict): Data needed for trip, user-jwt and coords.
             trip_id (int): Trip ID.
+            limits (np.ndarray): speed limit for each point in the trip, default is None
         """
-        for position in trip.get('coords', []):
-            self._bike.gps.position = (position, self._interval)
+        metrics = get_metrics()
+        clock = get_clock()  # Speeds are for the interval, so they are the same with a virtual clock
+        speeds = self._trip_speeds(trip)
+        for i, position in enumerate(trip_positions(trip.get('coords', []))):
+            start = metrics.start()
+            if speeds is None or i == 0:
+                # Speed to the first point depends on where the bike is, so it is calculated by the gps
+                self._bike.gps.position = (position, self._interval)
+            else:
+                self._bike.gps.move(position, speeds[i])
+            if limits is not None:
+                self._bike.set_speed_limit(int(limits[i]))
 
             if self._bike.battery.needs_charging():
                 self._bike.set_status(5)  # 5 is the status for 'rented maintenance required'
+            metrics.observe('simulation_step', start)
 
             await self._bike.update_bike_data()
-            await asyncio.sleep(self._interval)
+            await clock.sleep(self._interval)
 
             # If a bike is locked by any reason, stop simulation and set speed to 0.
             # And make a last update to server with the newest data.
@@ -93,6 +109,21 @@ class BikeSimulator:
         await self._end_renting(trip, trip_id)
         await self._simulate_break()
 
+    def _trip_speeds(self, trip: dict):
+        """ Precomputed speeds for each point in a trip, for the interval used in simulation.
+
+        Args:
+            trip (dict): Data needed for trip, with lengths and speeds from RouteHandler.
+
+        Returns:
+            list[float] or None: speed in km/h for each point, None if the trip has no lengths
+        """
+        if 'lengths' not in trip:
+            return None
+        if trip.get('interval') == self._interval:
+            return trip['speeds'].tolist()
+        return (trip['lengths'] / self._interval * 3.6).tolist()
+
     async def _end_renting(self, trip: dict, trip_id: int):
         """ End renting the bike after a trip.
 
@@ -103,13 +134,12 @@ class BikeSimulator:
         req_url = self.API_URL + f"/user/bikes/return/{trip_id}"
         headers, user_data = self._prepare_request(trip.get('user', {}))
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.put(req_url, json=user_data, headers=headers, timeout=10) as response:
-                    if response.status >= 300:
-                        print(f"Errorcode: {response.status}")
-            except asyncio.TimeoutError:
-                pass
+        try:
+            async with self._bike.client.put(req_url, json=user_data, headers=headers) as response:
+                if response.status >= 300:
+                    print(f"Errorcode: {response.status}")
+        except asyncio.TimeoutError:
+            pass
 
     def _prepare_request(self, user: dict):
         """ Prepare headers and data for requests.
@@ -135,4 +165,4 @@ class BikeSimulator:
         lenght = random.randint(2, 3)
         for _ in range(0, lenght):
             await self._bike.update_bike_data()
-            await asyncio.sleep(break_time)
+            await get_clock().sleep(break_time)
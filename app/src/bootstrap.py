@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Bootstrap module, used for starting up the whole fleet of bikes
+"""
+import os
+import asyncio
+from src.bikefactory import BikeFactory
+from src.telemetryclient import TelemetryClient, get_client
+
+
+class FleetBootstrap:
+    """ Class for starting up all bikes concurrently.
+
+    Bike data and zones are fetched asynchronously with a limit on how many bikes are prepared
+    at the same time, and each bike is started as soon as its own zones are loaded. A bike that
+    can't be prepared, ex. when its zones can't be read, is printed, counted and not started,
+    the rest of the fleet is started anyway.
+
+    Args:
+        factory (BikeFactory): factory used to create the bikes
+        client (TelemetryClient=None): client used for requests to server, default is the shared client
+        concurrency (int=50): max number of bikes fetching zones at the same time
+        retries (int=3): number of retries for failed requests
+        backoff (float=0.5): seconds to wait before first retry, doubled for each retry
+    """
+    API_URL = os.environ.get('API_URL', '')
+    API_KEY = os.environ.get('API_KEY', '')
+
+    def __init__(self, factory: BikeFactory, client: TelemetryClient = None, concurrency: int = 50,
+                 retries: int = 3, backoff: float = 0.5):
+        self._factory = factory
+        self._client = client if client is not None else get_client()
+        self._concurrency = concurrency
+        self._retries = retries
+        self._backoff = backoff
+        self._metrics = {}
+        self._watchers = []  # Tasks waiting for the first data from each bike
+        self._waiting = 0
+        self._stats = {'started': 0, 'failed': 0}
+
+    @property
+    def metrics(self):
+        """ dict: startup metrics in seconds, counted from start of run() """
+        return self._metrics
+
+    def stats(self):
+        """ Number of started bikes and bikes that couldn't be prepared.
+
+        Returns:
+            dict: started and failed bikes
+        """
+        return dict(self._stats)
+
+    async def fetch_bike_data(self):
+        """ Fetch data for all bikes from server.
+
+        Returns:
+            list: data for each bike
+
+        Raises:
+            RuntimeError: if bike data couldn't be fetched
+        """
+        headers = {'x-api-key': self.API_KEY}
+        bike_data = await self._client.get_json(
+            f"{self.API_URL}/bikes", headers=headers, retries=self._retries, backoff=self._backoff
+        )
+        if bike_data is None:
+            raise RuntimeError("Couldn't fetch bikes from server")
+        return bike_data
+
+    async def run(self, start_bike, bike_data: list = None):
+        """ Create all bikes, load their zones and start them.
+
+        Args:
+            start_bike (callable): called with each bike when it is ready to be started
+            bike_data (list): data for the bikes, fetched from server if None
+
+        Returns:
+            dict[Bike]: all created bikes, keyed by bike id
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        if bike_data is None:
+            bike_data = await self.fetch_bike_data()
+        self._metrics['time_to_bike_data'] = loop.time() - start
+
+        semaphore = asyncio.Semaphore(self._concurrency)
+        self._waiting = len(bike_data)
+
+        async def prepare(data_item: dict):
+            try:
+                async with semaphore:
+                    bike = self._factory.create_bike(data_item)
+                    await bike.update_zones_async()
+            # One bike with bad data or zones shouldn't stop the startup for the whole fleet
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                print(f"Couldn't start bike {data_item.get('id')}: {error!r}")
+                self._factory.bikes.pop(data_item.get('id'), None)
+                self._stats['failed'] += 1
+                self._count_done(loop.time() - start)
+                return
+            start_bike(bike)
+            self._stats['started'] += 1
+            self._watchers.append(asyncio.create_task(self._wait_first_update(bike, start)))
+
+        await asyncio.gather(*(prepare(data_item) for data_item in bike_data))
+        self._metrics['time_to_all_started'] = loop.time() - start
+        return self._factory.bikes
+
+    async def _wait_first_update(self, bike, start: float):
+        """ Wait for a bike to send its first data and update the startup metrics.
+
+        Args:
+            bike (Bike): the started bike
+            start (float): loop time when startup began
+        """
+        await bike.first_update.wait()
+        elapsed = asyncio.get_running_loop().time() - start
+        self._metrics.setdefault('time_to_first_telemetry', elapsed)
+        self._count_done(elapsed)
+
+    def _count_done(self, elapsed: float):
+        """ Count a bike that has sent its first data or failed, the report is printed after the last.
+
+        Args:
+            elapsed (float): seconds since startup began
+        """
+        self._waiting -= 1
+        if self._waiting == 0:
+            self._metrics['time_to_full_fleet'] = elapsed
+            print(f"Startup: {self.startup_report()}")
+
+    def startup_report(self):
+        """ Readable summary of the startup metrics.
+
+        Returns:
+            str: times for each startup stage
+        """
+        report = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self._metrics.items())
+        if self._stats['failed']:
+            report += f", failed={self._stats['failed']}"
+        return report
@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+"""
+Clock module, the time used by bikes and simulations, real time or virtual time
+"""
+import time
+import heapq
+import asyncio
+import itertools
+
+
+class RealClock:
+    """ Class for the normal clock, sleeps in real time with asyncio. """
+    virtual = False
+
+    @staticmethod
+    def time():
+        """ Current time.
+
+        Returns:
+            float: seconds from time.monotonic()
+        """
+        return time.monotonic()
+
+    @staticmethod
+    async def sleep(seconds: float):
+        """ Sleep in real time.
+
+        Args:
+            seconds (float): time to sleep
+        """
+        await asyncio.sleep(seconds)
+
+    @staticmethod
+    async def wait(awaitable):
+        """ Wait for something that isn't the clock, ex. an event set by another bike.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+
+        Returns:
+            the result of the awaitable
+        """
+        return await awaitable
+
+    @staticmethod
+    async def wait_for(awaitable, timeout: float):
+        """ Wait for something that isn't the clock, at most timeout seconds.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+            timeout (float): max seconds to wait
+
+        Raises:
+            asyncio.TimeoutError: if timeout has passed first
+
+        Returns:
+            the result of the awaitable
+        """
+        return await asyncio.wait_for(awaitable, timeout)
+
+    @staticmethod
+    def create_task(coro):
+        """ Start a task that uses the clock.
+
+        Args:
+            coro (Coroutine): the coroutine to run
+
+        Returns:
+            asyncio.Task: the task
+        """
+        return asyncio.create_task(coro)
+
+    @staticmethod
+    def register(task: asyncio.Task = None):
+        """ Add a task to the tasks using the clock, does nothing since the time moves by itself.
+
+        Args:
+            task (asyncio.Task): the task, default is the running task
+
+        Returns:
+            asyncio.Task: the task
+        """
+        return task or asyncio.current_task()
+
+
+class ScaledClock:
+    """ Class for a clock that runs faster than real time, used to put more load on a real server.
+
+    All sleeps on the clock are divided by speedup and the time moves speedup seconds for each real
+    second. Intervals, breaks and loop sleeps are shortened, while speeds and battery drain stay the same
+    for each simulated second since they are calculated from the simulated time.
+
+    Args:
+        speedup (float): how many times faster than real time the clock runs
+
+    Raises:
+        ValueError: if speedup isn't positive
+    """
+    virtual = False
+
+    def __init__(self, speedup: float):
+        if speedup <= 0:
+            raise ValueError(f"Speedup must be positive: {speedup}")
+        self._speedup = speedup
+        self._start = time.monotonic()
+        self._stats = {'sleeps': 0, 'max_late': 0.0}
+
+    @property
+    def speedup(self):
+        """ float: how many times faster than real time the clock runs """
+        return self._speedup
+
+    def time(self):
+        """ Current simulated time.
+
+        Returns:
+            float: seconds, moves speedup seconds for each real second
+        """
+        return self._start + (time.monotonic() - self._start) * self._speedup
+
+    def stats(self):
+        """ Statistics for the clock, a growing max_late means the bikes can't keep up with the speedup.
+
+        Returns:
+            dict: speedup, number of sleeps and the latest a sleep has ended in simulated seconds
+        """
+        return {**self._stats, 'speedup': self._speedup}
+
+    async def sleep(self, seconds: float):
+        """ Sleep for seconds of simulated time, seconds divided by speedup in real time.
+
+        Args:
+            seconds (float): simulated time to sleep
+        """
+        wake_time = self.time() + seconds
+        await asyncio.sleep(seconds / self._speedup)
+        self._stats['sleeps'] += 1
+        self._stats['max_late'] = max(self._stats['max_late'], self.time() - wake_time)
+
+    @staticmethod
+    async def wait(awaitable):
+        """ Wait for something that isn't the clock, ex. an event set by another bike.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+
+        Returns:
+            the result of the awaitable
+        """
+        return await awaitable
+
+    async def wait_for(self, awaitable, timeout: float):
+        """ Wait for something that isn't the clock, at most timeout seconds of simulated time.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+            timeout (float): max simulated seconds to wait, divided by speedup in real time
+
+        Raises:
+            asyncio.TimeoutError: if timeout has passed first
+
+        Returns:
+            the result of the awaitable
+        """
+        return await asyncio.wait_for(awaitable, timeout / self._speedup)
+
+    @staticmethod
+    def create_task(coro):
+        """ Start a task that uses the clock.
+
+        Args:
+            coro (Coroutine): the coroutine to run
+
+        Returns:
+            asyncio.Task: the task
+        """
+        return asyncio.create_task(coro)
+
+    @staticmethod
+    def register(task: asyncio.Task = None):
+        """ Add a task to the tasks using the clock, does nothing since the time moves by itself.
+
+        Args:
+            task (asyncio.Task): the task, default is the running task
+
+        Returns:
+            asyncio.Task: the task
+        """
+        return task or asyncio.current_task()
+
+
+class VirtualClock:
+    """ Class for a discrete-event clock, time moves to the next sleep that ends as soon as all are waiting.
+
+    Each task that uses the clock is active until it sleeps on the clock or waits with wait().
+    Tasks join the first time they use the clock, or when started with create_task() or register().
+    When no task is active, the time is moved directly to the end of the earliest sleep and the
+    tasks sleeping until then are woken up. Requests to server made by an active task are finished
+    before the time moves, so a day of simulated trips runs as fast as the server can answer.
+
+    The loop is run a few times before the time is moved, so tasks woken up by an event from another
+    task become active first.
+
+    Args:
+        start (float=0.0): time in seconds when the clock starts
+        settle (int=3): number of loop iterations with no active task before the time is moved
+    """
+    virtual = True
+
+    def __init__(self, start: float = 0.0, settle: int = 3):
+        self._now = start
+        self._settle = settle
+        self._timers = []  # Heap with (time, sequence, future, task)
+        self._sequence = itertools.count()
+        self._active = set()
+        self._waiting = set()
+        self._advance_scheduled = False
+        self._stats = {'advances': 0, 'sleeps': 0}
+
+    def time(self):
+        """ Current virtual time.
+
+        Returns:
+            float: seconds since the start of the clock plus start
+        """
+        return self._now
+
+    def stats(self):
+        """ Statistics for the clock.
+
+        Returns:
+            dict: virtual time, number of times the time moved, sleeps and tasks using the clock
+        """
+        return {**self._stats, 'time': self._now, 'tasks': len(self._active) + len(self._waiting)}
+
+    async def sleep(self, seconds: float):
+        """ Sleep until the virtual time has moved seconds forward.
+
+        Args:
+            seconds (float): time to sleep
+        """
+        task = self._current_task()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self._now + max(seconds, 0), next(self._sequence), future, task))
+        self._stats['sleeps'] += 1
+        self._set_waiting(task)
+        try:
+            await future
+        finally:
+            self._set_active(task)
+
+    async def wait(self, awaitable):
+        """ Wait for something that isn't the clock, the time can move while waiting.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+
+        Returns:
+            the result of the awaitable
+        """
+        task = self._current_task()
+        self._set_waiting(task)
+        try:
+            return await awaitable
+        finally:
+            self._set_active(task)
+
+    async def wait_for(self, awaitable, timeout: float):
+        """ Wait for something that isn't the clock, at most until the virtual time has moved timeout forward.
+
+        Args:
+            awaitable (Awaitable): what to wait for
+            timeout (float): max virtual seconds to wait
+
+        Raises:
+            asyncio.TimeoutError: if timeout has passed first
+
+        Returns:
+            the result of the awaitable
+        """
+        task = self._current_task()
+        timer = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self._now + max(timeout, 0), next(self._sequence), timer, task))
+        waiter = asyncio.ensure_future(awaitable)
+        self._set_waiting(task)
+        try:
+            await asyncio.wait((waiter, timer), return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                raise asyncio.TimeoutError()
+            return waiter.result()
+        finally:
+            self._set_active(task)
+            timer.cancel()  # Removed from the timers when the time moves
+            if not waiter.done():
+                waiter.cancel()
+
+    def create_task(self, coro):
+        """ Start a task that uses the clock, it is active from the start.
+
+        Args:
+            coro (Coroutine): the coroutine to run
+
+        Returns:
+            asyncio.Task: the task
+        """
+        task = asyncio.create_task(coro)
+        return self.register(task)
+
+    def register(self, task: asyncio.Task = None):
+        """ Add a task to the tasks using the clock, the time doesn't move until it sleeps or waits.
+
+        Tasks are added the first time they sleep or wait, so a task that does something before
+        that, ex. sends a request, should be registered when it is started.
+
+        Args:
+            task (asyncio.Task): the task, default is the running task
+
+        Returns:
+            asyncio.Task: the task
+        """
+        task = task or asyncio.current_task()
+        if task not in self._active and task not in self._waiting:
+            self._active.add(task)
+            task.add_done_callback(self._task_done)
+        return task
+
+    def _current_task(self):
+        """ The running task, it is added to the tasks using the clock the first time.
+
+        Returns:
+            asyncio.Task: the task
+        """
+        return self.register()
+
+    def _set_active(self, task: asyncio.Task):
+        """ Mark a task as active, the time doesn't move until it sleeps or waits. """
+        self._waiting.discard(task)
+        self._active.add(task)
+
+    def _set_waiting(self, task: asyncio.Task):
+        """ Mark a task as sleeping or waiting, the time is moved if it was the last active task. """
+        self._active.discard(task)
+        self._waiting.add(task)
+        self._schedule_advance()
+
+    def _task_done(self, task: asyncio.Task):
+        """ Remove a finished task from the tasks using the clock. """
+        self._active.discard(task)
+        self._waiting.discard(task)
+        self._schedule_advance()
+
+    def _schedule_advance(self):
+        """ Try to move the time after the loop has run settle times, if no task is active. """
+        if not self._active and not self._advance_scheduled:
+            self._advance_scheduled = True
+            asyncio.get_running_loop().call_soon(self._try_advance, self._settle)
+
+    def _try_advance(self, settle: int):
+        """ Move the time if no task has become active.
+
+        Args:
+            settle (int): number of loop iterations left before the time is moved
+        """
+        if self._active:
+            self._advance_scheduled = False
+            return
+        if settle > 0:
+            asyncio.get_running_loop().call_soon(self._try_advance, settle - 1)
+            return
+        self._advance_scheduled = False
+        self._advance()
+
+    def _advance(self):
+        """ Move the time to the earliest sleep that ends and wake up all tasks sleeping until then. """
+        while self._timers and self._timers[0][2].done():
+            heapq.heappop(self._timers)  # Sleep was cancelled
+        if not self._timers:
+            return
+
+        self._now = max(self._now, self._timers[0][0])
+        self._stats['advances'] += 1
+        while self._timers and self._timers[0][0] <= self._now:
+            _, _, future, task = heapq.heappop(self._timers)
+            if not future.done():
+                self._set_active(task)
+                future.set_result(None)
+
+
+_CLOCK = RealClock()
+
+
+def get_clock():
+    """ Get the process-wide clock, a RealClock unless another clock is set.
+
+    Returns:
+        RealClock, ScaledClock or VirtualClock: the clock
+    """
+    return _CLOCK
+
+
+def set_clock(clock):
+    """ Replace the process-wide clock, must be done before bikes are started.
+
+    Args:
+        clock (RealClock, ScaledClock or VirtualClock): clock to use
+    """
+    global _CLOCK  # pylint: disable=global-statement
+    _CLOCK = clock
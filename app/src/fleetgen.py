@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""
+Fleet generator module, synthetic bikes and routes for fleets larger than the route files
+
+Bikes and trips are generated from the seed and the bike id, so any bike can be generated again
+without keeping the fleet in memory. The routes have the same shape as the route files and can be
+written to disk, or used directly by RouteHandler with source=FleetGenerator(...).
+
+Write a fleet to disk from the app-directory with:
+    python -m src.fleetgen --bikes 100000 --output generated
+"""
+import os
+import json
+import math
+import random
+import argparse
+from collections.abc import Mapping
+import numpy as np
+from src.geo import meters_per_degree, segment_lengths
+from src.zone import CityZone
+
+# Bounding box for the synthetic city, roughly 8 x 8 km
+CITY_BOUNDS = (13.44, 59.35, 13.58, 59.42)
+GENERATOR_MODES = ('walk', 'od')
+
+
+def _square(west: float, south: float, east: float, north: float):
+    """ Coordinates for a rectangle.
+
+    Returns:
+        list: closed ring of [longitude, latitude]
+    """
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+def synthetic_city(city_id: str = 'LOAD', zone_count: int = 20, seed: int = 1):
+    """ Create zone data for a synthetic city with random rectangular zones, used when there is no real data.
+
+    Args:
+        city_id (str): id of the city, default is LOAD
+        zone_count (int): number of zones in the city, default is 20
+        seed (int): seed for the random placement, default is 1
+
+    Returns:
+        dict: zone data for the city, as from GET /bikes/{id}/zones
+    """
+    generator = random.Random(seed)
+    west, south, east, north = CITY_BOUNDS
+    zones = []
+    for zone_id in range(1, zone_count + 1):
+        size = generator.uniform(0.001, 0.004)
+        longitude = generator.uniform(west, east - size * 2)
+        latitude = generator.uniform(south, north - size)
+        zones.append({
+            'zone_id': zone_id,
+            'geometry': {'coordinates': [_square(longitude, latitude, longitude + size * 2, latitude + size)]},
+            'speed_limit': generator.choice([0, 10, 15])
+        })
+    return {'city_id': city_id, 'geometry': {'coordinates': [_square(*CITY_BOUNDS)]}, 'speed_limit': 20,
+            'zones': zones}
+
+
+class FleetGenerator(Mapping):
+    """ Class that generates bikes and routes for a fleet of any size in one city.
+
+    Works as a read-only mapping with the route for each bike id, in the same shape as the route files,
+    and each route is generated when it is read. Bikes are placed where riding is allowed and each trip
+    starts where the last ended. Trips are random walks, or lines to a random destination with mode 'od'.
+    Trips stay in the city and out of zones with speed limit 0, a trip is cut before it would leave.
+
+    Args:
+        count (int): number of bikes, with ids from first_id
+        city (dict=None): zone data for the city, default is synthetic_city()
+        seed (int=1): seed for the fleet, the same seed gives the same fleet
+        mode (str='walk'): 'walk' for random walks or 'od' for lines between origin and destination
+        trips (tuple=(1, 3)): min and max number of trips for each bike
+        trip_length (tuple=(300, 2000)): min and max length of a trip in meters
+        users (int=1000): number of users, each trip gets a random user
+        first_id (int=1): id of the first bike
+
+    Raises:
+        ValueError: if mode is unknown
+    """
+    STEP = 50  # Meters between points in a trip, RouteHandler adds points for the interval used
+    CANDIDATES = 8  # Directions tried for each trip, the one that gets furthest is used
+
+    def __init__(self, count: int, city: dict = None, *, seed: int = 1, mode: str = 'walk',
+                 trips: tuple = (1, 3), trip_length: tuple = (300, 2000), users: int = 1000, first_id: int = 1):
+        if mode not in GENERATOR_MODES:
+            raise ValueError(f"Unknown generator mode: {mode}")
+        self._count = count
+        self._city = city if city is not None else synthetic_city()
+        self._city_zone = CityZone.from_data(self._city)
+        self._seed = seed
+        self._mode = mode
+        self._trips = trips
+        self._trip_length = trip_length
+        self._users = users
+        self._first_id = first_id
+
+        ring = np.asarray(self._city['geometry']['coordinates'][0], dtype=np.float64)
+        self._bounds = (*ring.min(axis=0), *ring.max(axis=0))
+
+    @property
+    def city_id(self):
+        """ str: id of the city the bikes are in """
+        return self._city_zone.city_id
+
+    @property
+    def city_zones(self):
+        """ dict: zone data for the city keyed by city id, as used by the stand-in server """
+        return {self.city_id: self._city}
+
+    def __getitem__(self, bike_id):
+        """ Generate the route for a bike. """
+        if bike_id not in self:
+            raise KeyError(bike_id)
+        bike_rng = self._rng(bike_id)
+        initial_start = position = self._position(bike_rng)
+        trips = []
+        for _ in range(bike_rng.integers(self._trips[0], self._trips[1] + 1)):
+            trip = self._trip(bike_rng, position)
+            if trip is not None:
+                trips.append(trip)
+                position = trip['coords'][-1]
+        return {'city': self.city_id, 'initialStart': initial_start, 'trips': trips}
+
+    def __contains__(self, bike_id):
+        return isinstance(bike_id, int) and self._first_id <= bike_id < self._first_id + self._count
+
+    def __iter__(self):
+        return iter(range(self._first_id, self._first_id + self._count))
+
+    def __len__(self):
+        return self._count
+
+    def bike(self, bike_id: int):
+        """ Data for a bike, where its route starts.
+
+        Args:
+            bike_id (int): id of the bike
+
+        Returns:
+            dict: data for the bike, as from GET /bikes
+        """
+        return {'id': bike_id, 'city_id': self.city_id, 'status_id': 1, 'coords': self._position(self._rng(bike_id))}
+
+    def bikes(self, shard: int = 0, shards: int = 1):
+        """ Data for all bikes, or only the bikes in one shard, generated one at a time.
+
+        Bikes are split between shards by id as in src.shard, only ids with bike_id % shards == shard
+        are generated, so a shard never goes through the bikes of other shards.
+
+        Args:
+            shard (int): index of the shard, default is 0
+            shards (int): number of shards, default is 1 for all bikes
+
+        Yields:
+            dict: data for each bike, as from GET /bikes
+        """
+        first_id = self._first_id + (shard - self._first_id) % shards
+        for bike_id in range(first_id, self._first_id + self._count, shards):
+            yield self.bike(bike_id)
+
+    def write(self, directory: str, progress=None):
+        """ Write the fleet to disk one bike at a time, routes as one file per bike like the routes-directory.
+
+        Writes directory/routes/{bike_id}.json, directory/bikes.json with data for all bikes and
+        directory/zones.json with zone data keyed by city id.
+
+        Args:
+            directory (str): directory to write to, created if needed
+            progress (callable): called with the number of written bikes after each bike, default is None
+        """
+        routes_dir = os.path.join(directory, 'routes')
+        os.makedirs(routes_dir, exist_ok=True)
+        with open(os.path.join(directory, 'zones.json'), 'w', encoding='UTF-8') as file:
+            json.dump(self.city_zones, file)
+
+        with open(os.path.join(directory, 'bikes.json'), 'w', encoding='UTF-8') as bikes_file:
+            bikes_file.write('[')
+            for written, bike_id in enumerate(self, start=1):
+                with open(os.path.join(routes_dir, f"{bike_id}.json"), 'w', encoding='UTF-8') as file:
+                    json.dump(self[bike_id], file)
+                bikes_file.write(('' if written == 1 else ',\n') + json.dumps(self.bike(bike_id)))
+                if progress is not None:
+                    progress(written)
+            bikes_file.write(']\n')
+
+    def _rng(self, bike_id: int):
+        """ Random generator for a bike, the same for each call.
+
+        Args:
+            bike_id (int): id of the bike
+
+        Returns:
+            np.random.Generator: the generator
+        """
+        return np.random.default_rng([self._seed, bike_id])
+
+    def _allowed(self, coords: np.ndarray):
+        """ Check where riding is allowed, in the city and not in a zone with speed limit 0.
+
+        Args:
+            coords (np.ndarray): points with shape (..., 2)
+
+        Returns:
+            np.ndarray: bool for each point with the shape of coords without the last axis
+        """
+        return (self._city_zone.get_speed_limits(coords.reshape(-1, 2)) > 0).reshape(coords.shape[:-1])
+
+    def _position(self, rng: np.random.Generator):
+        """ Random position where riding is allowed.
+
+        Args:
+            rng (np.random.Generator): random generator for the bike
+
+        Returns:
+            list[float]: position as [longitude, latitude]
+        """
+        west, south, east, north = self._bounds
+        candidates = np.column_stack((rng.uniform(west, east, self.CANDIDATES),
+                                      rng.uniform(south, north, self.CANDIDATES)))
+        allowed = np.flatnonzero(self._allowed(candidates))
+        position = candidates[allowed[0]] if len(allowed) > 0 else candidates[0]
+        return np.round(position, 6).tolist()
+
+    def _trip(self, rng: np.random.Generator, start: list):
+        """ Generate one trip from a position.
+
+        Args:
+            rng (np.random.Generator): random generator for the bike
+            start (list[float]): where the trip starts
+
+        Returns:
+            dict or None: the trip with summary, user and coords, None if no direction is allowed
+        """
+        steps = max(1, math.ceil(rng.uniform(*self._trip_length) / self.STEP))
+        headings = rng.uniform(0, 2 * math.pi, (self.CANDIDATES, 1))
+        if self._mode == 'walk':
+            headings = headings + np.cumsum(rng.normal(0, 0.4, (self.CANDIDATES, steps)), axis=1)
+        else:
+            headings = np.repeat(headings, steps, axis=1)
+
+        lng_scale, lat_scale = meters_per_degree(start[1])
+        moves = np.stack((np.sin(headings) / lng_scale, np.cos(headings) / lat_scale), axis=-1) * self.STEP
+        candidates = np.asarray(start) + np.cumsum(moves, axis=1)
+
+        # Number of allowed points from the start for each direction, the longest is used
+        allowed = self._allowed(candidates)
+        reached = np.where(allowed.all(axis=1), steps, allowed.argmin(axis=1))
+        best = int(reached.argmax())
+        if reached[best] == 0:
+            return None
+
+        coords = np.vstack(([start], np.round(candidates[best, :reached[best]], 6)))
+        distance = float(segment_lengths(coords).sum())
+        return {
+            'summary': {'distance': round(distance, 1), 'duration': round(distance / rng.uniform(3.5, 5.5), 1)},
+            'user': {'id': int(rng.integers(1, self._users + 1)), 'token': ''},
+            'coords': coords.tolist()
+        }
+
+
+def main(argv: list = None):
+    """ Write a generated fleet to disk from command line.
+
+    Args:
+        argv (list): arguments, default is sys.argv
+    """
+    parser = argparse.ArgumentParser(description="Generate bikes and routes for a synthetic fleet.")
+    parser.add_argument('--bikes', type=int, required=True, help="number of bikes")
+    parser.add_argument('--output', required=True, help="directory for routes/, bikes.json and zones.json")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the fleet, default is 1")
+    parser.add_argument('--mode', choices=GENERATOR_MODES, default='walk',
+                        help="random walks or lines between origin and destination")
+    parser.add_argument('--trips', type=int, nargs=2, default=(1, 3), metavar=('MIN', 'MAX'),
+                        help="min and max number of trips for each bike")
+    parser.add_argument('--trip-length', type=float, nargs=2, default=(300, 2000), metavar=('MIN', 'MAX'),
+                        help="min and max length of a trip in meters")
+    args = parser.parse_args(argv)
+
+    generator = FleetGenerator(args.bikes, seed=args.seed, mode=args.mode, trips=tuple(args.trips),
+                               trip_length=tuple(args.trip_length))
+    report_every = max(1, args.bikes // 10)
+
+    def progress(written):
+        if written % report_every == 0:
+            print(f"Written {written} of {args.bikes} bikes", flush=True)
+
+    generator.write(args.output, progress)
+
+
+if __name__ == '__main__':
+    main()
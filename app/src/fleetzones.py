@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Fleet zones module, used for evaluating speed limits for many bikes at once
+"""
+import numpy as np
+from src.zone import CityZone
+
+
+class FleetZoneEvaluator:
+    """ Class that updates the speed limit for many bikes with one vectorized lookup per city.
+
+    The bikes are grouped by their CityZone, and the positions of all bikes in a city are checked
+    against the city and its zones as one array with CityZone.get_speed_limits(). Gives the same
+    speed limits as Bike.check_state() does bike by bike.
+    """
+
+    def __init__(self):
+        self._stats = {'evaluations': 0, 'bikes': 0, 'cities': 0}
+
+    def stats(self):
+        """ Statistics for the evaluator.
+
+        Returns:
+            dict: number of evaluations, bikes and city lookups
+        """
+        return dict(self._stats)
+
+    @staticmethod
+    def speed_limits(city_zone: CityZone, positions):
+        """ Speed limits for the positions of many bikes in one city.
+
+        Args:
+            city_zone (CityZone): the city with zones
+            positions (list or np.ndarray): positions as [longitude, latitude] with shape (n, 2)
+
+        Returns:
+            np.ndarray: speed limit for each position
+        """
+        return city_zone.get_speed_limits(np.asarray(positions, dtype=np.float64))
+
+    def update(self, bikes):
+        """ Update the speed limit for bikes, bikes without zones keep their speed limit.
+
+        Args:
+            bikes (iterable[Bike]): bikes to update
+
+        Returns:
+            int: number of updated bikes
+        """
+        cities = {}
+        for bike in bikes:
+            if bike.city_zone is not None:
+                cities.setdefault(bike.city_zone, []).append(bike)
+
+        updated = 0
+        for city_zone, city_bikes in cities.items():
+            limits = self.speed_limits(city_zone, [bike.gps.position for bike in city_bikes])
+            for bike, limit in zip(city_bikes, limits.tolist()):
+                bike.set_speed_limit(limit)
+            updated += len(city_bikes)
+
+        self._stats['evaluations'] += 1
+        self._stats['bikes'] += updated
+        self._stats['cities'] += len(cities)
+        return updated
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Geo module, fast distance calculations used instead of geodesic distance for short distances
+"""
+import math
+from functools import lru_cache
+import numpy as np
+
+# WGS84 ellipsoid, same as used by geopy
+WGS84_A = 6378137.0  # Semi-major axis in meters
+WGS84_E2 = 6.69437999014e-3  # First eccentricity squared
+SCALE_RESOLUTION = 1000  # Scale factors for planar_distance are cached for each 0.001 degree latitude
+
+
+def meters_per_degree(latitude):
+    """ Length in meters of one degree longitude and latitude at a latitude, on the WGS84 ellipsoid.
+
+    Args:
+        latitude (float or np.ndarray): latitude in degrees
+
+    Returns:
+        tuple:
+            - float or np.ndarray: meters per degree longitude
+            - float or np.ndarray: meters per degree latitude
+    """
+    lat_rad = np.radians(latitude)
+    sin_lat = np.sin(lat_rad)
+    ellipse_term = 1 - WGS84_E2 * sin_lat * sin_lat
+    meridian_radius = WGS84_A * (1 - WGS84_E2) / (ellipse_term * np.sqrt(ellipse_term))
+    normal_radius = WGS84_A / np.sqrt(ellipse_term)
+    return np.radians(normal_radius * np.cos(lat_rad)), np.radians(meridian_radius)
+
+
+def segment_lengths(coords: np.ndarray):
+    """ Length in meters between each pair of consecutive points.
+
+    Uses a local projection on the WGS84 ellipsoid, scaled at the mean latitude of each segment.
+    Compared to geodesic distance (geopy) between latitude -70 and 70 the relative error is below
+    1e-8 for segments under 1 km (0.01 mm) and below 1e-6 for segments under 10 km (1 cm).
+
+    Args:
+        coords (np.ndarray): points with shape (n, 2) as [longitude, latitude]
+
+    Returns:
+        np.ndarray: n - 1 lengths in meters
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    start = coords[:-1]
+    delta = coords[1:] - start
+    lng_scale, lat_scale = meters_per_degree(start[:, 1] + delta[:, 1] / 2)
+    return np.hypot(delta[:, 0] * lng_scale, delta[:, 1] * lat_scale)
+
+
+@lru_cache(maxsize=4096)
+def _cached_scales(latitude_key: int):
+    """ Meters per degree for a latitude, cached.
+
+    Args:
+        latitude_key (int): latitude in degrees multiplied by SCALE_RESOLUTION and rounded
+
+    Returns:
+        tuple:
+            - float: meters per degree longitude
+            - float: meters per degree latitude
+    """
+    lat_rad = math.radians(latitude_key / SCALE_RESOLUTION)
+    sin_lat = math.sin(lat_rad)
+    ellipse_term = 1 - WGS84_E2 * sin_lat * sin_lat
+    meridian_radius = WGS84_A * (1 - WGS84_E2) / (ellipse_term * math.sqrt(ellipse_term))
+    normal_radius = WGS84_A / math.sqrt(ellipse_term)
+    return math.radians(normal_radius * math.cos(lat_rad)), math.radians(meridian_radius)
+
+
+def planar_distance(start: list, end: list):
+    """ Distance in meters between two points, fast version of geodesic distance for short distances.
+
+    Uses the same local projection as segment_lengths, with scale factors cached for each 0.001 degree
+    latitude. Compared to geodesic distance (geopy) between latitude -70 and 70 the relative error is
+    below 3e-5 for distances under 100 m, which is less than 3 mm. Most of the error comes from the
+    cached latitude, at latitude 60 it is below 1.6e-5.
+
+    Args:
+        start (list[float]): first point as [longitude, latitude]
+        end (list[float]): second point as [longitude, latitude]
+
+    Returns:
+        float: distance in meters
+    """
+    lng_scale, lat_scale = _cached_scales(round((start[1] + end[1]) * SCALE_RESOLUTION / 2))
+    return math.hypot((end[0] - start[0]) * lng_scale, (end[1] - start[1]) * lat_scale)
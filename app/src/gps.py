@@ -4,6 +4,27 @@ GPS-module
 """
 from abc import ABC, abstractmethod
 from geopy.distance import lonlat, distance
+from src.geo import planar_distance
+
+
+def geodesic_distance(start: list, end: list):
+    """ Geodesic distance in meters between two points, with geopy.
+
+    Args:
+        start (list[float]): first point as [longitude, latitude]
+        end (list[float]): second point as [longitude, latitude]
+
+    Returns:
+        float: distance in meters
+    """
+    return distance(lonlat(*start), lonlat(*end)).meters
+
+
+# Functions for distance between two points, used by GpsSimulator to calculate speed
+DISTANCE_BACKENDS = {
+    'geodesic': geodesic_distance,
+    'planar': planar_distance
+}
 
 
 class GpsBase(ABC):
@@ -29,11 +50,19 @@ class GpsSimulator(GpsBase):
 
     Args:
         position (list[float]): the position in [longitude, latitude]
+        distance_backend (str='geodesic'): how distance is calculated, 'geodesic' or 'planar'.
+            'planar' is much faster and good for the short distances between updates, see geo.planar_distance.
+
+    Raises:
+        ValueError: if distance_backend is unknown
     """
 
-    def __init__(self, position: list):
+    def __init__(self, position: list, distance_backend: str = 'geodesic'):
+        if distance_backend not in DISTANCE_BACKENDS:
+            raise ValueError(f"Unknown distance backend: {distance_backend}")
         self._position = position
         self._speed = 0
+        self._distance = DISTANCE_BACKENDS[distance_backend]
 
     @property
     def position(self):
@@ -49,13 +78,23 @@ class GpsSimulator(GpsBase):
         """
         last_pos = self._position
         new_pos = new_data[0]
-        distance_from_last_update = distance(lonlat(*last_pos), lonlat(*new_pos)).meters
+        distance_from_last_update = self._distance(last_pos, new_pos)
         meter_pr_second = distance_from_last_update / new_data[1]
         km_pr_hour = meter_pr_second * 3.6
 
         self._speed = km_pr_hour
         self._position = new_data[0]
 
+    def move(self, position: list, speed: float):
+        """ Move to a new position with a known speed, no distance is calculated.
+
+        Args:
+            position (list[float]): the new position in [longitude, latitude]
+            speed (float): speed in km/h
+        """
+        self._position = position
+        self._speed = speed
+
     @property
     def speed(self):
         """ int: speed for the bike in km/h """
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+"""
+Metrics module, latency histograms, error counters and gauges for the stages in the bike loop
+"""
+import os
+import json
+import time
+import asyncio
+from bisect import bisect_left
+from aiohttp import web
+
+# Upper bounds in seconds for the histogram buckets, the last bucket is +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Finer buckets, 10 for each factor 10 from 0.1 ms to 10 s, used when percentiles are reported
+FINE_BUCKETS = tuple(round(10 ** (exponent / 10), 7) for exponent in range(-40, 11))
+PREFIX = 'bike_brain'
+
+
+class Histogram:
+    """ Class for a latency histogram with fixed buckets.
+
+    Args:
+        buckets (tuple=DEFAULT_BUCKETS): upper bounds of the buckets in seconds, sorted
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, seconds: float):
+        """ Add a measured time.
+
+        Args:
+            seconds (float): the time
+        """
+        self._counts[bisect_left(self._buckets, seconds)] += 1
+        self._count += 1
+        self._sum += seconds
+
+    def quantile(self, fraction: float):
+        """ Estimate a quantile, interpolated linearly inside the bucket like Prometheus does.
+
+        Args:
+            fraction (float): the quantile, ex. 0.99
+
+        Returns:
+            float: the estimated time, the largest bound if it is in the +Inf bucket, 0 if empty
+        """
+        if self._count == 0:
+            return 0.0
+        rank = fraction * self._count
+        total = 0
+        lower = 0.0
+        for bound, count in zip(self._buckets, self._counts):
+            if count > 0 and total + count >= rank:
+                return lower + (bound - lower) * (rank - total) / count
+            total += count
+            lower = bound
+        return float(self._buckets[-1])
+
+    def snapshot(self):
+        """ Current values of the histogram.
+
+        Returns:
+            dict: count, sum and cumulative count for each bucket keyed by upper bound
+        """
+        buckets = {}
+        total = 0
+        for bound, count in zip([*self._buckets, '+Inf'], self._counts):
+            total += count
+            buckets[str(bound)] = total
+        return {'count': self._count, 'sum': self._sum, 'buckets': buckets}
+
+
+class Metrics:
+    """ Class that collects metrics for the stages in the bike loop.
+
+    Latency for each stage is measured with start() and observe(), errors are counted by
+    status code and gauges are either set or read from a function when exported. Exported as
+    Prometheus text or as a dict that can be dumped as JSON.
+
+    Args:
+        buckets (tuple=DEFAULT_BUCKETS): upper bounds of the histogram buckets in seconds
+    """
+    enabled = True
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._stages = {}
+        self._counters = {}  # Keyed by (name, label, value)
+        self._gauges = {}
+        self._gauge_functions = {}
+
+    @staticmethod
+    def start():
+        """ Start measuring a stage.
+
+        Returns:
+            float: the start time, passed to observe()
+        """
+        return time.perf_counter()
+
+    def observe(self, stage: str, start: float):
+        """ Save the time since start for a stage.
+
+        Args:
+            stage (str): name of the stage
+            start (float): time from start()
+        """
+        self.record(stage, time.perf_counter() - start)
+
+    def histogram(self, stage: str):
+        """ Histogram for a stage.
+
+        Args:
+            stage (str): name of the stage
+
+        Returns:
+            Histogram or None: the histogram, None if nothing is measured for the stage
+        """
+        return self._stages.get(stage)
+
+    def record(self, stage: str, seconds: float):
+        """ Save a time for a stage.
+
+        Args:
+            stage (str): name of the stage
+            seconds (float): the time
+        """
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            histogram = self._stages[stage] = Histogram(self._buckets)
+        histogram.observe(seconds)
+
+    def timed(self, stage: str, func):
+        """ Wrap a function so each call is measured as a stage.
+
+        Args:
+            stage (str): name of the stage
+            func (callable): the function
+
+        Returns:
+            callable: the wrapped function
+        """
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def count(self, name: str, label: str = '', value: str = ''):
+        """ Increase a counter, ex. errors by status code.
+
+        Args:
+            name (str): name of the counter
+            label (str): name of the label, default is no label
+            value (str): value of the label
+        """
+        counter_key = (name, label, str(value))
+        self._counters[counter_key] = self._counters.get(counter_key, 0) + 1
+
+    def set_gauge(self, name: str, value: float):
+        """ Set the value of a gauge.
+
+        Args:
+            name (str): name of the gauge
+            value (float): the value
+        """
+        self._gauges[name] = value
+
+    def gauge_function(self, name: str, func):
+        """ Add a gauge that is read from a function when exported, costs nothing between exports.
+
+        Args:
+            name (str): name of the gauge
+            func (callable): returns the current value
+        """
+        self._gauge_functions[name] = func
+
+    def snapshot(self):
+        """ Current values of all metrics.
+
+        Returns:
+            dict: histograms keyed by stage, counters and gauges
+        """
+        counters = {}
+        for (name, label, value), count in self._counters.items():
+            counters[f"{name}{{{label}=\"{value}\"}}" if label else name] = count
+        gauges = {**self._gauges, **{name: func() for name, func in self._gauge_functions.items()}}
+        return {
+            'stages': {stage: histogram.snapshot() for stage, histogram in self._stages.items()},
+            'counters': counters,
+            'gauges': gauges
+        }
+
+    def prometheus(self):
+        """ All metrics in the Prometheus text format.
+
+        Returns:
+            str: the metrics
+        """
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        for stage, histogram in snapshot['stages'].items():
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+        for name in sorted({name for name, _, _ in self._counters}):
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for (counter, label, value), count in self._counters.items():
+                if counter == name:
+                    labels = f'{{{label}="{value}"}}' if label else ''
+                    lines.append(f"{PREFIX}_{name}{labels} {count}")
+
+        for name, value in snapshot['gauges'].items():
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics:
+    """ Class with the same methods as Metrics that does nothing, used when metrics are disabled. """
+    enabled = False
+
+    @staticmethod
+    def start():
+        """ Returns 0, no time is read. """
+        return 0.0
+
+    def observe(self, stage: str, start: float):
+        """ Does nothing. """
+
+    def record(self, stage: str, seconds: float):
+        """ Does nothing. """
+
+    @staticmethod
+    def timed(_stage: str, func):
+        """ Returns the function as it is. """
+        return func
+
+    def count(self, name: str, label: str = '', value: str = ''):
+        """ Does nothing. """
+
+    def set_gauge(self, name: str, value: float):
+        """ Does nothing. """
+
+    def gauge_function(self, name: str, func):
+        """ Does nothing. """
+
+    @staticmethod
+    def snapshot():
+        """ Returns an empty snapshot. """
+        return {'stages': {}, 'counters': {}, 'gauges': {}}
+
+    @staticmethod
+    def prometheus():
+        """ Returns an empty text. """
+        return ''
+
+
+_METRICS = NullMetrics()
+
+
+def get_metrics():
+    """ Get the process-wide metrics, a NullMetrics until metrics are enabled.
+
+    Returns:
+        Metrics or NullMetrics: the metrics
+    """
+    return _METRICS
+
+
+def set_metrics(metrics):
+    """ Replace the process-wide metrics.
+
+    Args:
+        metrics (Metrics or NullMetrics): metrics to use
+    """
+    global _METRICS  # pylint: disable=global-statement
+    _METRICS = metrics
+
+
+def enable_metrics():
+    """ Start collecting metrics, must be called before the shared client makes its first request.
+
+    Returns:
+        Metrics: the process-wide metrics
+    """
+    if not _METRICS.enabled:
+        set_metrics(Metrics())
+    return _METRICS
+
+
+async def monitor_loop_lag(metrics: Metrics, interval: float = 0.5):
+    """ Measure how late the event loop wakes up from a sleep, as a gauge and as the stage loop_lag.
+
+    Args:
+        metrics (Metrics): where the lag is saved
+        interval (float): seconds between measurements, default is 0.5
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag = max(0.0, loop.time() - start - interval)
+        metrics.set_gauge('event_loop_lag_seconds', loop_lag)
+        metrics.record('loop_lag', loop_lag)
+
+
+async def dump_metrics(metrics: Metrics, path: str, interval: float = 10):
+    """ Write all metrics as JSON to a file, replaced each interval.
+
+    Args:
+        metrics (Metrics): the metrics to write
+        path (str): path to the file
+        interval (float): seconds between writes, default is 10
+    """
+    while True:
+        await asyncio.sleep(interval)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='UTF-8') as file:
+            json.dump({'time': time.time(), **metrics.snapshot()}, file)
+        os.replace(tmp_path, path)
+
+
+async def serve_metrics(metrics: Metrics, port: int, host: str = '127.0.0.1'):
+    """ Start a server with the metrics as Prometheus text on /metrics and as JSON on /metrics.json.
+
+    Args:
+        metrics (Metrics): the metrics to serve
+        port (int): port for the server
+        host (str): host for the server, default is 127.0.0.1
+
+    Returns:
+        web.AppRunner: the runner, cleaned up to stop the server
+    """
+    async def prometheus_text(_request):
+        return web.Response(text=metrics.prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def json_dump(_request):
+        return web.json_response(metrics.snapshot())
+
+    application = web.Application()
+    application.router.add_get('/metrics', prometheus_text)
+    application.router.add_get('/metrics.json', json_dump)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
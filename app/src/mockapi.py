@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Mock API module, a local stand-in for the server used when testing without the real API
+"""
+import os
+import json
+import asyncio
+import argparse
+from aiohttp import web
+from src.fleetgen import FleetGenerator, synthetic_city
+
+BIKES = web.AppKey('bikes', dict)
+STATS = web.AppKey('stats', dict)
+RENTALS = web.AppKey('rentals', dict)
+LISTENERS = web.AppKey('listeners', set)
+
+
+def synthetic_fleet(count: int, city_id: str = 'LOAD', zone_count: int = 20, seed: int = 1):
+    """ Create bikes spread over one synthetic city with zones, used when there is no real data.
+
+    The bikes are the same as from a FleetGenerator with the same seed, so a generated fleet can run
+    against the stand-in server.
+
+    Args:
+        count (int): number of bikes, with ids from 1
+        city_id (str): id of the city, default is LOAD
+        zone_count (int): number of zones in the city, default is 20
+        seed (int): seed for the random placement, default is 1
+
+    Returns:
+        tuple:
+            - list: data for each bike, as from GET /bikes
+            - dict: zone data for the city keyed by city id, as from GET /bikes/{id}/zones
+    """
+    generator = FleetGenerator(count, synthetic_city(city_id, zone_count, seed), seed=seed)
+    return list(generator.bikes()), generator.city_zones
+
+
+def load_fleet(directory: str):
+    """ Read a fleet written by FleetGenerator.write().
+
+    Args:
+        directory (str): directory with bikes.json and zones.json
+
+    Returns:
+        tuple:
+            - list: data for each bike, as from GET /bikes
+            - dict: zone data keyed by city id, as from GET /bikes/{id}/zones
+    """
+    with open(os.path.join(directory, 'bikes.json'), 'r', encoding='UTF-8') as file:
+        fleet = json.load(file)
+    with open(os.path.join(directory, 'zones.json'), 'r', encoding='UTF-8') as file:
+        city_zones = json.load(file)
+    return fleet, city_zones
+
+
+def broadcast(application: web.Application, data: dict):
+    """ Send an event to all clients listening on /bikes/instructions.
+
+    Args:
+        application (web.Application): the stand-in server
+        data (dict): the event, ex. {'bike_id': 1, 'instruction': 'set_status', 'args': [2]}
+    """
+    application[STATS]['events'] += 1
+    message = f"data: {json.dumps(data)}\n\n".encode()
+    for queue in application[LISTENERS]:
+        queue.put_nowait(message)
+
+
+def create_app(bulk: bool = True, fleet: list = None, city_zones: dict = None, *, latency: float = 0):
+    """ Create the stand-in server.
+
+    Received data is saved in app[BIKES] (latest data for each bike) and counted in app[STATS].
+    Rented bikes are saved in app[RENTALS] keyed by trip id. Renting and returning a bike sends
+    set_status to the bike on /bikes/instructions, like the real server. Changing the zones of a city
+    with PUT /zones/{city_id} sends refresh_zones with the city id.
+
+    Args:
+        bulk (bool): if the bulk endpoint PUT /bikes should be available, default is True
+        fleet (list): data for bikes returned by GET /bikes, default is no bikes
+        city_zones (dict): zone data for each city id, returned by GET /bikes/{id}/zones, default is no cities
+        latency (float): seconds added to each update, rent and return, to act like a slower server
+
+    Returns:
+        web.Application: the application to run
+    """
+    fleet = fleet or []
+    city_zones = city_zones or {}
+    application = web.Application()
+    application[BIKES] = {data.get('id'): data for data in fleet}
+    application[STATS] = {'bulk_requests': 0, 'single_requests': 0, 'updates': 0, 'zone_requests': 0,
+                          'rentals': 0, 'returns': 0, 'events': 0}
+    application[RENTALS] = {}
+    application[LISTENERS] = set()
+
+    async def delay():
+        """ Wait for the added latency. """
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+    async def get_bikes(_request):
+        """ Endpoint for getting all bikes. """
+        return web.json_response(fleet)
+
+    async def put_bikes(request):
+        """ Bulk endpoint, takes a list with data for many bikes. """
+        if not bulk:
+            return web.json_response({'errors': 'Not found'}, status=404)
+
+        batch = await request.json()
+        await delay()
+        for data in batch:
+            application[BIKES][data.get('id')] = data
+        application[STATS]['bulk_requests'] += 1
+        application[STATS]['updates'] += len(batch)
+        return web.json_response({'updated': len(batch)})
+
+    async def put_bike(request):
+        """ Endpoint for updating one bike. """
+        data = await request.json()
+        await delay()
+        application[BIKES][int(request.match_info['bike_id'])] = data
+        application[STATS]['single_requests'] += 1
+        application[STATS]['updates'] += 1
+        return web.json_response(data)
+
+    application.router.add_get('/bikes', get_bikes)
+    application.router.add_put('/bikes', put_bikes)
+    application.router.add_put('/bikes/{bike_id}', put_bike)
+    _add_zone_routes(application, city_zones)
+    _add_trip_routes(application, delay)
+    _add_event_routes(application)
+    return application
+
+
+def _add_zone_routes(application: web.Application, city_zones: dict):
+    """ Add the endpoints for getting and changing the zones of a city.
+
+    Args:
+        application (web.Application): the stand-in server
+        city_zones (dict): zone data for each city id
+    """
+    async def get_zones(request):
+        """ Endpoint for getting zones for the city a bike is in. """
+        application[STATS]['zone_requests'] += 1
+        bike = application[BIKES].get(int(request.match_info['bike_id']), {})
+        city_zone_data = city_zones.get(bike.get('city_id'))
+        if city_zone_data is None:
+            return web.json_response({'errors': 'Not found'}, status=404)
+        return web.json_response(city_zone_data)
+
+    async def put_zones(request):
+        """ Endpoint for changing the zones of a city, bikes are told to fetch them again. """
+        city_id = request.match_info['city_id']
+        city_zones[city_id] = await request.json()
+        broadcast(application, {'refresh_zones': city_id})
+        return web.json_response(city_zones[city_id])
+
+    application.router.add_get('/bikes/{bike_id}/zones', get_zones)
+    application.router.add_put('/zones/{city_id}', put_zones)
+
+
+def _add_trip_routes(application: web.Application, delay):
+    """ Add the endpoints for renting and returning bikes.
+
+    Args:
+        application (web.Application): the stand-in server
+        delay (callable): coroutine function waiting for the added latency
+    """
+    async def rent_bike(request):
+        """ Endpoint for renting a bike, returns the trip id. """
+        bike_id = int(request.match_info['bike_id'])
+        await delay()
+        if bike_id in application[RENTALS].values():
+            return web.json_response({'errors': 'Bike is already rented'})
+
+        application[STATS]['rentals'] += 1
+        trip_id = application[STATS]['rentals']
+        application[RENTALS][trip_id] = bike_id
+        broadcast(application, {'bike_id': bike_id, 'instruction': 'set_status', 'args': [2]})
+        return web.json_response({'id': trip_id})
+
+    async def return_bike(request):
+        """ Endpoint for returning a rented bike. """
+        bike_id = application[RENTALS].pop(int(request.match_info['trip_id']), None)
+        await delay()
+        if bike_id is None:
+            return web.json_response({'errors': 'Not found'}, status=404)
+
+        application[STATS]['returns'] += 1
+        broadcast(application, {'bike_id': bike_id, 'instruction': 'set_status', 'args': [1]})
+        return web.json_response({'id': int(request.match_info['trip_id'])})
+
+    application.router.add_post('/user/bikes/rent/{bike_id}', rent_bike)
+    application.router.add_put('/user/bikes/return/{trip_id}', return_bike)
+
+
+def _add_event_routes(application: web.Application):
+    """ Add the endpoint for events to bikes and the endpoint with counters.
+
+    Args:
+        application (web.Application): the stand-in server
+    """
+    async def instructions(request):
+        """ Server-sent events with instructions for bikes, sent with broadcast(). """
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        queue = asyncio.Queue()
+        application[LISTENERS].add(queue)
+        try:
+            while True:
+                await response.write(await queue.get())
+        finally:
+            application[LISTENERS].discard(queue)
+
+    async def get_stats(_request):
+        """ Endpoint with the counters, used by the load generator. """
+        return web.json_response({**application[STATS], 'listeners': len(application[LISTENERS])})
+
+    application.router.add_get('/bikes/instructions', instructions)
+    application.router.add_get('/stats', get_stats)
+
+
+def main():
+    """ Run the stand-in server from command line. """
+    parser = argparse.ArgumentParser(description="Local stand-in for the bike API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--no-bulk', action='store_true', help="run without the bulk endpoint")
+    parser.add_argument('--bikes', type=int, default=0, help="number of synthetic bikes returned by GET /bikes")
+    parser.add_argument('--latency', type=float, default=0, help="seconds added to each update, rent and return")
+    parser.add_argument('--fleet-dir', default=None,
+                        help="serve bikes.json and zones.json written by src.fleetgen instead of --bikes")
+    args = parser.parse_args()
+
+    if args.fleet_dir is not None:
+        fleet, city_zones = load_fleet(args.fleet_dir)
+    else:
+        fleet, city_zones = synthetic_fleet(args.bikes)
+    application = create_app(bulk=not args.no_bulk, fleet=fleet, city_zones=city_zones, latency=args.latency)
+    web.run_app(application, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Performance module, optional fast event loop and fast JSON used in the hot path
+"""
+import json
+import asyncio
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None
+
+
+class JsonCodec:
+    """ Class with the functions used for JSON in the hot path, telemetry encoding and SSE decoding.
+
+    Uses orjson if fast is True and orjson is installed, otherwise the json module.
+
+    Args:
+        fast (bool=False): use orjson if it is installed
+    """
+
+    def __init__(self, fast: bool = False):
+        self._fast = fast and orjson is not None
+        if self._fast:
+            self.dumps = self._orjson_dumps
+            self.loads = orjson.loads
+        else:
+            self.dumps = json.dumps
+            self.loads = json.loads
+
+    @property
+    def fast(self):
+        """ bool: True if orjson is used """
+        return self._fast
+
+    @staticmethod
+    def _orjson_dumps(obj):
+        """ Encode to a str with orjson, aiohttp needs a str.
+
+        Args:
+            obj (mixed): data to encode
+
+        Returns:
+            str: the JSON
+        """
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+_CODEC = JsonCodec()
+
+
+def get_codec():
+    """ Get the process-wide codec, uses the json module until the fast path is enabled.
+
+    Returns:
+        JsonCodec: the codec
+    """
+    return _CODEC
+
+
+def set_codec(codec: JsonCodec):
+    """ Replace the process-wide codec.
+
+    Args:
+        codec (JsonCodec): codec to use
+    """
+    global _CODEC  # pylint: disable=global-statement
+    _CODEC = codec
+
+
+def enable_fast_path():
+    """ Use uvloop for new event loops and orjson for JSON, for the libraries that are installed.
+
+    Must be called before the event loop is started, and before the first request is made.
+
+    Returns:
+        dict[bool]: which libraries are used, keyed by name
+    """
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    set_codec(JsonCodec(fast=True))
+    return {'uvloop': uvloop is not None, 'orjson': get_codec().fast}
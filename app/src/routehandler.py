@@ -4,28 +4,197 @@ Route-handler module
 """
 import os
 import json
-import math
-from geopy.distance import lonlat, distance
+import hashlib
+import tempfile
+from collections import OrderedDict
+from collections.abc import Collection, Mapping
+import numpy as np
+from src.geo import segment_lengths
+
+COORD_SCALE = 1_000_000  # Compact coordinates are stored as integer microdegrees
+
+
+def trip_degrees(coords):
+    """ Points of a trip as an array in degrees, compact coordinates are scaled back to degrees.
+
+    Args:
+        coords (list or np.ndarray): points for the trip with shape (n, 2)
+
+    Returns:
+        np.ndarray: points as [longitude, latitude] with shape (n, 2)
+    """
+    coords = np.asarray(coords)
+    if np.issubdtype(coords.dtype, np.integer):
+        return coords / COORD_SCALE
+    return coords.reshape(-1, 2)
+
+
+def trip_positions(coords):
+    """ Iterate the points of a trip as [longitude, latitude] in degrees.
+
+    Works for lists, float arrays and compact integer arrays, compact coordinates are scaled back to degrees.
+
+    Args:
+        coords (list or np.ndarray): points for the trip with shape (n, 2)
+
+    Yields:
+        list[float]: position as [longitude, latitude]
+    """
+    for longitude, latitude in trip_degrees(coords):
+        yield [float(longitude), float(latitude)]
+
+
+class LazyRoutes(Mapping):
+    """ Read-only mapping with routes keyed by bike id, where each route is loaded the first time it is used.
+
+    Only the most recently used routes are kept in memory, older are loaded again when needed.
+
+    Args:
+        paths (Mapping): path to the route file for each bike id, or anything else load_route is called with
+        load_route (callable): called with the value in paths for a bike, returns the processed route
+        max_resident (int=100): max number of routes kept in memory
+    """
+
+    def __init__(self, paths: Mapping, load_route, max_resident: int = 100):
+        self._paths = paths
+        self._load_route = load_route
+        self._max_resident = max_resident
+        self._resident = OrderedDict()
+        self._loads = 0
+        self._hits = 0
+
+    def __getitem__(self, bike_id):
+        """ Route for a bike, loaded from file if not in memory. """
+        if bike_id in self._resident:
+            self._resident.move_to_end(bike_id)
+            self._hits += 1
+            return self._resident[bike_id]
+
+        route = self._load_route(self._paths[bike_id])  # Raises KeyError for bikes without route
+        self._loads += 1
+        self._resident[bike_id] = route
+        if len(self._resident) > self._max_resident:
+            self._resident.popitem(last=False)
+        return route
+
+    def __contains__(self, bike_id):
+        """ Check if a bike has a route without loading it. """
+        return bike_id in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def stats(self):
+        """ Number of loaded routes and hits for routes already in memory.
+
+        Returns:
+            dict: resident, max_resident, loads and hits
+        """
+        return {
+            'resident': len(self._resident),
+            'max_resident': self._max_resident,
+            'loads': self._loads,
+            'hits': self._hits
+        }
 
 
 class RouteHandler():
     """ A class for handling routes used for simulation
 
+    The coordinates for all trips are stored in one numpy array, and each trip's 'coords' is a view into it
+    with shape (n, 2). The array is float64 in degrees, or int32 in microdegrees (COORD_SCALE) in compact
+    mode, which halves the memory use but rounds the points to about 0.1 m. Use trip_positions() to read
+    the points in degrees.
+
+    Each trip also gets 'lengths' and 'speeds', with one value for each point. lengths[i] is the distance in
+    meters from point i - 1 to point i and speeds[i] the speed in km/h for moving it in one interval, both
+    are 0 for the first point. 'interval' is the interval the speeds are calculated for.
+
+    If a cache directory is given the processed routes are saved there and loaded from
+    the cache on the next start, as long as the interval and the route files are unchanged.
+
+    In lazy mode only the route files are listed on start, and routes is a LazyRoutes that loads and
+    processes a route the first time it is used. The cache is not used in lazy mode.
+
+    With a source, ex. a FleetGenerator, the routes are read from the source instead of the route files,
+    always lazily, so a generated fleet is never held in memory at once.
+
+    With bike_ids only the routes for those bikes are kept, ex. the bikes of one shard. The cache is
+    read but not written then, since it holds the routes for all bikes and is shared by the shards.
+
     Args:
         directory (str): the directory to load the routes from. Should contain .json-files.
-        interval (int): the number of seconds each interval will be, decides max-length for coords-distance
+        interval (int=10): the number of seconds each interval will be, decides max-length for coords-distance
+        cache_dir (str=None): directory for the compiled routes, None means no cache is used
+        lazy (bool=False): load each route when it is first used instead of all on start
+        max_resident (int=100): max number of routes kept in memory in lazy mode
+        compact (bool=False): store coordinates as int32 microdegrees instead of float64 degrees
+        source (Mapping=None): unprocessed routes keyed by bike id, used instead of the route files in directory
+        bike_ids (Collection=None): ids of the bikes to keep routes for, None keeps all routes
     """
-    def __init__(self, directory: str, interval: int = 10):
+    CACHE_VERSION = 2  # Change when the cache format changes
+
+    def __init__(self, directory: str, interval: int = 10, cache_dir: str = None, *, lazy: bool = False,
+                 max_resident: int = 100, compact: bool = False, source: Mapping = None,
+                 bike_ids: Collection = None):
         """ Constructor """
         self._interval = interval
-        self._routes = self._load_routes(directory)
-        self._routes = self._check_distance()
+        self._compact = compact
+        self._directory = directory
+        self._cache_dir = cache_dir
+        self._bike_ids = bike_ids
+        self._from_cache = False
+
+        if source is not None:
+            self._routes = LazyRoutes(source, self._prepare_route, max_resident)
+        elif lazy:
+            self._routes = LazyRoutes(self._index_routes(directory), self._load_route, max_resident)
+        else:
+            self._load_all_routes()
 
     @property
     def routes(self):
-        """ dict[mixed]: mixed data for simulation routes with points and customer etc. """
+        """ dict[mixed] or LazyRoutes: mixed data for simulation routes with points and customer etc. """
         return self._routes
 
+    @property
+    def from_cache(self):
+        """ bool: True if the routes was loaded from the cache """
+        return self._from_cache
+
+    def _load_all_routes(self):
+        """ Load all routes on start, from the cache if possible. """
+        routes = self._load_cache() if self._cache_dir is not None else None
+        if routes is not None:
+            self._routes = routes
+            self._from_cache = True
+        else:
+            self._routes = self._load_routes(self._directory)
+            self._routes = self._check_distance()
+            self._coords, self._segments = self._pack_trips(self._routes.values())
+            if self._cache_dir is not None and self._bike_ids is None:
+                self._save_cache()
+
+    def _index_routes(self, directory: str):
+        """ Find the route file for each bike in the directory, only for bike_ids if set.
+
+        Args:
+            directory (str): the directory to load the routes from. Should contain .json-files.
+
+        Returns:
+            dict[str]: path to the route file for each bike id
+        """
+        paths = {}
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                bike_id = int(filename[:-5])  # Remove .json
+                if self._bike_ids is None or bike_id in self._bike_ids:
+                    paths[bike_id] = os.path.join(directory, filename)
+        return paths
+
     def _load_routes(self, directory: str):
         """ Method to load routes from the directory. Can be used to add extra controls.
 
@@ -36,63 +205,251 @@ class RouteHandler():
             dict[mixed]: data to use for simulations.
         """
         routes = {}
-        for filename in os.listdir(directory):
-            if filename.endswith('.json'):
-                bike_id = int(filename[:-5])  # Remove .json
-                filepath = os.path.join(directory, filename)
-                with open(filepath, 'r', encoding="UTF-8") as file:
-                    routes[bike_id] = json.load(file)  # Save into dict with filename as key (id)
+        for bike_id, filepath in self._index_routes(directory).items():
+            with open(filepath, 'r', encoding="UTF-8") as file:
+                routes[bike_id] = json.load(file)  # Save into dict with filename as key (id)
         return routes
 
+    def _load_route(self, filepath: str):
+        """ Load and process the route for one bike, used in lazy mode.
+
+        Args:
+            filepath (str): path to the route file
+
+        Returns:
+            dict[mixed]: data to use for simulation
+        """
+        with open(filepath, 'r', encoding="UTF-8") as file:
+            route = json.load(file)
+        return self._prepare_route(route)
+
+    def _prepare_route(self, route: dict):
+        """ Process one route and pack its trips, used for routes loaded lazily.
+
+        Args:
+            route (dict): the unprocessed route, updated in place
+
+        Returns:
+            dict[mixed]: data to use for simulation
+        """
+        self._process_route(route)
+        self._pack_trips([route])
+        return route
+
     def _check_distance(self):
         """ Main method to check and adjust the distance between coordinates in routes. """
+        new_routes = self._routes.copy()
+        for route in new_routes.values():
+            self._process_route(route)
+
+        return new_routes
+
+    def _process_route(self, route: dict):
+        """ Adjust the distance between coordinates in all trips for a route, and add lengths and speeds.
+
+        Args:
+            route (dict): route for one bike, the trips are updated in place
+        """
         max_speed_m_in_seconds = 5.5  # just under 20 km/h (19.8)
         max_length = max_speed_m_in_seconds * self._interval
 
-        new_routes = self._routes.copy()
-        for bike_id in new_routes.keys():
-            for i, trip in enumerate(new_routes[bike_id]['trips']):
-                new_routes[bike_id]['trips'][i]['coords'] = self._process_trip_coordinates(trip['coords'], max_length)
+        for trip in route['trips']:
+            trip['coords'] = self._process_trip_coordinates(trip['coords'], max_length)
+            lengths = np.zeros(len(trip['coords']))
+            if len(trip['coords']) > 1:
+                lengths[1:] = segment_lengths(trip['coords'])
+            trip['lengths'] = lengths
+            trip['speeds'] = lengths / self._interval * 3.6
+            trip['interval'] = self._interval
 
-        return new_routes
+    def _pack_trips(self, routes):
+        """ Move coordinates, lengths and speeds for all trips into contiguous arrays, trips get views into them.
+
+        Args:
+            routes (iterable): the routes with trips to pack
+
+        Returns:
+            tuple:
+                - np.ndarray: coordinates for all trips with shape (n, 2), int32 microdegrees in compact mode
+                - np.ndarray: lengths and speeds for all trips with shape (n, 2)
+        """
+        trips = [trip for route in routes for trip in route['trips']]
+        if not trips:
+            return np.empty((0, 2), dtype=np.int32 if self._compact else np.float64), np.empty((0, 2))
+
+        coords = np.concatenate([trip['coords'] for trip in trips])
+        if self._compact:
+            coords = np.round(coords * COORD_SCALE).astype(np.int32)
+        segments = np.column_stack((
+            np.concatenate([trip['lengths'] for trip in trips]),
+            np.concatenate([trip['speeds'] for trip in trips])
+        ))
+
+        start = 0
+        for trip in trips:
+            stop = start + len(trip['coords'])
+            self._set_views(trip, coords, segments, start, stop)
+            start = stop
+        return coords, segments
+
+    @staticmethod
+    def _set_views(trip: dict, coords: np.ndarray, segments: np.ndarray, start: int, stop: int):
+        """ Set coordinates, lengths and speeds for a trip as views into the arrays for all trips.
+
+        Args:
+            trip (dict): the trip, updated in place
+            coords (np.ndarray): coordinates for all trips
+            segments (np.ndarray): lengths and speeds for all trips
+            start (int): index of the first point in the trip
+            stop (int): index after the last point in the trip
+        """
+        trip['coords'] = coords[start:stop]
+        trip['lengths'] = segments[start:stop, 0]
+        trip['speeds'] = segments[start:stop, 1]
+
+    def _cache_key(self):
+        """ Key for the cache, changes if the interval, compact mode, cache version or any route file changes.
+
+        Size and modification time is used for each file, so no file needs to be read to find the cache.
+
+        Returns:
+            str: hash to use in the filenames for the cache
+        """
+        hasher = hashlib.sha1()
+        hasher.update(f"{self.CACHE_VERSION}:{self._interval}:{self._compact}".encode())
+        for filename in sorted(os.listdir(self._directory)):
+            if filename.endswith('.json'):
+                stat = os.stat(os.path.join(self._directory, filename))
+                hasher.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return hasher.hexdigest()
+
+    def _cache_paths(self, key: str):
+        """ Paths to the cache files.
+
+        Args:
+            key (str): the cache key
+
+        Returns:
+            tuple:
+                - str: path to json-file with trip data without coordinates
+                - str: path to npy-file with coordinates for all trips
+                - str: path to npy-file with lengths and speeds for all trips
+        """
+        base = os.path.join(self._cache_dir, f"routes-{key}")
+        return f"{base}.json", f"{base}.npy", f"{base}-segments.npy"
+
+    def _load_cache(self):
+        """ Load routes from the cache, the coordinates are memory-mapped. Only bike_ids are kept if set.
+
+        Returns:
+            dict[mixed] or None: the routes, None if there is no cache for current routes and interval
+        """
+        paths = self._cache_paths(self._cache_key())
+        if not all(os.path.isfile(path) for path in paths):
+            return None
+
+        meta_path, coords_path, segments_path = paths
+        with open(meta_path, 'r', encoding="UTF-8") as file:
+            meta = json.load(file)
+        self._coords = np.load(coords_path, mmap_mode='r')
+        self._segments = np.load(segments_path, mmap_mode='r')
+
+        routes = {}
+        for bike_id, route in meta.items():
+            if self._bike_ids is not None and int(bike_id) not in self._bike_ids:
+                continue
+            for trip in route['trips']:
+                start, stop = trip['coords']
+                self._set_views(trip, self._coords, self._segments, start, stop)
+            routes[int(bike_id)] = route
+        return routes
+
+    def _save_cache(self):
+        """ Save the routes to the cache and remove old cache files. """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        paths = self._cache_paths(self._cache_key())
+        meta_path, coords_path, segments_path = paths
+
+        # Coordinates, lengths and speeds are saved as start and end index in the arrays for all trips
+        meta = {}
+        start = 0
+        for bike_id, route in self._routes.items():
+            trips = []
+            for trip in route['trips']:
+                stop = start + len(trip['coords'])
+                data = {name: value for name, value in trip.items() if name not in ('lengths', 'speeds')}
+                trips.append({**data, 'coords': [start, stop]})
+                start = stop
+            meta[bike_id] = {**route, 'trips': trips}
+
+        # Write to temporary files first, so a stopped program never leaves a broken cache. The names are
+        # unique, so processes saving the same cache at once don't write to each other's files.
+        writers = (
+            lambda file: np.save(file, self._coords),
+            lambda file: np.save(file, self._segments),
+            lambda file: file.write(json.dumps(meta).encode('UTF-8'))
+        )
+        temp_paths = []
+        try:
+            for write in writers:
+                handle, temp_path = tempfile.mkstemp(dir=self._cache_dir, prefix='.routes-', suffix='.tmp')
+                temp_paths.append(temp_path)
+                with os.fdopen(handle, 'wb') as file:
+                    write(file)
+            for temp_path, path in zip(temp_paths, (coords_path, segments_path, meta_path)):
+                os.replace(temp_path, path)
+        finally:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        for filename in os.listdir(self._cache_dir):
+            path = os.path.join(self._cache_dir, filename)
+            if filename.startswith('routes-') and path not in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Removed by another process at the same time
 
     def _process_trip_coordinates(self, coordinates: list, max_length: float):
         """ Processes a single trip's coordinates.
 
+        All segment lengths and all extra points are calculated at once with numpy.
+
         Args:
             coordinates (list): the list of coordinates to process
             max_length (float): max length between two points (coords)
+
+        Returns:
+            np.ndarray: coordinates with shape (n, 2), extra points added where points are too far apart
         """
-        updated_cords = []
-        for j, coords in enumerate(coordinates):
-            try:
-                updated_cords.append(coords)
-                next_point = coordinates[j+1]
-                coords_distance = distance(lonlat(*coords), lonlat(*next_point)).meters
-
-                if coords_distance / max_length > 1:
-                    updated_cords.extend(self._add_extra_points(coords, next_point, coords_distance, max_length))
-            except IndexError:
-                pass  # Last point in array
-        return updated_cords
-
-    def _add_extra_points(self, start_point: list, end_point: list, coords_distance: float, max_length: float):
-        """ Adds extra points between two coordinates if the distance is too long.
+        coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if len(coords) < 2:
+            return coords
+
+        # Number of parts to split each segment into, 1 means no extra points
+        splits = np.ceil(segment_lengths(coords) / max_length).astype(np.int64)
+        splits = np.maximum(splits, 1)
+
+        return self._add_extra_points(coords, splits)
+
+    def _add_extra_points(self, coords: np.ndarray, splits: np.ndarray):
+        """ Adds extra points between coordinates where the distance is too long.
 
         Args:
-            start_point (list): coordinates for the first point
-            end_point (list): coordinates for the second point
-            coords_distance (float): distance between points in meters
-            max_length (float): max length between two points (coords)
+            coords (np.ndarray): points for the trip with shape (n, 2)
+            splits (np.ndarray): number of parts to split each of the n - 1 segments into
+
+        Returns:
+            np.ndarray: all points, original and extra, in order
         """
-        extra_points = []
-        split_by = math.ceil(coords_distance / max_length)
-        lng_distance = (end_point[0] - start_point[0]) / split_by
-        lat_distance = (end_point[1] - start_point[1]) / split_by
+        # Each segment gives its start point and splits - 1 extra points, the last point is added after
+        segment = np.repeat(np.arange(len(splits)), splits)
+        step = np.arange(len(segment)) - np.repeat(np.cumsum(splits) - splits, splits)
+        part = (coords[1:] - coords[:-1]) / splits[:, np.newaxis]  # Distance in degrees between extra points
 
-        for multiply_by in range(1, split_by):
-            new_lng = round(start_point[0] + lng_distance * multiply_by, 6)
-            new_lat = round(start_point[1] + lat_distance * multiply_by, 6)
-            extra_points.append([new_lng, new_lat])
+        points = coords[segment] + part[segment] * step[:, np.newaxis]
+        extra = step > 0
+        points[extra] = np.round(points[extra], 6)  # Original points are kept as they are
 
-        return extra_points
+        return np.vstack((points, coords[-1:]))
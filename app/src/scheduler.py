@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Scheduler module, used for running all bikes from one loop instead of one loop per bike
+"""
+import math
+import asyncio
+import random
+from src.fleetzones import FleetZoneEvaluator
+from src.clock import get_clock
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+class FleetScheduler:  # pylint: disable=too-many-instance-attributes
+    """ Class that runs all bikes from one timing wheel.
+
+    The wheel has one slot for each tick, and each bike is placed in the slot for the tick when it should
+    send its data next. Each tick the bikes in the current slot get their state checked with
+    Bike.check_state() and their data is sent. Then they are placed in the slot one interval ahead,
+    bikes due more than one round ahead stay in their slot until that round.
+
+    Bikes get different phases when added, so sends are spread over the interval and the server sees
+    a flat request rate instead of a burst every interval. The phases follow the golden ratio sequence,
+    which spreads bikes evenly for any number of bikes, starting from a random offset.
+
+    Bikes running a simulation are skipped, the simulation sends their data.
+
+    With a zone evaluator the speed limits are looked up together for all bikes due in a window of ticks,
+    one vectorized lookup per city instead of one per bike, and each tick uses the limits from its window.
+    A few bikes in a tick are too few for a vectorized lookup to pay off, a window gives larger batches.
+    Bikes scheduled into a window after it was looked up, ex. new bikes, get their limit bike by bike.
+
+    Args:
+        tick (float=0.1): seconds between ticks, the smallest difference between two send times
+        wheel_size (int=512): number of slots in the wheel
+        seed (int=None): seed for the random start of the phases
+        zone_evaluator (FleetZoneEvaluator=None): if set, used for the speed limits of the bikes
+        zone_window (float=1.0): seconds of ticks whose bikes get their speed limits looked up together
+    """
+
+    def __init__(self, tick: float = 0.1, wheel_size: int = 512, seed: int = None, *,
+                 zone_evaluator: FleetZoneEvaluator = None, zone_window: float = 1.0):
+        self._tick_length = tick
+        self._zone_evaluator = zone_evaluator
+        self._wheel = [[] for _ in range(wheel_size)]
+        self._zone_window = min(self._ticks_for(zone_window), wheel_size)
+        self._zone_tick = 0  # First tick after the window with looked up speed limits
+        self._zone_bikes = set()  # Ids of the bikes with speed limits looked up for the window
+        self._tick = 0
+        self._due = {}  # Tick when each bike should run next, keyed by bike id. Removed bikes are missing.
+        self._phase = random.Random(seed).random()
+        self._sending = set()  # Tasks sending data, kept so they aren't garbage collected
+        self._running = False
+
+        self._stats = {
+            'ticks': 0,
+            'late_ticks': 0,
+            'sent': 0,
+            'skipped_simulating': 0
+        }
+
+    @property
+    def bikes(self):
+        """ int: number of bikes in the scheduler """
+        return len(self._due)
+
+    def stats(self):
+        """ Statistics for the scheduler.
+
+        Returns:
+            dict: counters for ticks, late ticks, sent and skipped bikes
+        """
+        return {**self._stats, 'bikes': self.bikes, 'in_flight': len(self._sending)}
+
+    def _ticks_for(self, seconds: float):
+        """ Number of ticks for a time, at least one.
+
+        Args:
+            seconds (float): time in seconds
+
+        Returns:
+            int: number of ticks
+        """
+        return max(1, round(seconds / self._tick_length))
+
+    def _schedule(self, bike, due_tick: int):
+        """ Place a bike in the wheel.
+
+        Args:
+            bike (Bike): the bike
+            due_tick (int): tick when the bike should run
+        """
+        self._due[bike.id] = due_tick
+        self._wheel[due_tick % len(self._wheel)].append((due_tick, bike))
+
+    def add(self, bike):
+        """ Add a bike to the scheduler, it will run first time within one interval.
+
+        Args:
+            bike (Bike): the bike to run
+        """
+        self._phase = (self._phase + GOLDEN_RATIO) % 1
+        offset = int(self._phase * self._ticks_for(bike.interval))
+        self._schedule(bike, self._tick + 1 + offset)
+
+    def remove(self, bike):
+        """ Remove a bike from the scheduler, it is removed from the wheel when its slot is reached.
+
+        Args:
+            bike (Bike): the bike to remove
+        """
+        self._due.pop(bike.id, None)
+
+    def advance(self):
+        """ Move to next tick and run all bikes that are due. """
+        self._tick += 1
+        self._stats['ticks'] += 1
+        index = self._tick % len(self._wheel)
+
+        ready = []
+        waiting = []
+        for due_tick, bike in self._wheel[index]:
+            if self._due.get(bike.id) != due_tick:
+                continue  # Bike is removed or added again
+            if due_tick > self._tick:
+                waiting.append((due_tick, bike))
+            else:
+                ready.append(bike)
+        self._wheel[index] = waiting
+
+        if self._zone_evaluator is not None and self._tick >= self._zone_tick:
+            self._update_zone_window(ready)
+        for bike in ready:
+            self._run_bike(bike)
+
+    def _update_zone_window(self, ready: list):
+        """ Look up the speed limits for all bikes due in the window starting at this tick.
+
+        Args:
+            ready (list[Bike]): bikes due in this tick, already taken from the wheel
+        """
+        bikes = [bike for bike in ready if not bike.simulating]
+        for due_tick in range(self._tick + 1, self._tick + self._zone_window):
+            for slot_tick, bike in self._wheel[due_tick % len(self._wheel)]:
+                if slot_tick == due_tick and self._due.get(bike.id) == due_tick and not bike.simulating:
+                    bikes.append(bike)
+
+        self._zone_evaluator.update(bikes)
+        self._zone_bikes = {bike.id for bike in bikes}
+        self._zone_tick = self._tick + self._zone_window
+
+    def _run_bike(self, bike):
+        """ Check state and send data for one bike, and schedule it for next interval.
+
+        Args:
+            bike (Bike): the bike to run
+        """
+        if bike.simulating:
+            self._stats['skipped_simulating'] += 1
+        else:
+            bike.check_state(update_speed_limit=self._zone_evaluator is None or bike.id not in self._zone_bikes)
+            task = asyncio.create_task(bike.update_bike_data())
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+            self._stats['sent'] += 1
+
+        self._schedule(bike, self._tick + self._ticks_for(bike.interval))
+
+    async def run(self):
+        """ Asynchronous loop that advances the wheel each tick until stopped.
+
+        Ticks are timed from the start on the process-wide clock, so the wheel doesn't drift. If the loop
+        has been blocked, the missed ticks are run right away. With a virtual clock the data sent in a
+        tick is finished before the time moves to the next tick.
+        """
+        clock = get_clock()
+        start = clock.time() - self._tick * self._tick_length
+        self._running = True
+        while self._running:
+            next_tick = start + (self._tick + 1) * self._tick_length
+            delay = next_tick - clock.time()
+            if delay < -self._tick_length:
+                self._stats['late_ticks'] += 1
+            await clock.sleep(max(delay, 0))  # Also lets the sends run when catching up
+            self.advance()
+            if clock.virtual and self._sending:
+                await asyncio.gather(*self._sending)
+
+        if self._sending:
+            await asyncio.gather(*self._sending)
+
+    def stop(self):
+        """ Stop the scheduler, data being sent is finished before run() returns. """
+        self._running = False
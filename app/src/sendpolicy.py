@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Send policy module, used for skipping data from bikes that hasn't changed
+"""
+import time
+
+SEND = 'send'
+HEARTBEAT = 'heartbeat'
+SKIP = 'skip'
+
+
+class DeltaSendPolicy:
+    """ Class that decides if data from a bike should be sent, based on the last data the server got.
+
+    Data is sent if position, status, speed, city or battery has changed since the last acknowledged data,
+    battery only if it has changed more than battery_threshold. Unchanged data is skipped, but when nothing
+    has been sent for max_silence seconds a heartbeat with only id, status and battery is sent instead,
+    so the server knows the bike is alive. One policy can be shared by all bikes.
+
+    Args:
+        battery_threshold (float=0.01): smallest change in battery level that is sent
+        max_silence (float=300): max seconds between two messages from a bike
+        heartbeat_fields (tuple=('id', 'status_id', 'charge_perc')): fields sent in a heartbeat
+    """
+
+    def __init__(self, battery_threshold: float = 0.01, max_silence: float = 300,
+                 heartbeat_fields: tuple = ('id', 'status_id', 'charge_perc')):
+        self._battery_threshold = battery_threshold
+        self._max_silence = max_silence
+        self._heartbeat_fields = heartbeat_fields
+
+        self._acknowledged = {}  # Last sent full data for each bike, keyed by bike id
+        self._last_sent = {}  # Time when each bike last sent anything, keyed by bike id
+        self._stats = {'sent': 0, 'skipped': 0, 'heartbeats': 0}
+
+    def stats(self):
+        """ Statistics for the policy.
+
+        Returns:
+            dict: number of sent, skipped and heartbeat messages
+        """
+        return dict(self._stats)
+
+    def _changed(self, last: dict, data: dict):
+        """ Check if data has changed since last acknowledged data.
+
+        Args:
+            last (dict): last acknowledged data
+            data (dict): new data
+
+        Returns:
+            bool: True if any field has changed, battery only if more than the threshold
+        """
+        for name, value in data.items():
+            if name == 'charge_perc':
+                if abs(value - last.get(name, 0)) >= self._battery_threshold:
+                    return True
+            elif last.get(name) != value:
+                return True
+        return False
+
+    def decide(self, data: dict, now: float = None):
+        """ Decide what to send for data from a bike.
+
+        Args:
+            data (dict): data from Bike.get_data()
+            now (float): time in seconds, default is time.monotonic()
+
+        Returns:
+            tuple:
+                - str: SEND, HEARTBEAT or SKIP
+                - dict or None: payload to send, None for SKIP
+        """
+        now = time.monotonic() if now is None else now
+        bike_id = data.get('id')
+        last = self._acknowledged.get(bike_id)
+
+        if last is None or self._changed(last, data):
+            self._stats['sent'] += 1
+            return SEND, data
+        if now - self._last_sent.get(bike_id, now) >= self._max_silence:
+            self._stats['heartbeats'] += 1
+            return HEARTBEAT, {name: data.get(name) for name in self._heartbeat_fields}
+        self._stats['skipped'] += 1
+        return SKIP, None
+
+    def acknowledge(self, data: dict, decision: str, now: float = None):
+        """ Save that the server got data from a bike.
+
+        Args:
+            data (dict): the data from Bike.get_data(), not the heartbeat payload
+            decision (str): what was sent, SEND or HEARTBEAT
+            now (float): time in seconds, default is time.monotonic()
+        """
+        bike_id = data.get('id')
+        self._last_sent[bike_id] = time.monotonic() if now is None else now
+        if decision == SEND:
+            self._acknowledged[bike_id] = data
+
+    def forget(self, bike_id: int):
+        """ Forget the last data for a bike, so its next data is sent.
+
+        Args:
+            bike_id (int): id of the bike
+        """
+        self._acknowledged.pop(bike_id, None)
+        self._last_sent.pop(bike_id, None)
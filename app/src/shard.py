@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Shard module, used for running the fleet in many processes to use all CPU cores
+"""
+import time
+import queue
+import asyncio
+import multiprocessing
+
+# Metrics where the largest value from any shard is reported instead of the sum. Lateness and time,
+# and settings that are the same in each shard, ex. speedup and pool limits. Matched on the end of the name.
+MAX_METRICS = ('max_late', 'time', 'speedup', 'limit', 'limit_per_host', 'max_cells')
+
+
+def shard_of(bike_id: int, shards: int):
+    """ Shard that runs a bike.
+
+    Args:
+        bike_id (int): id of the bike
+        shards (int): number of shards
+
+    Returns:
+        int: index of the shard
+    """
+    return bike_id % shards
+
+
+def partition(bike_data: list, shards: int):
+    """ Split data for bikes into one list for each shard, by bike id.
+
+    Args:
+        bike_data (list): data for all bikes
+        shards (int): number of shards
+
+    Returns:
+        list[list]: data for the bikes in each shard
+    """
+    parts = [[] for _ in range(shards)]
+    for data_item in bike_data:
+        parts[shard_of(data_item.get('id'), shards)].append(data_item)
+    return parts
+
+
+async def report_metrics(metrics_queue, index: int, collect, interval: float):
+    """ Send metrics from a shard to the supervisor, used as a task in the shard.
+
+    Args:
+        metrics_queue (multiprocessing.Queue): queue to the supervisor
+        index (int): index of the shard
+        collect (callable): called without arguments, returns dict with the metrics
+        interval (float): seconds between each report
+    """
+    while True:
+        await asyncio.sleep(interval)
+        metrics_queue.put((index, collect()))
+
+
+class ShardSupervisor:  # pylint: disable=too-many-instance-attributes
+    """ Class that runs each shard in its own process and restarts shards that crash.
+
+    Each process is started with target(index, shard_data, metrics_queue, *args). Shards send
+    (index, metrics) on the queue, the supervisor keeps the latest metrics from each shard and
+    prints the sum for all shards. A shard that exits with an error is restarted after restart_delay,
+    at most max_restarts times. Processes are started with spawn, so target must be importable.
+
+    Args:
+        target (callable): function to run in each process
+        shard_data (list): data for each shard, one item per shard
+        args (tuple=()): extra arguments to target
+        restart_delay (float=1.0): seconds before a crashed shard is started again
+        max_restarts (int=5): max number of restarts for each shard
+        report_interval (float=60): seconds between each printed report
+    """
+
+    def __init__(self, target, shard_data: list, *, args: tuple = (), restart_delay: float = 1.0,
+                 max_restarts: int = 5, report_interval: float = 60):
+        self._target = target
+        self._shard_data = shard_data
+        self._args = args
+        self._restart_delay = restart_delay
+        self._max_restarts = max_restarts
+        self._report_interval = report_interval
+
+        self._context = multiprocessing.get_context('spawn')
+        self._queue = self._context.Queue()
+        self._processes = {}  # Running processes, keyed by shard index
+        self._restart_at = {}  # Time when crashed shards should be started again, keyed by shard index
+        self._restarts = [0] * len(shard_data)
+        self._metrics = {}  # Latest metrics from each shard, keyed by shard index
+
+    @property
+    def restarts(self):
+        """ list[int]: number of restarts for each shard """
+        return self._restarts
+
+    @property
+    def metrics(self):
+        """ dict[dict]: latest metrics from each shard, keyed by shard index """
+        return self._metrics
+
+    def aggregate(self):
+        """ Combine the latest metrics from all shards, counters are summed and MAX_METRICS use the largest.
+
+        Returns:
+            dict: each numeric metric for all shards, with number of shards reporting and restarts
+        """
+        total = {'shards_reporting': len(self._metrics), 'restarts': sum(self._restarts)}
+        for metrics in self._metrics.values():
+            for name, value in metrics.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if name.endswith(MAX_METRICS):
+                    total[name] = max(total.get(name, value), value)
+                else:
+                    total[name] = total.get(name, 0) + value
+        return total
+
+    def _start(self, index: int):
+        """ Start the process for a shard.
+
+        Args:
+            index (int): index of the shard
+        """
+        process = self._context.Process(
+            target=self._target,
+            args=(index, self._shard_data[index], self._queue, *self._args),
+            name=f"shard-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _check_processes(self):
+        """ Find shards that have stopped, and restart or remove them. """
+        current = time.monotonic()
+        for index, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            del self._processes[index]
+            if process.exitcode == 0:
+                continue
+            if self._restarts[index] >= self._max_restarts:
+                print(f"Shard {index} crashed with exitcode {process.exitcode}, not restarted again")
+                continue
+            print(f"Shard {index} crashed with exitcode {process.exitcode}, restarting")
+            self._restarts[index] += 1
+            self._restart_at[index] = current + self._restart_delay
+
+        for index, restart_at in list(self._restart_at.items()):
+            if current >= restart_at:
+                del self._restart_at[index]
+                self._start(index)
+
+    def _read_metrics(self):
+        """ Read all metrics waiting on the queue. """
+        while True:
+            try:
+                index, metrics = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._metrics[index] = metrics
+
+    def run(self, poll_interval: float = 0.5):
+        """ Start all shards and supervise them until all have stopped.
+
+        Args:
+            poll_interval (float): seconds between each check of the processes, default is 0.5
+        """
+        for index in range(len(self._shard_data)):
+            self._start(index)
+
+        next_report = time.monotonic() + self._report_interval
+        try:
+            while self._processes or self._restart_at:
+                time.sleep(poll_interval)
+                self._read_metrics()
+                self._check_processes()
+                if time.monotonic() >= next_report:
+                    print(f"Shards: {self.aggregate()}")
+                    next_report += self._report_interval
+        finally:
+            self.stop()
+            self._read_metrics()
+
+    def stop(self):
+        """ Stop all running shards. """
+        self._restart_at.clear()
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join()
+        self._processes.clear()
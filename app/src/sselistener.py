@@ -4,10 +4,32 @@ SSE listener class
 """
 import os
 import asyncio
-import json
 import inspect
 from aiosseclient import aiosseclient
 from src.bike import Bike
+from src.clock import get_clock
+from src.perf import get_codec
+from src.metrics import get_metrics
+from src.zoneregistry import ZoneRegistry
+
+
+def _run_action(bike: Bike, instruction: str, args: list):
+    """ Run an instruction from server on a bike.
+
+    Coroutines, ex. a simulated trip, are started as tasks using the clock, so a virtual clock
+    doesn't move before the task has started.
+
+    Args:
+        bike (Bike): the bike to control
+        instruction (str): name of the method to run on bike
+        args (list): arguments for the method
+    """
+    action = getattr(bike, instruction)
+
+    if inspect.iscoroutinefunction(action):
+        get_clock().create_task(action(*args))
+    else:
+        action(*args)
 
 
 class SSEListener:
@@ -33,7 +55,7 @@ class SSEListener:
         while self._running:
             try:
                 async for event in aiosseclient(self._api_url, headers=headers):
-                    data = json.loads(event.data)
+                    data = get_codec().loads(event.data)
                     asyncio.create_task(self._control_bike(data))
             # Disableing pylint to catch any error, might be a bit to wide but this needs
             # to keep running for all possible errors for now.
@@ -48,20 +70,157 @@ class SSEListener:
         Args:
             data (dict): data to decide what to do with bike.
         """
-        action = None
+        metrics = get_metrics()
+        start = metrics.start()
         args = data.get('args', [])
 
         if 'instruction_all' in data:
-            instruction = data.get('instruction_all')
-            action = getattr(self._bike, instruction)
+            _run_action(self._bike, data.get('instruction_all'), args)
         elif 'bike_id' in data and int(data.get('bike_id')) == self._bike.id:
-            instruction = data.get('instruction')
-            action = getattr(self._bike, instruction)
+            _run_action(self._bike, data.get('instruction'), args)
+        metrics.observe('sse_control', start)
+
+    def stop_listener(self):
+        """ Method to stop the listener """
+        self._running = False
+
+
+class FleetSSEListener:
+    """ Class for listening to events for a whole fleet of bikes with few connections.
+    Each event is parsed once and sent to the right bike with a lookup on bike_id,
+    events for all bikes are sent to each bike in the process.
+
+    An event that can't be read or an instruction that fails for a bike is printed and skipped, the
+    connection and the other bikes keep running.
+
+    The bikes are split between the connections by id, each connection only controls its own bikes.
+    Bikes added to the dict after the listener is started are also controlled. When the fleet is split
+    into shards by bike id, shards must be given so the bikes of the shard are spread over all connections.
+
+    With a zone registry, an event {'refresh_zones': city_id} sent when the zones of a city are changed
+    removes the city from the registry and fetches it again with one bike, then all bikes in the city
+    use the new zones.
+
+    Args:
+        bikes (dict[Bike]): the bikes to control, keyed by bike id
+        api_url (str): url to where the events is sent from server
+        connections (int=1): number of connections to server
+        shards (int=1): number of shards the fleet is split into
+        zone_registry (ZoneRegistry=None): registry with the zones shared by the bikes
+    """
+    API_KEY = os.environ.get('API_KEY', '')
+
+    def __init__(self, bikes: dict, api_url: str, connections: int = 1, *, shards: int = 1,
+                 zone_registry: ZoneRegistry = None):
+        self._bikes = bikes
+        self._api_url = api_url
+        self._connections = max(1, connections)
+        self._shards = max(1, shards)
+        self._zone_registry = zone_registry
+        self._running = False
+
+    def _owns(self, bike_id: int, index: int):
+        """ Check if a bike is controlled by a connection.
+
+        Args:
+            bike_id (int): id of the bike
+            index (int): index of the connection
+
+        Returns:
+            bool: True if the connection controls the bike
+        """
+        # Bikes in a shard all have the same bike_id % shards, so the rest of the id is used
+        return (bike_id // self._shards) % self._connections == index
 
-        if action and inspect.iscoroutinefunction(action):
-            asyncio.create_task(action(*args))
-        elif action:
-            action(*args)
+    async def listen(self):
+        """ Start listening to events sent from server, on all connections. """
+        self._running = True
+        await asyncio.gather(*(self._listen_connection(index) for index in range(self._connections)))
+
+    async def _listen_connection(self, index: int):
+        """ Listen to events on one connection.
+
+        Args:
+            index (int): index of the connection
+        """
+        headers = {'x-api-key': self.API_KEY}
+        while self._running:
+            try:
+                async for event in aiosseclient(self._api_url, headers=headers):
+                    try:
+                        data = get_codec().loads(event.data)
+                    except ValueError as error:
+                        print(f"Invalid SSE event: {error}")
+                        continue
+                    self._control_bikes(index, data)
+            # Same as in SSEListener, keep running for all possible errors.
+            # pylint: disable=broad-exception-caught
+            except Exception as error:
+                print(f"Error in SSE connection: {error}")
+                await asyncio.sleep(2)  # Wait 2 seconds before trying to reconnect
+
+    def _control_bikes(self, index: int, data: dict):
+        """ Control bikes with actions sent from server.
+
+        Args:
+            index (int): index of the connection that got the event
+            data (dict): data to decide what to do with bikes.
+        """
+        metrics = get_metrics()
+        start = metrics.start()
+        args = data.get('args', [])
+
+        if 'refresh_zones' in data:
+            if index == 0:  # All connections get the event, the city is only fetched once
+                self._refresh_zones(data.get('refresh_zones'))
+        elif 'instruction_all' in data:
+            instruction = data.get('instruction_all')
+            for bike_id, bike in list(self._bikes.items()):
+                if self._owns(bike_id, index):
+                    self._try_action(bike, instruction, args)
+        elif 'bike_id' in data:
+            try:
+                bike_id = int(data.get('bike_id'))
+            except (TypeError, ValueError):
+                print(f"Invalid bike_id in SSE event: {data.get('bike_id')}")
+            else:
+                bike = self._bikes.get(bike_id)
+                if bike is not None and self._owns(bike_id, index):
+                    self._try_action(bike, data.get('instruction'), args)
+        metrics.observe('sse_control', start)
+
+    def _refresh_zones(self, city_id: str):
+        """ Fetch the zones for a city again, with the first bike that uses them.
+
+        Args:
+            city_id (str): id of the city
+        """
+        if self._zone_registry is None:
+            return
+        old_zone = self._zone_registry.cities.get(city_id)
+        self._zone_registry.refresh(city_id)
+        if old_zone is None:
+            return  # Not fetched yet, bikes get the new zones when they fetch it
+        for bike in list(self._bikes.values()):
+            if bike.city_zone is old_zone:
+                self._try_action(bike, 'update_zones_async', [])
+                return
+
+    @staticmethod
+    def _try_action(bike: Bike, instruction: str, args: list):
+        """ Run an instruction on one bike, an error is printed instead of stopping the connection.
+
+        Args:
+            bike (Bike): the bike to control
+            instruction (str): name of the method to run on bike
+            args (list): arguments for the method
+        """
+        try:
+            _run_action(bike, instruction, args)
+        # Unknown instructions, wrong arguments or errors in the bike should only affect that bike
+        # pylint: disable=broad-exception-caught
+        except Exception as error:
+            print(f"Error in instruction {instruction} for bike {bike.id}: {error}")
 
     def stop_listener(self):
         """ Method to stop the listener """
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+Telemetry client module, a shared HTTP client used by all bikes to talk to the server
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import aiohttp
+from src.perf import get_codec
+from src.metrics import get_metrics
+
+
+class TelemetryClient:
+    """ Class for a pooled HTTP client shared by all bikes.
+
+    One aiohttp.ClientSession (and one connector) is reused for every request, so connections
+    are kept alive between requests instead of doing a new TCP/TLS handshake for each one.
+    JSON is encoded and decoded with the process-wide codec from src.perf.
+
+    When metrics are enabled, encoding and requests are measured as the stages encode and request,
+    and responses with an error status are counted by status code.
+
+    Args:
+        limit (int=100): max number of open connections in the pool
+        limit_per_host (int=100): max number of open connections to the same host
+        timeout (float=10): total timeout in seconds for one request
+        keepalive_timeout (float=30): seconds an idle connection is kept open in the pool
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 100, timeout: float = 10,
+                 keepalive_timeout: float = 30):
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._timeout = timeout
+        self._keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._loop = None
+
+        # Counters used for pool statistics
+        self._in_flight = 0
+        self._queued = 0
+        self._created = 0
+        self._reused = 0
+
+    @property
+    def in_flight(self):
+        """ int: number of requests currently sent and waiting for a response """
+        return self._in_flight
+
+    def _trace_config(self):
+        """ Create the trace config used to count queued, created and reused connections.
+
+        Returns:
+            aiohttp.TraceConfig: trace config for the session
+        """
+        async def on_queued_start(*_):
+            self._queued += 1
+
+        async def on_queued_end(*_):
+            self._queued -= 1
+
+        async def on_create_end(*_):
+            self._created += 1
+
+        async def on_reuse(*_):
+            self._reused += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def _get_session(self):
+        """ Get the shared session, a new one is created if there is none for the running loop.
+
+        Returns:
+            aiohttp.ClientSession: the shared session
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                keepalive_timeout=self._keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                trace_configs=[self._trace_config()],
+                json_serialize=self._encode
+            )
+            self._loop = loop
+        return self._session
+
+    @staticmethod
+    def _encode(data):
+        """ Encode the json for a request, measured as the stage encode.
+
+        The codec and metrics are looked up for each call, since they can be replaced after the
+        session is created, ex. when metrics are only installed for a measured window.
+
+        Args:
+            data (dict or list): the json
+
+        Returns:
+            str: the encoded json
+        """
+        metrics = get_metrics()
+        start = metrics.start()
+        try:
+            return get_codec().dumps(data)
+        finally:
+            metrics.observe('encode', start)
+
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs):
+        """ Make a request with the shared session.
+
+        Args:
+            method (str): name of the session method to use, ex. 'put'
+            url (str): url for the request
+            **kwargs: passed on to the session method, ex. json and headers
+
+        Yields:
+            aiohttp.ClientResponse: the response from server
+        """
+        session = self._get_session()
+        metrics = get_metrics()
+        start = metrics.start()
+        self._in_flight += 1
+        try:
+            async with getattr(session, method)(url, **kwargs) as response:
+                metrics.observe('request', start)
+                if response.status >= 300:
+                    metrics.count('http_errors_total', 'status', response.status)
+                yield response
+        except asyncio.TimeoutError:
+            metrics.count('http_errors_total', 'status', 'timeout')
+            raise
+        except aiohttp.ClientError:
+            metrics.count('http_errors_total', 'status', 'connection')
+            raise
+        finally:
+            self._in_flight -= 1
+
+    def get(self, url: str, **kwargs):
+        """ Make a GET-request, used as an asynchronous context manager.
+
+        Args:
+            url (str): url for the request
+            **kwargs: passed on to aiohttp, ex. headers
+
+        Returns:
+            AsyncContextManager: yields the response
+        """
+        return self._request('get', url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        """ Make a PUT-request, used as an asynchronous context manager.
+
+        Args:
+            url (str): url for the request
+            **kwargs: passed on to aiohttp, ex. json and headers
+
+        Returns:
+            AsyncContextManager: yields the response
+        """
+        return self._request('put', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """ Make a POST-request, used as an asynchronous context manager.
+
+        Args:
+            url (str): url for the request
+            **kwargs: passed on to aiohttp, ex. json and headers
+
+        Returns:
+            AsyncContextManager: yields the response
+        """
+        return self._request('post', url, **kwargs)
+
+    async def get_json(self, url: str, headers: dict = None, retries: int = 3, backoff: float = 0.5):
+        """ Make a GET-request and return the json, retried with exponential backoff on errors.
+
+        Client errors (status 4xx) are not retried.
+
+        Args:
+            url (str): url for the request
+            headers (dict): headers for the request, default is None
+            retries (int): number of retries after the first attempt, default is 3
+            backoff (float): seconds to wait before first retry, doubled for each retry, default is 0.5
+
+        Returns:
+            dict or list or None: the json from server, None if request failed
+        """
+        for attempt in range(retries + 1):
+            try:
+                async with self.get(url, headers=headers) as response:
+                    if response.status < 300:
+                        return await response.json(loads=get_codec().loads)
+                    print(f"Errorcode: {response.status}")
+                    if response.status < 500:
+                        return None
+            except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+                print("Error", error)
+
+            if attempt < retries:
+                await asyncio.sleep(backoff * 2 ** attempt)
+        return None
+
+    def stats(self):
+        """ Statistics for the connection pool, used to size the pool under load.
+
+        Returns:
+            dict: with limits, open/idle connections and queued requests
+        """
+        idle = 0
+        in_use = 0
+        if self._session is not None and not self._session.closed:
+            # aiohttp has no public api for the pool content, so read it from the connector.
+            connector = self._session.connector
+            idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+            in_use = len(getattr(connector, '_acquired', ()))
+
+        return {
+            'limit': self._limit,
+            'limit_per_host': self._limit_per_host,
+            'open': idle + in_use,
+            'idle': idle,
+            'in_use': in_use,
+            'queued': self._queued,
+            'in_flight': self._in_flight,
+            'created': self._created,
+            'reused': self._reused
+        }
+
+    async def close(self):
+        """ Close the session and all connections in the pool. """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_CLIENT = None
+
+
+def get_client():
+    """ Get the process-wide client, created with default settings on first use.
+
+    Returns:
+        TelemetryClient: the shared client
+    """
+    global _CLIENT  # pylint: disable=global-statement
+    if _CLIENT is None:
+        _CLIENT = TelemetryClient()
+    return _CLIENT
+
+
+def set_client(client: TelemetryClient):
+    """ Replace the process-wide client, ex. with one with other limits.
+
+    Args:
+        client (TelemetryClient): client to use as default
+    """
+    global _CLIENT  # pylint: disable=global-statement
+    _CLIENT = client
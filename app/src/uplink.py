@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+Uplink module, used for sending data from many bikes to server in batches
+"""
+import os
+import asyncio
+import aiohttp
+from src.clock import get_clock
+from src.telemetryclient import TelemetryClient, get_client
+
+
+class BatchUplink:  # pylint: disable=too-many-instance-attributes
+    """ Class that collects data from bikes and sends it to server in batches.
+
+    Bikes submit their data and the uplink sends it to a bulk endpoint when enough data is
+    collected or when the flush interval has passed. If the bulk endpoint is missing on the server
+    each bike's data is sent with a normal PUT instead, and the bulk endpoint is tried again later.
+
+    Only the latest data for each bike is kept while waiting to be sent. A bike can give a callback
+    with its data, it is called with True when the server got the data and False when sending failed,
+    replaced data gets no call. When max_pending bikes
+    are waiting, submit waits until there is room, so a slow server slows down the bikes instead
+    of letting the queue grow.
+
+    The flush interval and retry_bulk_after are on the process-wide clock, so with a faster or virtual
+    clock the batches are sent as often in simulated time as in real time, and updates from bikes
+    aren't merged more.
+
+    Args:
+        client (TelemetryClient=None): client used for requests to server, default is the shared client
+        batch_size (int=200): max number of bikes in one batch, a full batch is sent right away
+        flush_interval (float=0.25): max seconds to wait before sending a batch
+        max_pending (int=2000): max number of bikes waiting to be sent
+        bulk_route (str='/bikes'): route for the bulk endpoint
+        retry_bulk_after (float=60): seconds before trying the bulk endpoint again after it was unavailable
+    """
+    API_URL = os.environ.get('API_URL', '')
+    API_KEY = os.environ.get('API_KEY', '')
+    UNAVAILABLE_STATUS = {404, 405, 501}
+
+    def __init__(self, client: TelemetryClient = None, *, batch_size: int = 200, flush_interval: float = 0.25,
+                 max_pending: int = 2000, bulk_route: str = '/bikes', retry_bulk_after: float = 60):
+        self._client = client if client is not None else get_client()
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max(max_pending, batch_size)
+        self._bulk_route = bulk_route
+        self._retry_bulk_after = retry_bulk_after
+
+        self._pending = {}  # Latest data and callback for each bike, keyed by bike id
+        self._has_pending = asyncio.Event()
+        self._batch_ready = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._bulk_unavailable_at = None
+        self._running = False
+
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'sent_bulk': 0,
+            'sent_single': 0,
+            'failed': 0
+        }
+
+    @property
+    def pending(self):
+        """ int: number of bikes waiting to be sent """
+        return len(self._pending)
+
+    def stats(self):
+        """ Statistics for the uplink.
+
+        Returns:
+            dict: counters for submitted, coalesced, sent and failed updates
+        """
+        return {**self._stats, 'pending': self.pending}
+
+    async def submit(self, data: dict, on_sent=None):
+        """ Add data from a bike to the next batch. Waits if too many bikes are waiting to be sent.
+
+        Args:
+            data (dict): data from Bike.get_data()
+            on_sent (callable): called with True if the server got the data or False if it failed,
+                not called if the data is replaced by newer data from the bike, default is None
+        """
+        bike_id = data.get('id')
+        while bike_id not in self._pending and len(self._pending) >= self._max_pending:
+            await get_clock().wait(self._has_room.wait())
+
+        if bike_id in self._pending:
+            self._stats['coalesced'] += 1
+        self._stats['submitted'] += 1
+        self._pending[bike_id] = (data, on_sent)
+        self._has_pending.set()
+
+        if len(self._pending) >= self._batch_size:
+            self._batch_ready.set()
+        if len(self._pending) >= self._max_pending:
+            self._has_room.clear()
+
+    def _take_batch(self):
+        """ Take the oldest waiting data from the queue.
+
+        Returns:
+            list[tuple]: data and callback for max batch_size bikes
+        """
+        batch = []
+        for bike_id in list(self._pending)[:self._batch_size]:
+            batch.append(self._pending.pop(bike_id))
+
+        if len(self._pending) < self._batch_size:
+            self._batch_ready.clear()
+        if not self._pending:
+            self._has_pending.clear()
+        self._has_room.set()
+        return batch
+
+    def _use_bulk(self):
+        """ Check if the bulk endpoint should be used.
+
+        Returns:
+            bool: True if bulk endpoint is available or it is time to try it again
+        """
+        if self._bulk_unavailable_at is None:
+            return True
+        if get_clock().time() - self._bulk_unavailable_at >= self._retry_bulk_after:
+            self._bulk_unavailable_at = None
+            return True
+        return False
+
+    async def _send_bulk(self, batch: list):
+        """ Send a batch to the bulk endpoint.
+
+        Args:
+            batch (list): data for bikes
+
+        Returns:
+            bool or None: True if the server got the batch, False if it failed, None if the bulk endpoint
+                is unavailable
+        """
+        req_url = self.API_URL + self._bulk_route
+        headers = {'x-api-key': self.API_KEY}
+        try:
+            async with self._client.put(req_url, json=batch, headers=headers) as response:
+                if response.status in self.UNAVAILABLE_STATUS:
+                    print(f"Bulk endpoint unavailable, errorcode: {response.status}")
+                    self._bulk_unavailable_at = get_clock().time()
+                    return None
+                if response.status >= 300:
+                    print(f"Updating batch, errorcode: {response.status}")
+                    self._stats['failed'] += len(batch)
+                    return False
+                self._stats['sent_bulk'] += len(batch)
+                return True
+        except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+            print(f"Updating batch failed: {error!r}")
+            self._stats['failed'] += len(batch)
+            return False
+
+    async def _send_single(self, data: dict):
+        """ Send data for one bike, used when bulk endpoint is unavailable.
+
+        Args:
+            data (dict): data for one bike
+
+        Returns:
+            bool: True if the server got the data
+        """
+        req_url = self.API_URL + f"/bikes/{data.get('id')}"
+        headers = {'x-api-key': self.API_KEY}
+        try:
+            async with self._client.put(req_url, json=data, headers=headers) as response:
+                if response.status >= 300:
+                    print(f"Updating data, errorcode: {response.status}")
+                    self._stats['failed'] += 1
+                    return False
+                self._stats['sent_single'] += 1
+                return True
+        except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+            print(f"Updating data failed: {error!r}")
+            self._stats['failed'] += 1
+            return False
+
+    async def flush(self):
+        """ Send one batch of waiting data to server. """
+        batch = self._take_batch()
+        if not batch:
+            return
+
+        self._stats['batches'] += 1
+        payloads = [data for data, _ in batch]
+        sent = await self._send_bulk(payloads) if self._use_bulk() else None
+        if sent is not None:
+            results = [sent] * len(batch)
+        else:
+            results = await asyncio.gather(*(self._send_single(data) for data in payloads))
+
+        for (_, on_sent), result in zip(batch, results):
+            if on_sent is not None:
+                on_sent(result)
+
+    async def run(self):
+        """ Asynchronous loop that sends batches until stopped. """
+        clock = get_clock()
+        self._running = True
+        while self._running:
+            # Wait for the first data before the flush interval, so an empty uplink doesn't wake a virtual clock
+            await clock.wait(self._has_pending.wait())
+            try:
+                await clock.wait_for(self._batch_ready.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+        # Send what is left when stopped
+        while self._pending:
+            await self.flush()
+
+    def stop(self):
+        """ Stop the uplink, waiting data is sent before run() returns. """
+        self._running = False
+        self._has_pending.set()
@@ -3,7 +3,11 @@
 Zone-module
 """
 
-from shapely.geometry import Point, Polygon
+import math
+from collections import OrderedDict
+import numpy as np
+from shapely import STRtree, contains_properly, contains_xy, points, prepare
+from shapely.geometry import Point, Polygon, box
 
 
 class Zone():
@@ -20,11 +24,20 @@ class Zone():
         self._coordinates = coords.get('coordinates')[0]
         self._speed_limit = data.get('speed_limit', speed_limit)
 
+        # Polygon is only created once and prepared, which makes repeated contains-checks faster
+        self._polygon = Polygon(self._coordinates)
+        prepare(self._polygon)
+
     @property
     def speed_limit(self):
         """ int: the speed limit in the zone """
         return self._speed_limit
 
+    @property
+    def polygon(self):
+        """ Polygon: the prepared polygon for the zone """
+        return self._polygon
+
     def point_in_zone(self, point_coords: list):
         """ See if a point is inside the zone.
 
@@ -34,10 +47,87 @@ class Zone():
         Returns:
             bool: true if the point is inside the zone
         """
-        polygon = Polygon(self._coordinates)
         point = Point(*point_coords)
 
-        return polygon.contains(point)
+        return self._polygon.contains(point)
+
+
+class GridCellCache:
+    """ Cache with speed limits for grid cells, used for points that are asked about again and again.
+
+    Points are placed in square cells of cell_size degrees. A cell is classified the first time it is
+    used, cells fully inside or outside every zone have one speed limit that is saved. Cells crossing
+    the boundary of a zone are saved as boundary cells and points in them are looked up exactly.
+    Only the most recently used cells are kept.
+
+    Args:
+        cell_size (float=0.0005): length of the sides of a cell in degrees, about 50 m in latitude
+        max_cells (int=10000): max number of cells in the cache
+    """
+
+    def __init__(self, cell_size: float = 0.0005, max_cells: int = 10000):
+        self._cell_size = cell_size
+        self._max_cells = max_cells
+        self._cells = OrderedDict()  # Speed limit for each cell, None for boundary cells
+        self._stats = {'hits': 0, 'misses': 0, 'exact': 0}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def stats(self):
+        """ Statistics for the cache.
+
+        Returns:
+            dict: number of hits and misses, exact lookups in boundary cells (counted as misses) and cached cells
+        """
+        return {**self._stats, 'cells': len(self._cells), 'max_cells': self._max_cells}
+
+    def clear(self):
+        """ Remove all cells, used when the zones change. """
+        self._cells.clear()
+
+    def bounds(self, cell: tuple):
+        """ Bounds of a cell.
+
+        Args:
+            cell (tuple[int, int]): the cell
+
+        Returns:
+            tuple: (min longitude, min latitude, max longitude, max latitude)
+        """
+        column, line = cell
+        return (column * self._cell_size, line * self._cell_size,
+                (column + 1) * self._cell_size, (line + 1) * self._cell_size)
+
+    def lookup(self, point, classify, exact):
+        """ Speed limit for a point, from the cell if the cell has one speed limit.
+
+        Args:
+            point (list[float, float]): list with coordinates [longitude, latitude]
+            classify (callable): called with the bounds of a new cell, returns its speed limit or None
+            exact (callable): called with the point if it is in a boundary cell, returns the speed limit
+
+        Returns:
+            int: speed limit for the point
+        """
+        cell = (math.floor(point[0] / self._cell_size), math.floor(point[1] / self._cell_size))
+        if cell in self._cells:
+            self._cells.move_to_end(cell)
+            speed_limit = self._cells[cell]
+            if speed_limit is not None:
+                self._stats['hits'] += 1
+                return speed_limit
+        else:
+            speed_limit = classify(self.bounds(cell))
+            self._cells[cell] = speed_limit
+            if len(self._cells) > self._max_cells:
+                self._cells.popitem(last=False)
+
+        self._stats['misses'] += 1
+        if speed_limit is None:
+            self._stats['exact'] += 1
+            return exact(point)
+        return speed_limit
 
 
 class CityZone(Zone):
@@ -52,20 +142,83 @@ class CityZone(Zone):
         """ Constructor """
         super().__init__(data, speed_limit)
         self._zones = []
+        self._tree = None  # Spatial index for zones, created on first lookup
+        self._frozen = False  # A frozen city is shared between bikes and can't be changed
+        self._revision = 0  # Changed when zones change, used to invalidate speed limits calculated before
+        self._cache = None  # Optional GridCellCache, cleared when zones change
         self._city_id = data.get('city_id', '')
 
+    @classmethod
+    def from_data(cls, city_zone_data: dict):
+        """ Create a city with all its zones from the data sent from server.
+
+        Args:
+            city_zone_data (dict): data needed for setting up zones
+
+        Returns:
+            CityZone: the city with zones added
+        """
+        city_zone = cls(city_zone_data)
+        backup_speed_limit = city_zone.speed_limit  # Used for zones without a speed limit
+
+        zones = []
+        for zone in city_zone_data.get('zones', []):
+            zones.append(Zone(zone, backup_speed_limit))
+
+        city_zone.add_zones_list(zones)
+        return city_zone
+
     @property
     def city_id(self):
         """ str: id of city. """
         return self._city_id
 
+    @property
+    def revision(self):
+        """ int: increased each time zones are added """
+        return self._revision
+
+    @property
+    def cache(self):
+        """ GridCellCache: cache for speed limits, None if not enabled """
+        return self._cache
+
+    def enable_cache(self, cell_size: float = 0.0005, max_cells: int = 10000):
+        """ Cache speed limits from get_speed_limit() for each grid cell, can be used on a frozen city.
+
+        Args:
+            cell_size (float): length of the sides of a cell in degrees, default is 0.0005
+            max_cells (int): max number of cells in the cache, default is 10000
+        """
+        self._cache = GridCellCache(cell_size, max_cells)
+
+    @property
+    def frozen(self):
+        """ bool: True if zones can't be changed anymore """
+        return self._frozen
+
+    def freeze(self):
+        """ Build the spatial index and stop zones from being changed, used before sharing the city. """
+        self._get_tree()
+        self._frozen = True
+
+    def _check_not_frozen(self):
+        """ Raise an error if the city is frozen. """
+        if self._frozen:
+            raise RuntimeError(f"Zones in city {self._city_id} are shared and can't be changed")
+
     def add_zone(self, zone: Zone):
         """ Add a zone to city.
 
         Args:
             zone (Zone): Zone to add
         """
+        self._check_not_frozen()
         self._zones.append(zone)
+        self._tree = None
+        self._revision += 1
+        if self._cache is not None:
+            self._cache.clear()
 
     def add_zones_list(self, zones: list):
         """ Add zones to city.
@@ -73,25 +226,109 @@ class CityZone(Zone):
         Args:
             zones (list): list of zones
         """
+        self._check_not_frozen()
         for zone in zones:
             self._zones.append(zone)
+        self._tree = None
+        self._revision += 1
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _get_tree(self):
+        """ Get the spatial index for the zones, created if zones has changed.
+
+        Returns:
+            STRtree: index with the polygons of the zones, in the same order as the zones
+        """
+        if self._tree is None:
+            self._tree = STRtree([zone.polygon for zone in self._zones])
+        return self._tree
 
     def get_speed_limit(self, point):
-        """ Loops through all zones and returns the speed limit.
+        """ Finds the zone for the point and returns the speed limit.
+
+        Only zones with bounds containing the point are checked, with help of the spatial index.
+        If zones overlap the zone added first is used. With a cache the speed limit is taken from
+        the grid cell of the point, unless the cell crosses the boundary of a zone.
+
+        Args:
+            point (list[float, float]): list with coordinates [longitude, latitude]
+        Returns:
+            int: speed limit of the current zone.
+        """
+        if self._cache is not None:
+            return self._cache.lookup(point, self._cell_speed_limit, self._exact_speed_limit)
+        return self._exact_speed_limit(point)
+
+    def _cell_speed_limit(self, bounds: tuple):
+        """ Speed limit for all points in a cell, if they all have the same.
+
+        Args:
+            bounds (tuple): bounds of the cell
+
+        Returns:
+            int or None: the speed limit, None if the cell crosses the boundary of the city or a zone
+        """
+        cell = box(*bounds)
+        if self.polygon.disjoint(cell):
+            return 0
+        if not contains_properly(self.polygon, cell):
+            return None
+
+        # The first zone touching the cell decides, it has to cover the whole cell
+        for index in sorted(self._get_tree().query(cell)):
+            zone = self._zones[index]
+            if zone.polygon.disjoint(cell):
+                continue
+            return zone.speed_limit if contains_properly(zone.polygon, cell) else None
+        return self.speed_limit
+
+    def _exact_speed_limit(self, point):
+        """ Speed limit for a point, checked against the polygons.
 
         Args:
             point (list[float, float]): list with coordinates [longitude, latitude]
         Returns:
             int: speed limit of the current zone.
         """
+        point_geom = Point(*point)
+
         # If the point is outside the city.
-        if not self.point_in_zone(point):
+        if not self.polygon.contains(point_geom):
             return 0
 
-        # If in city, loop through all zones and return speed limit.
-        for zone in self._zones:
-            if zone.point_in_zone(point):
-                return zone.speed_limit
+        # If in city, find zones containing the point and return speed limit of the first one.
+        indices = self._get_tree().query(point_geom, predicate='within')
+        if len(indices) > 0:
+            return self._zones[indices.min()].speed_limit
 
         # And if not in any zone meaning the bike has no restrictions.
         return self.speed_limit
+
+    def get_speed_limits(self, coords: np.ndarray):
+        """ Speed limits for many points at once, same result as get_speed_limit for each point.
+
+        All points are checked against the city and the spatial index in one vectorized call each.
+
+        Args:
+            coords (np.ndarray): points with shape (n, 2) as [longitude, latitude] in degrees
+
+        Returns:
+            np.ndarray: speed limit for each point
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        limits = np.full(len(coords), self.speed_limit)
+        if len(coords) == 0:
+            return limits
+
+        if self._zones:
+            # Pairs of point and zone for all zones containing a point, the zone added first is used
+            point_index, zone_index = self._get_tree().query(points(coords), predicate='within')
+            first_zone = np.full(len(coords), len(self._zones))
+            np.minimum.at(first_zone, point_index, zone_index)
+            in_zone = first_zone < len(self._zones)
+            zone_limits = np.array([zone.speed_limit for zone in self._zones])
+            limits[in_zone] = zone_limits[first_zone[in_zone]]
+
+        limits[~contains_xy(self.polygon, coords[:, 0], coords[:, 1])] = 0
+        return limits
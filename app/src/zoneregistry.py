@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Zone registry module, used for sharing zones between all bikes in the same city
+"""
+import os
+import asyncio
+import requests
+from src.zone import CityZone
+from src.telemetryclient import TelemetryClient
+
+
+class ZoneRegistry:
+    """ Class that fetches zones once for each city and shares them between bikes.
+
+    All bikes in a city get the same zones from server, so the zones are fetched with the
+    first bike in a city and the same frozen CityZone is given to every bike in that city.
+    Bikes look up their city in the registry each time, so when a refreshed city is fetched
+    again all bikes in the city use the new zones.
+
+    Args:
+        cell_size (float=None): if set, each city caches speed limits in grid cells of this size in degrees
+        max_cells (int=10000): max number of cached cells in each city
+    """
+    API_URL = os.environ.get('API_URL', '')
+    API_KEY = os.environ.get('API_KEY', '')
+
+    def __init__(self, cell_size: float = None, max_cells: int = 10000):
+        self._cell_size = cell_size
+        self._max_cells = max_cells
+        self._cities = {}
+        self._fetching = {}  # Ongoing asynchronous fetches, keyed by city id
+        self._fetch_count = 0
+
+    @property
+    def fetch_count(self):
+        """ int: number of requests made to server for zones """
+        return self._fetch_count
+
+    def stats(self):
+        """ Statistics for the speed limit caches of all cities.
+
+        Returns:
+            dict: summed counters from the cache in each city, empty if caches aren't used
+        """
+        result = {}
+        for city_zone in set(self._cities.values()):
+            if city_zone.cache is not None:
+                for name, value in city_zone.cache.stats().items():
+                    result[name] = result.get(name, 0) + value
+        return result
+
+    @property
+    def cities(self):
+        """ dict[CityZone]: zones for each fetched city, keyed by city id """
+        return self._cities
+
+    def _fetch(self, bike_id: int):
+        """ Fetch zones from server, with a bike in the city.
+
+        Args:
+            bike_id (int): id of a bike in the city
+
+        Returns:
+            CityZone or None: the frozen city with zones, None if request failed
+        """
+        route = f"/bikes/{bike_id}/zones"
+        req_url = self.API_URL + route
+        headers = {'x-api-key': self.API_KEY}
+        self._fetch_count += 1
+
+        try:
+            response = requests.get(req_url, headers=headers, timeout=10)
+            if response.status_code < 300:
+                return self.add_city(response.json())
+            print(f"Errorcode: {response.status_code}")
+        except requests.exceptions.RequestException as error:
+            print("Error", error)
+        return None
+
+    def add_city(self, city_zone_data: dict):
+        """ Create a city from zone data and save it in the registry.
+
+        Args:
+            city_zone_data (dict): zone data from server
+
+        Returns:
+            CityZone: the frozen city with zones
+        """
+        city_zone = CityZone.from_data(city_zone_data)
+        city_zone.freeze()
+        if self._cell_size:
+            city_zone.enable_cache(self._cell_size, self._max_cells)
+        self._cities[city_zone.city_id] = city_zone
+        return city_zone
+
+    def get(self, city_id: str, bike_id: int):
+        """ Get zones for a city, fetched from server with the bike if not fetched before.
+
+        Args:
+            city_id (str): id of the city
+            bike_id (int): id of the bike asking for zones
+
+        Returns:
+            CityZone or None: the shared city with zones, None if it couldn't be fetched
+        """
+        if city_id not in self._cities:
+            city_zone = self._fetch(bike_id)
+            if city_zone is None:
+                return None
+            # Also save with the requested id, in case it differs from id in zone data
+            self._cities[city_id] = city_zone
+
+        return self._cities[city_id]
+
+    async def _fetch_async(self, city_id: str, bike_id: int, client: TelemetryClient):
+        """ Fetch zones from server asynchronously, with a bike in the city.
+
+        Args:
+            city_id (str): id of the city
+            bike_id (int): id of a bike in the city
+            client (TelemetryClient): client used for the request
+
+        Returns:
+            CityZone or None: the frozen city with zones, None if request failed
+        """
+        req_url = self.API_URL + f"/bikes/{bike_id}/zones"
+        headers = {'x-api-key': self.API_KEY}
+        self._fetch_count += 1
+
+        try:
+            city_zone_data = await client.get_json(req_url, headers=headers)
+            if city_zone_data is None:
+                return None
+            city_zone = self.add_city(city_zone_data)
+            self._cities[city_id] = city_zone
+            return city_zone
+        finally:
+            self._fetching.pop(city_id, None)
+
+    async def get_async(self, city_id: str, bike_id: int, client: TelemetryClient):
+        """ Get zones for a city asynchronously, fetched from server with the bike if not fetched before.
+
+        Bikes asking for a city that is being fetched wait for that request instead of making a new one.
+
+        Args:
+            city_id (str): id of the city
+            bike_id (int): id of the bike asking for zones
+            client (TelemetryClient): client used for the request
+
+        Returns:
+            CityZone or None: the shared city with zones, None if it couldn't be fetched
+        """
+        if city_id in self._cities:
+            return self._cities[city_id]
+
+        if city_id not in self._fetching:
+            self._fetching[city_id] = asyncio.create_task(self._fetch_async(city_id, bike_id, client))
+
+        # Shielded so a cancelled bike doesn't cancel the fetch for the other bikes
+        return await asyncio.shield(self._fetching[city_id])
+
+    def refresh(self, city_id: str):
+        """ Remove a city, zones will be fetched again next time they are needed.
+
+        Bikes keep the old zones until the city is fetched again, then all bikes in the city use the new.
+
+        Args:
+            city_id (str): id of the city
+        """
+        city_zone = self._cities.pop(city_id, None)
+        if city_zone is None:
+            return
+        # Also remove the city saved with the id from zone data, or the requested id
+        for other_id in [key for key, value in self._cities.items() if value is city_zone]:
+            del self._cities[other_id]
+        if city_zone.cache is not None:
+            city_zone.cache.clear()  # The new zones get a new cache, free the cells for the old
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# pylint: disable=protected-access
+""" Fixtures shared by the tests for bikes, zones and the scheduler """
+
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from src.bike import Bike
+from src.gps import GpsSimulator
+
+
+@pytest.fixture
+def square():
+    """ Function for the geometry of a square zone, from west, south, east and north. """
+    def create(west: float, south: float, east: float, north: float):
+        return {'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]}
+    return create
+
+
+@pytest.fixture
+def create_bike():
+    """ Function for creating a bike with a battery that never needs charging.
+
+    The bike gets a GpsSimulator at position, or a mocked gps without position. A rented bike
+    (the default) has a mocked update_bike_data, so it can run without a server.
+    """
+    def create(bike_id: int, *, position: list = None, city_id: str = None, city_zone=None,
+               zone_registry=None, interval: int = 1, rented: bool = True):
+        data = {'id': bike_id, 'status_id': 1}
+        if city_id is not None:
+            data['city_id'] = city_id
+        battery = MagicMock()
+        battery.needs_charging.return_value = False
+        gps_simulator = MagicMock() if position is None else GpsSimulator(position)
+        bike = Bike(data, battery, gps_simulator, interval=interval, zone_registry=zone_registry)
+        if city_zone is not None:
+            bike._city_zone = city_zone
+        if rented:
+            bike.set_status(2)
+            bike.update_bike_data = AsyncMock()
+        return bike
+    return create
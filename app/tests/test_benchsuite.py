@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the comparison in the benchmark suite """
+
+import json
+from benchmarks.suite import compare, main, metric
+
+
+def results(**metrics):
+    """ Results with one case, named case. """
+    return {'results': {'case': metrics}, 'skipped': []}
+
+
+def test_compare_status():
+    """ Metrics worse than the threshold are regressions, both for higher and lower is better. """
+    baseline = results(rate=metric(100, 'ops/s'), latency=metric(10, 'ms', False), same=metric(5, 'ms', False))
+    current = results(rate=metric(80, 'ops/s'), latency=metric(5, 'ms', False), same=metric(5.2, 'ms', False))
+
+    rows = {line['metric']: line for line in compare(baseline, current, 10)}
+
+    assert rows['case.rate']['status'] == 'regression'
+    assert rows['case.rate']['change'] == -20
+    assert rows['case.latency']['status'] == 'improved'
+    assert rows['case.same']['status'] == 'ok'
+
+
+def test_compare_zero_baseline_and_new_metrics():
+    """ Any increase from 0 is a regression for a lower is better metric, metrics missing in baseline are ignored. """
+    baseline = results(dropped=metric(0, 'updates', False))
+    current = results(dropped=metric(3, 'updates', False), new=metric(1, 'ops/s'))
+
+    rows = compare(baseline, current, 10)
+
+    assert len(rows) == 1
+    assert rows[0]['change'] is None
+    assert rows[0]['status'] == 'regression'
+
+
+def test_main_compare_exit_code(tmp_path):
+    """ The compare command exits with 1 only when there are regressions. """
+    paths = {}
+    for name, value in (('baseline', 100), ('slower', 50), ('faster', 150)):
+        paths[name] = tmp_path / f"{name}.json"
+        paths[name].write_text(json.dumps(results(rate=metric(value, 'ops/s'))), encoding='UTF-8')
+
+    assert main(['compare', str(paths['baseline']), str(paths['slower'])]) == 1
+    assert main(['compare', str(paths['baseline']), str(paths['faster'])]) == 0
+    assert main(['compare', str(paths['baseline']), str(paths['slower']), '--threshold', '60']) == 0
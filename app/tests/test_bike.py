@@ -251,3 +251,41 @@ def test_load_zone_data():
     assert isinstance(zone_without_limit, Zone)
     assert zone_without_limit.speed_limit == 20
     assert city_zone.city_id == "TEST"
+
+
+@pytest.mark.asyncio
+async def test_route_resolved_on_simulation():
+    """ Route should be looked up in routes when the simulation starts, not when the bike is created. """
+    routes = MagicMock()
+    routes.get.return_value = {'trips': []}
+    bike = Bike(bike_data, MagicMock(), MagicMock(), routes=routes)
+
+    routes.get.assert_not_called()
+    with patch('src.bike.BikeSimulator') as mock_simulator:
+        mock_simulator.return_value.start_simulation = AsyncMock()
+        await bike.run_simulation()
+
+    routes.get.assert_called_once_with(1)
+    mock_simulator.assert_called_once_with(bike, {'trips': []}, 10, None)
+
+
+def test_speed_limit_timeline(square):
+    """ Speed limits for a route should be calculated once and again when the zones change. """
+    city_zone = CityZone({'geometry': square(13.0, 59.0, 14.0, 60.0), 'speed_limit': 20})
+    bike = Bike(bike_data, MagicMock(), MagicMock(), speed_limit_timeline=True)
+    bike._city_zone = city_zone
+    route = {'trips': [
+        {'coords': [[13.1, 59.1], [13.6, 59.6]]},
+        {'coords': [[13.6, 59.6], [14.5, 59.5], [13.1, 59.1]]}
+    ]}
+
+    timeline = bike._get_speed_limit_timeline(route)
+    assert [list(limits) for limits in timeline] == [[20, 20], [20, 0, 20]]
+    assert bike._get_speed_limit_timeline(route) is timeline
+
+    city_zone.add_zone(Zone({'geometry': square(13.5, 59.5, 14.0, 60.0)}, 10))
+    assert [list(limits) for limits in bike._get_speed_limit_timeline(route)] == [[20, 10], [10, 0, 20]]
+
+    # A refreshed city is a new CityZone
+    bike._city_zone = CityZone({'geometry': square(13.0, 59.0, 14.0, 60.0), 'speed_limit': 15})
+    assert [list(limits) for limits in bike._get_speed_limit_timeline(route)] == [[15, 15], [15, 0, 15]]
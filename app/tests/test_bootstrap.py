@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# pylint: disable=protected-access
+""" Module for testing the class FleetBootstrap """
+
+import asyncio
+from unittest.mock import patch
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src.bikefactory import BikeFactory
+from src.bootstrap import FleetBootstrap
+from src.mockapi import STATS, create_app
+from src.telemetryclient import TelemetryClient
+from src.zoneregistry import ZoneRegistry
+
+
+def city_data(city_id: str):
+    """ Zone data for a city without any zones. """
+    return {
+        'city_id': city_id,
+        'geometry': {'coordinates': [[[13.49, 59.37], [13.51, 59.37], [13.51, 59.39], [13.49, 59.37]]]},
+        'speed_limit': 20,
+        'zones': []
+    }
+
+
+fleet = [
+    {'id': bike_id, 'status_id': 1, 'city_id': 'KSD' if bike_id % 2 else 'GBG', 'coords': [13.5, 59.38]}
+    for bike_id in range(1, 7)
+]
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_fleet():
+    """ Start a fleet of six bikes in two cities, zones should be fetched once per city. """
+    server = TestServer(create_app(fleet=fleet, city_zones={'KSD': city_data('KSD'), 'GBG': city_data('GBG')}))
+    await server.start_server()
+    api_url = str(server.make_url(''))
+    client = TelemetryClient()
+
+    registry = ZoneRegistry()
+    registry.API_URL = api_url
+    with patch('src.bikefactory.BikeFactory._load_good_routes', return_value=set()):
+        factory = BikeFactory([], {}, client=client, zone_registry=registry)
+
+    started = []
+
+    def start_bike(bike):
+        bike.API_URL = api_url
+        started.append(asyncio.create_task(bike.update_bike_data()))
+
+    bootstrap = FleetBootstrap(factory, client, concurrency=2)
+    bootstrap.API_URL = api_url
+    bikes = await bootstrap.run(start_bike)
+    await asyncio.gather(*started)
+    await asyncio.sleep(0)  # Let the metrics be updated
+
+    assert len(bikes) == 6
+    assert server.app[STATS]['zone_requests'] == 2
+    assert server.app[STATS]['single_requests'] == 6
+    assert bikes[1]._city_zone.city_id == 'KSD'
+    assert bikes[2]._city_zone.city_id == 'GBG'
+    assert bikes[1]._city_zone is bikes[3]._city_zone
+
+    for metric in ('time_to_bike_data', 'time_to_all_started', 'time_to_first_telemetry', 'time_to_full_fleet'):
+        assert metric in bootstrap.metrics
+    assert bootstrap.metrics['time_to_first_telemetry'] <= bootstrap.metrics['time_to_full_fleet']
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_bike_with_invalid_zones():
+    """ A bike whose zones can't be read is counted as failed, the rest of the fleet is started. """
+    bad_bike = {'id': 7, 'status_id': 1, 'city_id': 'BAD', 'coords': [13.5, 59.38]}
+    app = create_app(fleet=fleet + [bad_bike], city_zones={'KSD': city_data('KSD'), 'GBG': city_data('GBG')})
+
+    @web.middleware
+    async def invalid_zones(request, handler):
+        if request.path == '/bikes/7/zones':
+            return web.Response(text='{"city_id": "BAD", "zones": [', content_type='application/json')
+        return await handler(request)
+
+    app.middlewares.append(invalid_zones)
+    server = TestServer(app)
+    await server.start_server()
+    api_url = str(server.make_url(''))
+    client = TelemetryClient()
+
+    registry = ZoneRegistry()
+    registry.API_URL = api_url
+    with patch('src.bikefactory.BikeFactory._load_good_routes', return_value=set()):
+        factory = BikeFactory([], {}, client=client, zone_registry=registry)
+
+    started = []
+
+    def start_bike(bike):
+        bike.API_URL = api_url
+        started.append(asyncio.create_task(bike.update_bike_data()))
+
+    bootstrap = FleetBootstrap(factory, client, concurrency=2)
+    bootstrap.API_URL = api_url
+    bikes = await bootstrap.run(start_bike)
+    await asyncio.gather(*started)
+    await asyncio.sleep(0)  # Let the metrics be updated
+
+    assert sorted(bikes) == [1, 2, 3, 4, 5, 6]
+    assert len(started) == 6
+    assert bootstrap.stats() == {'started': 6, 'failed': 1}
+    assert 'time_to_full_fleet' in bootstrap.metrics
+    assert bootstrap.startup_report().endswith('failed=1')
+
+    await client.close()
+    await server.close()
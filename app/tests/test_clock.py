@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the clocks """
+
+import os
+import time
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from src.bikesimulator import BikeSimulator
+from src.clock import RealClock, ScaledClock, VirtualClock, get_clock, set_clock
+from src.gps import GpsSimulator
+from src.routehandler import RouteHandler
+
+
+@pytest.fixture
+def virtual_clock():
+    """ Use a virtual clock as the process-wide clock during a test. """
+    clock = VirtualClock()
+    set_clock(clock)
+    yield clock
+    set_clock(RealClock())
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_order():
+    """ Sleeps should end in order of virtual time, without waiting in real time. """
+    clock = VirtualClock(start=100)
+    woken = []
+
+    async def sleeper(name, seconds):
+        await clock.sleep(seconds)
+        woken.append((name, clock.time()))
+
+    start = time.monotonic()
+    await asyncio.gather(sleeper('long', 3600), sleeper('short', 5), sleeper('same', 5))
+
+    assert woken == [('short', 105), ('same', 105), ('long', 3700)]
+    assert time.monotonic() - start < 1
+    assert clock.stats()['advances'] == 2
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_waits_for_active_tasks():
+    """ Time should not move while a task using the clock is busy, ex. waiting for a request. """
+    clock = VirtualClock()
+    times = []
+
+    async def busy():
+        await clock.sleep(1)
+        await asyncio.sleep(0.05)  # A request to server
+        times.append(clock.time())
+
+    async def sleeper():
+        await clock.sleep(2)
+        times.append(clock.time())
+
+    await asyncio.gather(busy(), sleeper())
+
+    assert times == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_create_task():
+    """ A task started with create_task should hold the time before it first uses the clock. """
+    clock = VirtualClock()
+
+    async def starting():
+        await asyncio.sleep(0.05)  # A request to server before the first sleep
+        await clock.sleep(10)
+        return clock.time()
+
+    async def sleeper():
+        await clock.sleep(5)
+        return clock.time()
+
+    task = clock.create_task(starting())
+
+    assert await asyncio.gather(sleeper(), task) == [5, 10]
+    assert clock.stats()['tasks'] == 0
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_wait():
+    """ A task waiting for an event should let the time move and wake up when the event is set. """
+    clock = VirtualClock()
+    event = asyncio.Event()
+
+    async def setter():
+        await clock.sleep(30)
+        event.set()
+
+    async def waiter():
+        await clock.wait(event.wait())
+        return clock.time()
+
+    _, waited_until = await asyncio.gather(setter(), waiter())
+
+    assert waited_until == 30
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_wait_for():
+    """ Waiting with a timeout should end at the event or when the virtual time has passed the timeout. """
+    clock = VirtualClock()
+    event = asyncio.Event()
+
+    async def setter():
+        await clock.sleep(5)
+        event.set()
+
+    async def waiter(timeout):
+        try:
+            await clock.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return 'timeout', clock.time()
+        return 'event', clock.time()
+
+    results = await asyncio.gather(setter(), waiter(2), waiter(10))
+
+    assert results[1:] == [('timeout', 2), ('event', 5)]
+    assert clock.time() == 5
+
+
+@pytest.mark.asyncio
+async def test_scaled_clock():
+    """ Sleeps should be divided by the speedup and the time should move speedup times faster. """
+    clock = ScaledClock(50)
+    start_time = clock.time()
+    start = time.monotonic()
+
+    await clock.sleep(10)
+
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+    assert clock.time() - start_time == pytest.approx(10, abs=5)
+    assert clock.stats()['sleeps'] == 1
+
+
+def test_scaled_clock_speedup():
+    """ Speedup must be positive. """
+    with pytest.raises(ValueError):
+        ScaledClock(0)
+
+
+@pytest.mark.asyncio
+async def test_simulation_with_speedup():
+    """ A trip with speedup should report the same speeds in a shorter real time. """
+    base_dir = os.path.dirname(__file__)
+    trip = RouteHandler(os.path.join(base_dir, 'test-data'), 5).routes[100]['trips'][0]
+
+    bike = MagicMock()
+    bike.update_bike_data = AsyncMock()
+    bike.is_unlocked.return_value = True
+    bike.gps = MagicMock(wraps=GpsSimulator(trip['coords'][0].tolist()))
+    simulator = BikeSimulator(bike, {}, 5)
+
+    set_clock(ScaledClock(100))
+    start = time.monotonic()
+    try:
+        with patch.object(BikeSimulator, '_end_renting'), patch.object(BikeSimulator, '_simulate_break'):
+            await simulator._simulate_trip(trip, 1)  # pylint: disable=protected-access
+    finally:
+        set_clock(RealClock())
+
+    assert time.monotonic() - start < len(trip['coords']) * 5 / 100 + 1
+    assert [call.args[1] for call in bike.gps.move.call_args_list] == trip['speeds'][1:].tolist()
+
+
+@pytest.mark.asyncio
+async def test_simulation_in_virtual_time(virtual_clock):
+    """ A trip should take its virtual time with the same speeds as in real time. """
+    base_dir = os.path.dirname(__file__)
+    trip = RouteHandler(os.path.join(base_dir, 'test-data'), 5).routes[100]['trips'][0]
+
+    bike = MagicMock()
+    bike.update_bike_data = AsyncMock()
+    bike.is_unlocked.return_value = True
+    bike.gps = MagicMock(wraps=GpsSimulator(trip['coords'][0].tolist()))
+    simulator = BikeSimulator(bike, {}, 5)
+
+    start = time.monotonic()
+    with patch('src.bikesimulator.random.randint', return_value=2), patch.object(BikeSimulator, '_end_renting'):
+        await simulator._simulate_trip(trip, 1)  # pylint: disable=protected-access
+
+    assert virtual_clock.time() == len(trip['coords']) * 5 + 2 * 10
+    assert time.monotonic() - start < 5
+    assert [call.args[1] for call in bike.gps.move.call_args_list] == trip['speeds'][1:].tolist()
+    assert get_clock() is virtual_clock
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the fleet generator """
+
+import json
+import numpy as np
+import pytest
+from src.fleetgen import FleetGenerator
+from src.mockapi import load_fleet
+from src.routehandler import RouteHandler
+from src.zone import CityZone
+
+
+@pytest.mark.parametrize('mode', ['walk', 'od'])
+def test_routes_stay_where_riding_is_allowed(mode):
+    """ All points should be in the city and outside zones with speed limit 0, trips continue from the last. """
+    generator = FleetGenerator(50, mode=mode, seed=3)
+    city_zone = CityZone.from_data(generator.city_zones['LOAD'])
+
+    for bike_id in generator:
+        route = generator[bike_id]
+        assert route['initialStart'] == generator.bike(bike_id)['coords']
+        position = route['initialStart']
+        for trip in route['trips']:
+            assert trip['coords'][0] == position
+            assert (city_zone.get_speed_limits(np.array(trip['coords'])) > 0).all()
+            assert trip['summary']['distance'] > 0
+            position = trip['coords'][-1]
+
+
+def test_same_seed_same_fleet():
+    """ A bike should get the same route each time, and a different seed should give another fleet. """
+    generator = FleetGenerator(10)
+
+    assert generator[7] == FleetGenerator(10)[7]
+    assert generator[7] != FleetGenerator(10, seed=2)[7]
+    assert list(generator) == list(range(1, 11))
+    assert 10 in generator and 11 not in generator
+    with pytest.raises(KeyError):
+        generator[11]  # pylint: disable=pointless-statement
+
+
+def test_bikes_in_shard():
+    """ Each shard should get only its own bikes, all shards together the whole fleet. """
+    generator = FleetGenerator(10, first_id=3)
+    shards = [[bike['id'] for bike in generator.bikes(index, 4)] for index in range(4)]
+
+    assert shards == [[4, 8, 12], [5, 9], [6, 10], [3, 7, 11]]
+    assert [bike['id'] for bike in generator.bikes()] == list(range(3, 13))
+    assert next(generator.bikes(1, 4)) == generator.bike(5)
+
+
+def test_unknown_mode():
+    """ Unknown modes should raise ValueError. """
+    with pytest.raises(ValueError):
+        FleetGenerator(1, mode='teleport')
+
+
+def test_route_handler_with_generator():
+    """ RouteHandler should process generated routes lazily, with lengths and speeds for the interval. """
+    routes = RouteHandler(None, 5, source=FleetGenerator(100_000), max_resident=10).routes
+
+    route = routes[99_999]
+    for bike_id in range(1, 21):
+        routes.get(bike_id)
+
+    assert len(routes) == 100_000
+    assert routes.stats()['resident'] == 10
+    for trip in route['trips']:
+        assert trip['interval'] == 5
+        assert trip['speeds'].max() <= 20
+
+
+def test_write(tmp_path):
+    """ Written routes should load with RouteHandler and bikes and zones with the stand-in server. """
+    generator = FleetGenerator(20, mode='od')
+    written = []
+    generator.write(str(tmp_path), written.append)
+
+    fleet, city_zones = load_fleet(str(tmp_path))
+    routes = RouteHandler(str(tmp_path / 'routes'), 5).routes
+    with open(tmp_path / 'routes' / '3.json', 'r', encoding='UTF-8') as file:
+        route = json.load(file)
+
+    assert written == list(range(1, 21))
+    assert fleet == list(generator.bikes())
+    assert city_zones == generator.city_zones
+    assert sorted(routes) == list(range(1, 21))
+    assert route == generator[3]
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the class FleetZoneEvaluator """
+
+import asyncio
+from unittest.mock import MagicMock
+import pytest
+from src.fleetzones import FleetZoneEvaluator
+from src.scheduler import FleetScheduler
+from src.zone import CityZone, Zone
+
+
+@pytest.fixture
+def city_zone(square):
+    """ City with a slow zone in the north-east and a forbidden zone in the south-west. """
+    city = CityZone({'city_id': 'TEST', 'geometry': square(13.0, 59.0, 14.0, 60.0), 'speed_limit': 20})
+    city.add_zones_list([
+        Zone({'geometry': square(13.5, 59.5, 14.0, 60.0)}, 10),
+        Zone({'geometry': square(13.0, 59.0, 13.2, 59.2), 'speed_limit': 0})
+    ])
+    return city
+
+
+def test_same_as_bike_by_bike(square, create_bike, city_zone):
+    """ Speed limits for all bikes should be the same as when each bike checks its own. """
+    other_city = CityZone({'geometry': square(15.0, 59.0, 16.0, 60.0), 'speed_limit': 15})
+    positions = [[13.7, 59.7], [13.1, 59.1], [13.3, 59.3], [14.5, 59.5], [15.5, 59.5]]
+    bikes = [create_bike(i, position=position, city_zone=city_zone) for i, position in enumerate(positions[:4])]
+    bikes.append(create_bike(4, position=positions[4], city_zone=other_city))
+    bikes.append(create_bike(5, position=positions[0]))  # Without zones
+
+    evaluator = FleetZoneEvaluator()
+    assert evaluator.update(bikes) == 5
+    fleet_limits = [bike.speed_limit for bike in bikes]
+
+    for bike in bikes:
+        bike.check_state()
+    assert fleet_limits == [bike.speed_limit for bike in bikes]
+    assert fleet_limits == [10, 0, 20, 0, 15, 20]
+    assert evaluator.stats() == {'evaluations': 1, 'bikes': 5, 'cities': 2}
+
+
+@pytest.mark.asyncio
+async def test_scheduler_uses_evaluator(create_bike, city_zone):
+    """ The scheduler should set speed limits with the evaluator instead of bike by bike. """
+    evaluator = FleetZoneEvaluator()
+    scheduler = FleetScheduler(tick=0.5, seed=1, zone_evaluator=evaluator)
+    bike = create_bike(1, position=[13.7, 59.7], city_zone=city_zone)
+    bike._update_speed_limit = MagicMock()
+    scheduler.add(bike)
+
+    for _ in range(4):
+        scheduler.advance()
+    await asyncio.sleep(0)
+
+    bike._update_speed_limit.assert_not_called()
+    assert bike.speed_limit == 10
+    assert evaluator.stats()['bikes'] == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_evaluates_window(create_bike, city_zone):
+    """ Speed limits should be looked up once per window for all bikes due in it, added bikes bike by bike. """
+    evaluator = FleetZoneEvaluator()
+    scheduler = FleetScheduler(tick=0.1, seed=1, zone_evaluator=evaluator, zone_window=1.0)
+    bikes = [create_bike(bike_id, position=[13.7, 59.7], city_zone=city_zone) for bike_id in range(1, 21)]
+    for bike in bikes:
+        bike._update_speed_limit = MagicMock()
+        scheduler.add(bike)
+
+    for _ in range(25):
+        scheduler.advance()
+    added = create_bike(21, position=[13.7, 59.7], city_zone=city_zone)
+    added._update_speed_limit = MagicMock(wraps=added._update_speed_limit)
+    scheduler.add(added)
+    assert scheduler._due[21] <= 30  # Due in the window already looked up
+    for _ in range(10):
+        scheduler.advance()
+    await asyncio.sleep(0)
+
+    assert evaluator.stats() == {'evaluations': 4, 'bikes': 20 * 3 + 21, 'cities': 4}
+    assert all(bike.speed_limit == 10 for bike in bikes + [added])
+    added._update_speed_limit.assert_called_once()
+    for bike in bikes:
+        bike._update_speed_limit.assert_not_called()
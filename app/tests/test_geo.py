@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the geo functions """
+
+import math
+import random
+import numpy as np
+from geopy.distance import lonlat, distance
+from src.geo import planar_distance, segment_lengths
+
+
+def test_segment_lengths():
+    """ Lengths should be the same as geodesic distance, and one less than number of points. """
+    coords = [
+        [13.508699207322167, 59.38210003526896],
+        [13.505173887431198, 59.38216072603788],  # 200 meters from first point
+        [13.505173887431198, 59.38216072603788],  # Same point again
+        [13.49476285318039, 59.3790176201388]
+    ]
+    lengths = segment_lengths(np.array(coords))
+
+    assert len(lengths) == 3
+    assert round(lengths[0]) == 200
+    assert lengths[1] == 0
+    for i, length in enumerate(lengths):
+        geodesic = distance(lonlat(*coords[i]), lonlat(*coords[i + 1])).meters
+        assert abs(length - geodesic) < 0.001
+
+
+def test_planar_distance():
+    """ Planar distance should be within the documented error for distances under 100 m. """
+    rng = random.Random(1)
+    for _ in range(2000):
+        latitude = rng.uniform(-70, 70)
+        length = rng.uniform(1, 100)
+        bearing = rng.uniform(0, 2 * math.pi)
+        start = [rng.uniform(-180, 180), latitude]
+        end = [
+            start[0] + length * math.sin(bearing) / (111000 * math.cos(math.radians(latitude))),
+            start[1] + length * math.cos(bearing) / 111000
+        ]
+        geodesic = distance(lonlat(*start), lonlat(*end)).meters
+        assert abs(planar_distance(start, end) - geodesic) / geodesic < 3e-5
+
+    assert planar_distance([13.5, 59.38], [13.5, 59.38]) == 0
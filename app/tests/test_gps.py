@@ -35,3 +35,20 @@ class TestGps(unittest.TestCase):
         time_in_seconds = 200
         gps_sim.position = (first_position, time_in_seconds)
         self.assertAlmostEqual(gps_sim.speed, 4, "Should be 4 (3.6 rounded up)")
+
+    def test_planar_distance(self):
+        """ Planar distance should give the same speed as geodesic """
+        first_position = [13.508699207322167, 59.38210003526896]
+        second_position = [13.505173887431198, 59.38216072603788]
+        geodesic_gps = GpsSimulator(first_position)
+        planar_gps = GpsSimulator(first_position, 'planar')
+
+        geodesic_gps.position = (second_position, 7)
+        planar_gps.position = (second_position, 7)
+        self.assertAlmostEqual(planar_gps._speed, geodesic_gps._speed, 2)  # pylint: disable=protected-access
+        self.assertEqual(planar_gps.speed, 103)
+
+    def test_unknown_distance(self):
+        """ Unknown distance backend should raise ValueError """
+        with self.assertRaises(ValueError):
+            GpsSimulator([13.5, 59.38], 'flat')
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the load generator """
+
+import pytest
+import loadgen
+
+
+@pytest.mark.asyncio
+async def test_load_generator():
+    """ A short run against the in-process server should send updates and rent bikes without drops. """
+    args = loadgen.parse_args(['--bikes', '20', '--duration', '1.5', '--warmup', '0.2', '--interval', '1',
+                               '--simulate', '2', '--trip-points', '3', '--sse-connections', '0'])
+    report = await loadgen.run(args)
+
+    assert report['bikes'] == 20
+    assert report['updates_received'] > 0
+    assert report['updates_dropped'] == 0
+    assert report['errors'] == 0
+    assert report['requests_per_second'] == report['requests'] / 1.5
+    assert 0 < report['request_p50_ms'] <= report['request_p99_ms']
+    assert report['encode_p99_ms'] > 0
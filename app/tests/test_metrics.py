@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the metrics module """
+
+import asyncio
+import json
+from unittest.mock import MagicMock
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, unused_port
+from src.bike import Bike
+from src.battery import BatterySimulator
+from src.gps import GpsSimulator
+from src.metrics import (Histogram, Metrics, NullMetrics, dump_metrics, get_metrics, monitor_loop_lag,
+                         serve_metrics, set_metrics)
+from src.telemetryclient import TelemetryClient
+
+
+def test_histogram():
+    """ Buckets should be cumulative, with times on a bound counted in that bucket. """
+    histogram = Histogram((0.1, 1))
+    for seconds in (0.05, 0.1, 0.5, 2):
+        histogram.observe(seconds)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'0.1': 2, '1': 3, '+Inf': 4}
+    assert snapshot['count'] == 4
+    assert snapshot['sum'] == pytest.approx(2.65)
+
+
+def test_prometheus_text():
+    """ Stages, counters and gauges should be exported in the Prometheus text format. """
+    metrics = Metrics((0.1,))
+    metrics.record('check_state', 0.01)
+    metrics.count('http_errors_total', 'status', 503)
+    metrics.count('http_errors_total', 'status', 503)
+    metrics.gauge_function('in_flight_requests', lambda: 3)
+
+    lines = metrics.prometheus().splitlines()
+    assert 'bike_brain_stage_seconds_bucket{stage="check_state",le="0.1"} 1' in lines
+    assert 'bike_brain_stage_seconds_count{stage="check_state"} 1' in lines
+    assert 'bike_brain_http_errors_total{status="503"} 2' in lines
+    assert 'bike_brain_in_flight_requests 3' in lines
+    assert metrics.snapshot()['counters'] == {'http_errors_total{status="503"}': 2}
+
+
+def test_disabled_by_default():
+    """ Metrics should be disabled until enabled, and wrapped functions not wrapped. """
+    metrics = get_metrics()
+    assert isinstance(metrics, NullMetrics)
+    assert metrics.timed('encode', json.dumps) is json.dumps
+
+    bike = Bike({'id': 1, 'status_id': 1}, MagicMock(), MagicMock())
+    bike.check_state()
+    assert metrics.snapshot() == {'stages': {}, 'counters': {}, 'gauges': {}}
+
+
+@pytest.mark.asyncio
+async def test_client_and_bike_stages():
+    """ The client should measure encoding and requests and count errors, the bike its stages. """
+    async def put_bike(request):
+        await request.read()
+        return web.Response(status=503 if request.match_info['id'] == '2' else 200)
+
+    application = web.Application()
+    application.router.add_put('/bikes/{id}', put_bike)
+    server = TestServer(application)
+    await server.start_server()
+
+    metrics = Metrics()
+    set_metrics(metrics)
+    client = TelemetryClient()
+    bike = Bike({'id': 1, 'status_id': 1}, BatterySimulator(1), GpsSimulator([13.5, 59.38]), client=client)
+    bike.API_URL = str(server.make_url(''))
+    try:
+        bike.check_state()
+        await bike.update_bike_data()
+        async with client.put(str(server.make_url('/bikes/2')), json={}) as response:
+            assert response.status == 503
+        with pytest.raises(aiohttp.ClientError):
+            async with client.put(f"http://127.0.0.1:{unused_port()}/bikes/3", json={}):
+                pass
+    finally:
+        set_metrics(NullMetrics())
+        await client.close()
+        await server.close()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['stages']['encode']['count'] == 3
+    assert snapshot['stages']['request']['count'] == 2
+    assert snapshot['stages']['update_bike_data']['count'] == 1
+    assert snapshot['stages']['check_state']['count'] == 1
+    assert snapshot['counters'] == {'http_errors_total{status="503"}': 1, 'http_errors_total{status="connection"}': 1}
+
+
+@pytest.mark.asyncio
+async def test_exports(tmp_path):
+    """ Metrics should be served as text and JSON, dumped to a file, and the loop lag measured. """
+    metrics = Metrics()
+    metrics.record('sse_control', 0.001)
+    port = unused_port()
+    runner = await serve_metrics(metrics, port)
+    path = str(tmp_path / 'metrics.json')
+    tasks = [asyncio.create_task(dump_metrics(metrics, path, 0.05)),
+             asyncio.create_task(monitor_loop_lag(metrics, 0.01))]
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                assert 'stage="sse_control"' in await response.text()
+            async with session.get(f"http://127.0.0.1:{port}/metrics.json") as response:
+                assert (await response.json())['stages']['sse_control']['count'] == 1
+        await asyncio.sleep(0.2)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await runner.cleanup()
+
+    with open(path, encoding='UTF-8') as file:
+        dumped = json.load(file)
+    assert dumped['stages']['sse_control']['count'] == 1
+    assert 'event_loop_lag_seconds' in dumped['gauges']
+    assert metrics.snapshot()['stages']['loop_lag']['count'] > 0
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the stand-in server in mockapi """
+
+import asyncio
+import json
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from src.mockapi import RENTALS, STATS, create_app, synthetic_fleet
+from src.zone import CityZone
+
+
+def test_synthetic_fleet():
+    """ Synthetic bikes should be inside the synthetic city. """
+    fleet, city_zones = synthetic_fleet(50, zone_count=5)
+    city_zone = CityZone.from_data(city_zones['LOAD'])
+
+    assert [data['id'] for data in fleet] == list(range(1, 51))
+    assert len(city_zone._zones) == 5  # pylint: disable=protected-access
+    assert all(city_zone.point_in_zone(data['coords']) for data in fleet)
+
+
+@pytest.mark.asyncio
+async def test_rent_and_return_send_events():
+    """ Renting and returning a bike should send set_status to listeners on /bikes/instructions. """
+    fleet, city_zones = synthetic_fleet(2)
+    server = TestServer(create_app(fleet=fleet, city_zones=city_zones))
+    await server.start_server()
+
+    async with aiohttp.ClientSession() as session:
+        events = await session.get(server.make_url('/bikes/instructions'))
+        while (await (await session.get(server.make_url('/stats'))).json())['listeners'] == 0:
+            await asyncio.sleep(0.01)
+
+        async with session.post(server.make_url('/user/bikes/rent/2'), json={'userId': 1}) as response:
+            trip_id = (await response.json())['id']
+        async with session.post(server.make_url('/user/bikes/rent/2'), json={'userId': 1}) as response:
+            assert 'errors' in await response.json()
+        assert server.app[RENTALS] == {trip_id: 2}
+
+        async with session.put(server.make_url(f'/user/bikes/return/{trip_id}'), json={'userId': 1}) as response:
+            assert response.status == 200
+        async with session.put(server.make_url(f'/user/bikes/return/{trip_id}'), json={'userId': 1}) as response:
+            assert response.status == 404
+
+        received = []
+        while len(received) < 2:
+            line = (await events.content.readline()).decode().strip()
+            if line.startswith('data: '):
+                received.append(json.loads(line[len('data: '):]))
+        events.close()
+
+    assert received == [{'bike_id': 2, 'instruction': 'set_status', 'args': [2]},
+                        {'bike_id': 2, 'instruction': 'set_status', 'args': [1]}]
+    assert server.app[STATS]['rentals'] == 1
+    assert server.app[STATS]['returns'] == 1
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_changed_zones_send_refresh():
+    """ Changing the zones of a city should send refresh_zones and return the new zones. """
+    fleet, city_zones = synthetic_fleet(1)
+    city_id = fleet[0]['city_id']
+    server = TestServer(create_app(fleet=fleet, city_zones=city_zones))
+    await server.start_server()
+    changed = {**city_zones[city_id], 'speed_limit': 15}
+
+    async with aiohttp.ClientSession() as session:
+        events = await session.get(server.make_url('/bikes/instructions'))
+        while (await (await session.get(server.make_url('/stats'))).json())['listeners'] == 0:
+            await asyncio.sleep(0.01)
+
+        async with session.put(server.make_url(f'/zones/{city_id}'), json=changed) as response:
+            assert response.status == 200
+        async with session.get(server.make_url(f"/bikes/{fleet[0]['id']}/zones")) as response:
+            assert await response.json() == changed
+
+        line = ''
+        while not line.startswith('data: '):
+            line = (await events.content.readline()).decode().strip()
+        events.close()
+
+    assert json.loads(line[len('data: '):]) == {'refresh_zones': city_id}
+    await server.close()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the perf module """
+
+import asyncio
+import json
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src import perf
+from src.perf import JsonCodec, enable_fast_path, get_codec, set_codec
+from src.telemetryclient import TelemetryClient
+
+payload = {'id': 1, 'city_id': 'KSD', 'status_id': 2, 'charge_perc': 0.5, 'coords': [13.5, 59.38], 'speed': 18}
+
+
+def test_stdlib_codec():
+    """ Without fast the json module should be used. """
+    codec = JsonCodec()
+
+    assert not codec.fast
+    assert codec.dumps is json.dumps
+    assert codec.loads is json.loads
+
+
+def test_fast_codec():
+    """ Fast codec should give the same data as the json module, also for numpy floats. """
+    pytest.importorskip('orjson')
+    codec = JsonCodec(fast=True)
+
+    assert codec.fast
+    assert isinstance(codec.dumps(payload), str)
+    assert json.loads(codec.dumps(payload)) == payload
+    assert codec.loads(json.dumps(payload)) == payload
+    assert json.loads(codec.dumps({'coords': [np.float64(13.5), np.float64(59.38)]})) == {'coords': [13.5, 59.38]}
+
+
+def test_fast_path_falls_back(monkeypatch):
+    """ Without the libraries enable_fast_path should use asyncio and the json module. """
+    old_codec = get_codec()
+    monkeypatch.setattr(perf, 'orjson', None)
+    monkeypatch.setattr(perf, 'uvloop', None)
+
+    assert enable_fast_path() == {'uvloop': False, 'orjson': False}
+    assert get_codec().dumps is json.dumps
+    assert isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy)
+
+    set_codec(old_codec)
+
+
+@pytest.mark.asyncio
+async def test_client_uses_codec():
+    """ TelemetryClient should encode and decode with the process-wide codec. """
+    received = []
+
+    async def put_bike(request):
+        received.append(await request.json())
+        return web.json_response(received[-1])
+
+    application = web.Application()
+    application.router.add_put('/bikes/1', put_bike)
+    server = TestServer(application)
+    await server.start_server()
+
+    calls = []
+    old_codec = get_codec()
+    codec = JsonCodec(fast=True)
+    codec.dumps = lambda obj: calls.append(obj) or json.dumps(obj)
+    set_codec(codec)
+    client = TelemetryClient()
+
+    async with client.put(str(server.make_url('/bikes/1')), json=payload) as response:
+        assert response.status == 200
+    assert calls == [payload]
+    assert received == [payload]
+
+    set_codec(old_codec)
+    await client.close()
+    await server.close()
@@ -4,8 +4,13 @@
 """ Module for testing the class RouteHandler """
 
 import os
+import json
+import shutil
+from unittest.mock import patch
+import numpy as np
 import pytest
-from src.routehandler import RouteHandler
+from geopy.distance import lonlat, distance
+from src.routehandler import COORD_SCALE, RouteHandler, trip_positions
 
 
 def test_init_routehandler():
@@ -76,3 +81,170 @@ def test_right_distance_5():
 
     assert len(routes[100]['trips'][0]['coords']) == 20
     assert len(routes[100]['trips'][1]['coords']) == 9
+
+
+def copy_test_data(target):
+    """ Copy the json-files in test-data to target, used when files are changed by a test. """
+    base_dir = os.path.dirname(__file__)
+    test_directory = os.path.join(base_dir, 'test-data')
+    for filename in os.listdir(test_directory):
+        if filename.endswith('.json'):
+            shutil.copy(os.path.join(test_directory, filename), target)
+
+
+def test_route_cache(tmp_path):
+    """ Routes should be saved to the cache on first load and loaded from it on next. """
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    copy_test_data(routes_dir)
+    cache_dir = tmp_path / 'cache'
+
+    first = RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir))
+    second = RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir))
+
+    assert not first.from_cache
+    assert second.from_cache
+    assert len(os.listdir(cache_dir)) == 3
+    for bike_id, route in first.routes.items():
+        for i, trip in enumerate(route['trips']):
+            assert np.array_equal(trip['coords'], second.routes[bike_id]['trips'][i]['coords'])
+            assert np.array_equal(trip['speeds'], second.routes[bike_id]['trips'][i]['speeds'])
+            assert trip['user'] == second.routes[bike_id]['trips'][i]['user']
+
+
+def test_route_cache_invalidated(tmp_path):
+    """ Cache should not be used if interval or a route file is changed, old cache should be removed. """
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    copy_test_data(routes_dir)
+    cache_dir = tmp_path / 'cache'
+
+    RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir))
+    other_interval = RouteHandler(str(routes_dir), 50, cache_dir=str(cache_dir))
+    assert not other_interval.from_cache
+    assert len(other_interval.routes[100]['trips'][0]['coords']) == 3
+
+    route_file = routes_dir / '100.json'
+    route = json.loads(route_file.read_text(encoding="UTF-8"))
+    route['trips'] = route['trips'][:1]
+    route_file.write_text(json.dumps(route), encoding="UTF-8")
+
+    changed = RouteHandler(str(routes_dir), 50, cache_dir=str(cache_dir))
+    assert not changed.from_cache
+    assert len(changed.routes[100]['trips']) == 1
+    assert len(os.listdir(cache_dir)) == 3
+
+
+def test_lazy_routes(tmp_path):
+    """ In lazy mode routes should be loaded when used, and only max_resident routes kept in memory. """
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    copy_test_data(routes_dir)
+    shutil.copy(routes_dir / '100.json', routes_dir / '101.json')
+
+    rhandler = RouteHandler(str(routes_dir), 10, lazy=True, max_resident=1)
+    routes = rhandler.routes
+
+    assert len(routes) == 3
+    assert 100 in routes and 101 in routes
+    assert routes.stats()['loads'] == 0
+    assert routes.get(999) is None
+
+    assert len(routes[100]['trips'][0]['coords']) == 11
+    assert routes[100] is routes[100]
+    routes.get(101)
+    routes.get(100)  # Was removed from memory by 101
+
+    stats = routes.stats()
+    assert stats['loads'] == 3
+    assert stats['hits'] == 2
+    assert stats['resident'] == 1
+
+
+def test_lazy_wrong_file():
+    """ Lazy mode should also fail on start for files with wrong name """
+    base_dir = os.path.dirname(__file__)
+    test_directory = os.path.join(base_dir, 'test-data/wrong-files')
+    with pytest.raises(ValueError):
+        RouteHandler(test_directory, lazy=True)
+
+
+def test_compact_routes():
+    """ Compact routes should be int32 microdegrees and read back in degrees. """
+    base_dir = os.path.dirname(__file__)
+    test_directory = os.path.join(base_dir, 'test-data')
+    routes = RouteHandler(test_directory, 10).routes
+    compact = RouteHandler(test_directory, 10, compact=True).routes
+
+    coords = routes[100]['trips'][0]['coords']
+    compact_coords = compact[100]['trips'][0]['coords']
+    assert compact_coords.dtype == np.int32
+    assert compact_coords.nbytes * 2 == coords.nbytes
+
+    positions = list(trip_positions(compact_coords))
+    assert len(positions) == len(coords)
+    assert isinstance(positions[0][0], float)
+    assert np.abs(np.array(positions) - coords).max() <= 0.5 / COORD_SCALE
+    assert list(trip_positions(coords)) == coords.tolist()
+
+
+def test_lengths_and_speeds():
+    """ Each trip should have a length and speed for each point, same as the distance between the points. """
+    base_dir = os.path.dirname(__file__)
+    test_directory = os.path.join(base_dir, 'test-data')
+    routes = RouteHandler(test_directory, 10).routes
+
+    for trip in routes[100]['trips']:
+        coords = trip['coords']
+        assert len(trip['lengths']) == len(trip['speeds']) == len(coords)
+        assert trip['lengths'][0] == 0
+        assert trip['interval'] == 10
+        for i in range(1, len(coords)):
+            geodesic = distance(lonlat(*coords[i - 1]), lonlat(*coords[i])).meters
+            assert abs(trip['lengths'][i] - geodesic) < 0.001
+            assert abs(trip['speeds'][i] - geodesic / 10 * 3.6) < 0.001
+        assert trip['speeds'].max() < 20  # Points are added so no speed is over 20 km/h
+
+
+def test_routes_for_some_bikes(tmp_path):
+    """ With bike_ids only those routes should be kept, read from the cache but without writing it. """
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    copy_test_data(routes_dir)
+    cache_dir = tmp_path / 'cache'
+
+    without_cache = RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir), bike_ids={100})
+    assert list(without_cache.routes) == [100]
+    assert not cache_dir.exists()
+    assert list(RouteHandler(str(routes_dir), 10, lazy=True, bike_ids={1}).routes) == [1]
+
+    RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir))
+    from_cache = RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir), bike_ids={100})
+    assert from_cache.from_cache
+    assert list(from_cache.routes) == [100]
+    assert len(from_cache.routes[100]['trips'][0]['coords']) == 11
+
+
+def test_route_cache_saved_at_once(tmp_path):
+    """ Saving the same cache from many processes should not fail when another has removed old files. """
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    copy_test_data(routes_dir)
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    (cache_dir / 'routes-old.json').write_text('{}', encoding="UTF-8")
+    listdir = os.listdir
+
+    def listdir_removed_by_other(path):
+        """ List files, then remove the old cache as another process would. """
+        filenames = listdir(path)
+        if (cache_dir / 'routes-old.json').exists():
+            os.remove(cache_dir / 'routes-old.json')
+        return filenames
+
+    with patch('src.routehandler.os.listdir', side_effect=listdir_removed_by_other):
+        RouteHandler(str(routes_dir), 10, cache_dir=str(cache_dir))
+
+    filenames = os.listdir(cache_dir)
+    assert len(filenames) == 3
+    assert all(filename.startswith('routes-') and filename != 'routes-old.json' for filename in filenames)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the class FleetScheduler """
+
+import asyncio
+import pytest
+from src.clock import RealClock, VirtualClock, set_clock
+from src.scheduler import FleetScheduler
+
+
+@pytest.mark.asyncio
+async def test_sends_spread_over_interval(create_bike):
+    """ Each bike should send once per interval, and sends should be spread over the ticks. """
+    scheduler = FleetScheduler(tick=0.1, seed=1)
+    bikes = [create_bike(bike_id, interval=2) for bike_id in range(1, 41)]
+    for bike in bikes:
+        scheduler.add(bike)
+
+    sends_per_tick = []
+    sent = 0
+    for _ in range(40):  # Two intervals of 20 ticks
+        scheduler.advance()
+        await asyncio.sleep(0)
+        total = sum(bike.update_bike_data.await_count for bike in bikes)
+        sends_per_tick.append(total - sent)
+        sent = total
+
+    for bike in bikes:
+        assert bike.update_bike_data.await_count == 2
+    assert max(sends_per_tick) <= 4  # 40 bikes on 20 ticks, two per tick if perfectly even
+    assert scheduler.stats()['sent'] == 80
+
+
+@pytest.mark.asyncio
+async def test_skip_and_remove(create_bike):
+    """ Simulating bikes should be skipped and removed bikes should not run. """
+    scheduler = FleetScheduler(tick=0.1, seed=1)
+    simulating = create_bike(1, interval=2)
+    simulating._simulation_event_off.clear()  # pylint: disable=protected-access
+    removed = create_bike(2, interval=2)
+    scheduler.add(simulating)
+    scheduler.add(removed)
+    scheduler.remove(removed)
+
+    for _ in range(20):
+        scheduler.advance()
+    await asyncio.sleep(0)
+
+    simulating.update_bike_data.assert_not_awaited()
+    removed.update_bike_data.assert_not_awaited()
+    assert scheduler.stats()['skipped_simulating'] == 1
+    assert scheduler.bikes == 1
+
+
+@pytest.mark.asyncio
+async def test_run_and_stop(create_bike):
+    """ The scheduler loop should run bikes in real time until stopped. """
+    scheduler = FleetScheduler(tick=0.05)
+    bike = create_bike(1, interval=2)
+    scheduler.add(bike)
+
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(2.2)
+    scheduler.stop()
+    await task
+
+    assert bike.update_bike_data.await_count >= 1
+    assert scheduler.stats()['ticks'] >= 40
+
+
+@pytest.mark.asyncio
+async def test_run_in_virtual_time(create_bike):
+    """ With a virtual clock an hour of ticks should run without waiting in real time. """
+    clock = VirtualClock()
+    set_clock(clock)
+    try:
+        scheduler = FleetScheduler(tick=0.5, seed=1)
+        bike = create_bike(1, interval=2)
+        scheduler.add(bike)
+
+        task = asyncio.create_task(scheduler.run())
+        await clock.sleep(3600)
+        scheduler.stop()
+        await task
+    finally:
+        set_clock(RealClock())
+
+    assert bike.update_bike_data.await_count == pytest.approx(1800, abs=1)
+    assert scheduler.stats()['late_ticks'] == 0
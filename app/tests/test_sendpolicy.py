@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the class DeltaSendPolicy """
+
+from unittest.mock import MagicMock
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src.bike import Bike
+from src.sendpolicy import DeltaSendPolicy, HEARTBEAT, SEND, SKIP
+from src.telemetryclient import TelemetryClient
+from src.uplink import BatchUplink
+
+parked = {'id': 1, 'city_id': 'KSD', 'status_id': 1, 'charge_perc': 0.5, 'coords': [13.5, 59.38], 'speed': 0}
+
+
+def test_skip_unchanged():
+    """ Unchanged data should be skipped, changed data sent. """
+    policy = DeltaSendPolicy(battery_threshold=0.01, max_silence=300)
+
+    assert policy.decide(parked, now=0) == (SEND, parked)
+    policy.acknowledge(parked, SEND, now=0)
+
+    assert policy.decide(dict(parked), now=10) == (SKIP, None)
+    assert policy.decide({**parked, 'charge_perc': 0.495}, now=20) == (SKIP, None)
+    assert policy.decide({**parked, 'charge_perc': 0.49}, now=30)[0] == SEND
+    assert policy.decide({**parked, 'coords': [13.6, 59.38]}, now=40)[0] == SEND
+    assert policy.decide({**parked, 'status_id': 3}, now=50)[0] == SEND
+
+    assert policy.stats() == {'sent': 4, 'skipped': 2, 'heartbeats': 0}
+
+
+def test_heartbeat_after_silence():
+    """ A heartbeat should be sent when nothing has been sent for max_silence seconds. """
+    policy = DeltaSendPolicy(max_silence=300)
+    policy.acknowledge(parked, SEND, now=0)
+
+    assert policy.decide(parked, now=299)[0] == SKIP
+    assert policy.decide(parked, now=300) == (HEARTBEAT, {'id': 1, 'status_id': 1, 'charge_perc': 0.5})
+    policy.acknowledge(parked, HEARTBEAT, now=300)
+    assert policy.decide(parked, now=400)[0] == SKIP
+
+    policy.forget(1)
+    assert policy.decide(parked, now=401)[0] == SEND
+
+
+@pytest.mark.asyncio
+async def test_bike_skips_unchanged():
+    """ A parked bike should only send its data once, and not skip data that the server didn't get. """
+    received = []
+    statuses = [500]  # First request fails
+
+    async def put_bike(request):
+        received.append(await request.json())
+        return web.json_response({}, status=statuses.pop(0) if statuses else 200)
+
+    application = web.Application()
+    application.router.add_put('/bikes/{id}', put_bike)
+    server = TestServer(application)
+    await server.start_server()
+    client = TelemetryClient()
+
+    gps_sim = MagicMock(position=[13.5, 59.38], speed=0)
+    policy = DeltaSendPolicy()
+    bike = Bike({'id': 1, 'status_id': 1}, MagicMock(level=0.5), gps_sim, client=client, send_policy=policy)
+    bike.API_URL = str(server.make_url(''))
+
+    for _ in range(4):
+        await bike.update_bike_data()
+
+    assert len(received) == 2  # First failed so it is sent again
+    assert policy.stats() == {'sent': 2, 'skipped': 2, 'heartbeats': 0}
+    assert bike.first_update.is_set()
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_sent_again():
+    """ Data in a failed batch shouldn't be acknowledged, the next unchanged data is sent in full. """
+    received = []
+    statuses = [500]  # First batch fails
+
+    async def put_bikes(request):
+        received.append(await request.json())
+        return web.json_response({}, status=statuses.pop(0) if statuses else 200)
+
+    application = web.Application()
+    application.router.add_put('/bikes', put_bikes)
+    server = TestServer(application)
+    await server.start_server()
+    client = TelemetryClient()
+    uplink = BatchUplink(client)
+    uplink.API_URL = str(server.make_url(''))
+
+    gps_sim = MagicMock(position=[13.5, 59.38], speed=0)
+    policy = DeltaSendPolicy()
+    bike = Bike({'id': 1, 'status_id': 1}, MagicMock(level=0.5), gps_sim, client=client, send_policy=policy,
+                uplink=uplink)
+
+    for _ in range(3):
+        await bike.update_bike_data()
+        await uplink.flush()
+
+    assert received == [[bike.get_data()], [bike.get_data()]]  # Full data again after the failed batch
+    assert policy.stats() == {'sent': 2, 'skipped': 1, 'heartbeats': 0}
+    assert uplink.stats()['failed'] == 1
+
+    await client.close()
+    await server.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the shard module """
+
+import os
+import sys
+from src.shard import ShardSupervisor, partition
+
+
+def crash_first_time(index: int, bike_data: list, metrics_queue, marker_dir: str):
+    """ Shard that crashes the first time it is started, then reports its number of bikes. """
+    marker = os.path.join(marker_dir, f"started-{index}")
+    if not os.path.exists(marker):
+        with open(marker, 'w', encoding="UTF-8"):
+            pass
+        sys.exit(1)
+    metrics_queue.put((index, {'bikes': len(bike_data), 'name': 'not summed'}))
+
+
+def test_partition():
+    """ Bikes should be split by id, every bike in exactly one shard. """
+    bike_data = [{'id': bike_id} for bike_id in range(1, 11)]
+    parts = partition(bike_data, 3)
+
+    assert [len(part) for part in parts] == [3, 4, 3]
+    assert all(data_item['id'] % 3 == index for index, part in enumerate(parts) for data_item in part)
+
+
+def test_supervisor_restarts(tmp_path):
+    """ Crashed shards should be restarted and metrics from all shards summed. """
+    bike_data = [{'id': bike_id} for bike_id in range(1, 11)]
+    supervisor = ShardSupervisor(
+        crash_first_time, partition(bike_data, 2), args=(str(tmp_path),), restart_delay=0.1
+    )
+    supervisor.run(poll_interval=0.1)
+
+    assert supervisor.restarts == [1, 1]
+    total = supervisor.aggregate()
+    assert total['bikes'] == 10
+    assert total['shards_reporting'] == 2
+    assert total['restarts'] == 2
+    assert 'name' not in total
+
+
+def test_aggregate():
+    """ Counters should be summed over the shards, lateness, time and settings should not. """
+    supervisor = ShardSupervisor(crash_first_time, [[], []])
+    supervisor.metrics.update({
+        0: {'bikes': 5, 'pool_limit': 100, 'pool_limit_per_host': 100, 'clock_speedup': 10,
+            'clock_max_late': 0.5, 'clock_sleeps': 20},
+        1: {'bikes': 6, 'pool_limit': 100, 'pool_limit_per_host': 100, 'clock_speedup': 10,
+            'clock_max_late': 2.0, 'clock_sleeps': 30, 'zone_cache_max_cells': 1000}
+    })
+
+    assert supervisor.aggregate() == {
+        'shards_reporting': 2, 'restarts': 0, 'bikes': 11, 'pool_limit': 100, 'pool_limit_per_host': 100,
+        'clock_speedup': 10, 'clock_max_late': 2.0, 'clock_sleeps': 50, 'zone_cache_max_cells': 1000
+    }
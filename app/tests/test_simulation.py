@@ -10,7 +10,8 @@ multiple classes to work.
 """
 
 import os
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
+import numpy as np
 import pytest
 from src.bike import Bike
 from src.bikesimulator import BikeSimulator
@@ -164,3 +165,43 @@ async def test_sim_one_ok_one_error(bike_setup, mock_methods):
             assert speed <= 20
 
         assert bike._interval == bike.SLOW_INTERVAL
+
+
+@pytest.mark.asyncio
+async def test_simulation_uses_speeds():
+    """ Test that speeds from RouteHandler are used, and the gps only calculates distance to the first point. """
+    base_dir = os.path.dirname(__file__)
+    test_directory = os.path.join(base_dir, 'test-data')
+    trip = RouteHandler(test_directory, 5).routes[100]['trips'][0]
+
+    bike = MagicMock()
+    bike.update_bike_data = AsyncMock()
+    bike.is_unlocked.return_value = True
+    bike.gps = MagicMock(wraps=GpsSimulator(trip['coords'][0].tolist()))
+    simulator = BikeSimulator(bike, {}, 5)
+
+    with patch('src.bikesimulator.asyncio.sleep', new=AsyncMock()), \
+            patch.object(BikeSimulator, '_end_renting'), patch.object(BikeSimulator, '_simulate_break'):
+        await simulator._simulate_trip(trip, 1)
+
+    moves = bike.gps.move.call_args_list
+    assert len(moves) == len(trip['coords']) - 1
+    assert [speed for _, speed in (call.args for call in moves)] == trip['speeds'][1:].tolist()
+    assert isinstance(moves[0].args[0][0], float)
+
+
+@pytest.mark.asyncio
+async def test_simulation_sets_speed_limits():
+    """ Test that speed limits calculated for the trip are set on the bike for each point. """
+    trip = {'coords': [[13.1, 59.1], [13.1001, 59.1001], [13.1002, 59.1002]]}
+
+    bike = MagicMock()
+    bike.update_bike_data = AsyncMock()
+    bike.is_unlocked.return_value = True
+    simulator = BikeSimulator(bike, {}, 5)
+
+    with patch('src.bikesimulator.asyncio.sleep', new=AsyncMock()), \
+            patch.object(BikeSimulator, '_end_renting'), patch.object(BikeSimulator, '_simulate_break'):
+        await simulator._simulate_trip(trip, 1, np.array([20, 10, 0]))
+
+    assert [call.args[0] for call in bike.set_speed_limit.call_args_list] == [20, 10, 0]
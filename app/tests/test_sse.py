@@ -4,9 +4,12 @@
 
 import json
 import asyncio
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
-from src.sselistener import SSEListener
+from src.bike import Bike
+from src.clock import RealClock, VirtualClock, set_clock
+from src.sselistener import SSEListener, FleetSSEListener
+from src.zoneregistry import ZoneRegistry
 
 
 class MockEvent:
@@ -107,3 +110,123 @@ async def test_change_status():
         await listen_task
 
     mock_bike.set_status.assert_called_with(2)
+
+
+@pytest.mark.asyncio
+async def test_fleet_listener():
+    """ Test that the fleet listener sends each instruction to the right bike only. """
+    bikes = {bike_id: MagicMock(id=bike_id) for bike_id in range(1, 5)}
+    listener = FleetSSEListener(bikes, "http://justatest.bikes", connections=2)
+    instructions = [
+        {'bike_id': 3, 'instruction': 'lock_bike'},
+        {'bike_id': 99, 'instruction': 'lock_bike'},
+        {'instruction_all': 'set_status', 'args': [1]}
+    ]
+
+    # One iterator for each connection
+    with patch('src.sselistener.aiosseclient', side_effect=[MockAsyncIter(instructions), MockAsyncIter(instructions)]):
+        listen_task = asyncio.create_task(listener.listen())
+        await asyncio.sleep(0.2)
+        listener.stop_listener()
+        await listen_task
+
+    bikes[3].lock_bike.assert_called_once()
+    for bike_id in (1, 2, 4):
+        bikes[bike_id].lock_bike.assert_not_called()
+    for bike in bikes.values():
+        bike.set_status.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_fleet_listener_simulation_holds_virtual_time():
+    """ A simulation started by an instruction should hold the virtual time from the start. """
+    clock = VirtualClock()
+    set_clock(clock)
+    started = asyncio.Event()
+    ended = []
+
+    async def run_simulation():
+        started.set()
+        await asyncio.sleep(0.05)  # A request to server before the first sleep
+        await clock.sleep(10)
+        ended.append(clock.time())
+
+    bikes = {1: MagicMock(id=1, run_simulation=run_simulation)}
+    listener = FleetSSEListener(bikes, "http://justatest.bikes", connections=1)
+
+    try:
+        with patch('src.sselistener.aiosseclient', return_value=MockAsyncIter([{'instruction_all': 'run_simulation'}])):
+            listen_task = asyncio.create_task(listener.listen())
+            await started.wait()
+            await clock.create_task(clock.sleep(5))
+            await asyncio.sleep(0.2)
+            listener.stop_listener()
+            await listen_task
+    finally:
+        set_clock(RealClock())
+
+    assert ended == [10]
+
+
+def test_fleet_listener_in_shard():
+    """ Bikes in a shard should be spread over all connections, not all on the same one. """
+    bikes = {bike_id: MagicMock(id=bike_id) for bike_id in range(1, 17, 2)}  # Shard 1 of 2
+    listener = FleetSSEListener(bikes, "http://justatest.bikes", connections=2, shards=2)
+
+    owns = listener._owns  # pylint: disable=protected-access
+    owned = [[bike_id for bike_id in bikes if owns(bike_id, index)] for index in range(2)]
+
+    assert owned == [[1, 5, 9, 13], [3, 7, 11, 15]]
+
+
+@pytest.mark.asyncio
+async def test_fleet_listener_bad_events():
+    """ Bad events and failing instructions should be skipped, the other bikes and events still run. """
+    bikes = {bike_id: MagicMock(spec=['id', 'lock_bike', 'set_status'], id=bike_id) for bike_id in range(1, 4)}
+    bikes[1].lock_bike.side_effect = RuntimeError("Broken lock")
+    listener = FleetSSEListener(bikes, "http://justatest.bikes")
+    instructions = [
+        {'bike_id': 'abc', 'instruction': 'lock_bike'},
+        {'bike_id': 2, 'instruction': 'fly'},
+        {'instruction_all': 'lock_bike'},
+        {'instruction_all': 'set_status', 'args': [1]}
+    ]
+
+    with patch('src.sselistener.aiosseclient', return_value=MockAsyncIter(instructions)):
+        listen_task = asyncio.create_task(listener.listen())
+        await asyncio.sleep(0.2)
+        listener.stop_listener()
+        await listen_task
+
+    for bike in bikes.values():
+        bike.lock_bike.assert_called_once()
+        bike.set_status.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_fleet_listener_refreshes_zones():
+    """ A refresh_zones event should fetch the city again once, then all bikes in it use the new zones. """
+    city = {'city_id': 'TEST', 'speed_limit': 20,
+            'geometry': {'coordinates': [[[13.0, 59.0], [14.0, 59.0], [14.0, 60.0], [13.0, 60.0], [13.0, 59.0]]]}}
+    registry = ZoneRegistry()
+    old_zone = registry.add_city(city)
+    client = MagicMock()
+    client.get_json = AsyncMock(return_value={**city, 'speed_limit': 15})
+    bikes = {}
+    for bike_id in range(1, 5):
+        bikes[bike_id] = Bike({'id': bike_id, 'status_id': 1, 'city_id': 'TEST'}, MagicMock(),
+                              MagicMock(position=[13.5, 59.5]), client=client, zone_registry=registry)
+        bikes[bike_id].update_zones()
+    listener = FleetSSEListener(bikes, "http://justatest.bikes", connections=2, zone_registry=registry)
+    instructions = [{'refresh_zones': 'TEST'}]
+
+    with patch('src.sselistener.aiosseclient', side_effect=[MockAsyncIter(instructions), MockAsyncIter(instructions)]):
+        listen_task = asyncio.create_task(listener.listen())
+        await asyncio.sleep(0.2)
+        listener.stop_listener()
+        await listen_task
+
+    client.get_json.assert_awaited_once()
+    for bike in bikes.values():
+        assert bike.city_zone is not old_zone
+        assert bike.city_zone.get_speed_limit([13.5, 59.5]) == 15
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the class TelemetryClient """
+
+from unittest.mock import MagicMock
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src.bike import Bike
+from src.telemetryclient import TelemetryClient, get_client, set_client
+
+
+async def start_server():
+    """ Start a small local server that answers PUT /bikes/{id}. """
+    async def put_bike(request):
+        data = await request.json()
+        return web.json_response({'id': data.get('id')})
+
+    app = web.Application()
+    app.router.add_put('/bikes/{id}', put_bike)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused():
+    """ Make three requests after each other, only one connection should be created. """
+    server = await start_server()
+    client = TelemetryClient(limit=5, limit_per_host=5)
+
+    for _ in range(3):
+        async with client.put(str(server.make_url('/bikes/1')), json={'id': 1}) as response:
+            assert response.status == 200
+            assert await response.json() == {'id': 1}
+
+    stats = client.stats()
+    assert stats['created'] == 1
+    assert stats['reused'] == 2
+    assert stats['open'] == 1
+    assert stats['idle'] == 1
+    assert stats['queued'] == 0
+    assert stats['in_flight'] == 0
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_bike_uses_client():
+    """ Bike should send its data through the injected client. """
+    server = await start_server()
+    client = TelemetryClient()
+    bike = Bike({'id': 1, 'status_id': 1}, MagicMock(level=1), MagicMock(position=[1, 1], speed=0), client=client)
+    bike.API_URL = str(server.make_url(''))
+
+    await bike.update_bike_data()
+    await bike.update_bike_data()
+
+    assert bike.client is client
+    assert client.stats()['created'] == 1
+
+    await client.close()
+    await server.close()
+
+
+def test_shared_client():
+    """ Bikes without an injected client should share the process-wide client. """
+    old_client = get_client()
+    client = TelemetryClient()
+    set_client(client)
+
+    bike_one = Bike({'id': 1, 'status_id': 1}, MagicMock(), MagicMock())
+    bike_two = Bike({'id': 2, 'status_id': 1}, MagicMock(), MagicMock())
+
+    assert bike_one.client is client
+    assert bike_two.client is client
+
+    set_client(old_client)
+
+
+@pytest.mark.asyncio
+async def test_get_json_retries():
+    """ A server error should be retried, a missing page should not. """
+    calls = []
+
+    async def failing(request):
+        calls.append(request.path)
+        return web.Response(status=503)
+
+    app = web.Application()
+    app.router.add_get('/broken', failing)
+    server = TestServer(app)
+    await server.start_server()
+    client = TelemetryClient()
+
+    assert await client.get_json(str(server.make_url('/broken')), retries=2, backoff=0.01) is None
+    assert len(calls) == 3
+
+    assert await client.get_json(str(server.make_url('/missing')), retries=2, backoff=0.01) is None
+
+    await client.close()
+    await server.close()
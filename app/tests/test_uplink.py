@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Module for testing the class BatchUplink """
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from aiohttp.test_utils import TestServer
+from src.bike import Bike
+from src.clock import RealClock, ScaledClock, VirtualClock, set_clock
+from src.mockapi import BIKES, STATS, create_app
+from src.telemetryclient import TelemetryClient
+from src.uplink import BatchUplink
+
+
+async def start_server(bulk: bool = True):
+    """ Start the stand-in server on a free port. """
+    server = TestServer(create_app(bulk=bulk))
+    await server.start_server()
+    return server
+
+
+def create_uplink(server: TestServer, client: TelemetryClient, **kwargs):
+    """ Create an uplink that sends to the test server. """
+    uplink = BatchUplink(client, **kwargs)
+    uplink.API_URL = str(server.make_url(''))
+    return uplink
+
+
+@pytest.mark.asyncio
+async def test_send_in_batches():
+    """ Five bikes with batch size two should be sent as three bulk requests. """
+    server = await start_server()
+    client = TelemetryClient()
+    uplink = create_uplink(server, client, batch_size=2)
+
+    for bike_id in range(1, 6):
+        await uplink.submit({'id': bike_id, 'status_id': 1})
+
+    for _ in range(3):
+        await uplink.flush()
+
+    assert uplink.pending == 0
+    assert server.app[STATS]['bulk_requests'] == 3
+    assert server.app[STATS]['single_requests'] == 0
+    assert set(server.app[BIKES]) == {1, 2, 3, 4, 5}
+    assert uplink.stats()['sent_bulk'] == 5
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_fallback_without_bulk():
+    """ Bikes should be sent one by one when the bulk endpoint is missing. """
+    server = await start_server(bulk=False)
+    client = TelemetryClient()
+    uplink = create_uplink(server, client)
+
+    await uplink.submit({'id': 1, 'status_id': 1})
+    await uplink.submit({'id': 2, 'status_id': 1})
+    await uplink.flush()
+
+    assert server.app[STATS]['single_requests'] == 2
+    assert set(server.app[BIKES]) == {1, 2}
+
+    # Bulk endpoint shouldn't be tried again until retry_bulk_after has passed
+    await uplink.submit({'id': 3, 'status_id': 1})
+    await uplink.flush()
+
+    assert server.app[STATS]['single_requests'] == 3
+    assert uplink.stats()['sent_single'] == 3
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+    """ Submit should wait when the queue is full, but the same bike can still be updated. """
+    uplink = BatchUplink(MagicMock(), batch_size=2, max_pending=2)
+
+    await uplink.submit({'id': 1, 'speed': 0})
+    await uplink.submit({'id': 2, 'speed': 0})
+    await uplink.submit({'id': 2, 'speed': 10})  # Only replaces the waiting data
+
+    blocked = asyncio.create_task(uplink.submit({'id': 3, 'speed': 0}))
+    await asyncio.sleep(0.1)
+    assert not blocked.done()
+    assert uplink.pending == 2
+    assert uplink.stats()['coalesced'] == 1
+
+    uplink._take_batch()  # pylint: disable=protected-access
+    await asyncio.wait_for(blocked, timeout=1)
+    assert uplink.pending == 1
+
+
+@pytest.mark.asyncio
+async def test_bike_with_uplink():
+    """ Bike should hand its data to the uplink instead of sending it. """
+    gps_sim = MagicMock(position=[13.5, 59.3], speed=0)
+    battery_sim = MagicMock(level=0.5)
+    uplink = BatchUplink(MagicMock())
+    client = MagicMock()
+    bike = Bike({'id': 7, 'status_id': 1}, battery_sim, gps_sim, client=client, uplink=uplink)
+
+    await bike.update_bike_data()
+
+    assert uplink.pending == 1
+    client.put.assert_not_called()
+
+
+@pytest.mark.parametrize('bulk', [True, False], ids=['bulk', 'fallback'])
+@pytest.mark.parametrize('create_clock', [VirtualClock, lambda: ScaledClock(20)], ids=['virtual', 'speedup'])
+@pytest.mark.asyncio
+async def test_uplink_with_faster_clock(create_clock, bulk):
+    """ Batches and bulk retries should be timed on the clock, so updates aren't merged when time moves faster. """
+    server = await start_server(bulk=bulk)
+    client = TelemetryClient()
+    uplink = create_uplink(server, client, retry_bulk_after=10)
+    uplink._send_bulk = AsyncMock(wraps=uplink._send_bulk)  # pylint: disable=protected-access
+    clock = create_clock()
+    set_clock(clock)
+
+    async def bike(bike_id):
+        for _ in range(10):
+            await uplink.submit({'id': bike_id, 'status_id': 1})
+            await clock.sleep(3)
+
+    try:
+        uplink_task = asyncio.create_task(uplink.run())
+        await asyncio.gather(*(bike(bike_id) for bike_id in range(1, 11)))
+        uplink.stop()
+        await uplink_task
+    finally:
+        set_clock(RealClock())
+
+    assert uplink.stats()['coalesced'] == 0
+    if bulk:
+        assert uplink.stats()['sent_bulk'] == 100
+    else:
+        # Sent one by one, the bulk endpoint is tried again each 10 s of simulated time
+        assert uplink.stats()['sent_single'] == 100
+        assert uplink._send_bulk.await_count == 3  # pylint: disable=protected-access
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_error():
+    """ A batch that can't reach the server should be counted as failed, not stop the uplink. """
+    server = await start_server()
+    client = TelemetryClient()
+    uplink = create_uplink(server, client)
+    await server.close()
+
+    await uplink.submit({'id': 1, 'status_id': 1})
+    await uplink.submit({'id': 2, 'status_id': 1})
+    await uplink.flush()
+
+    assert uplink.pending == 0
+    assert uplink.stats()['failed'] == 2
+    assert uplink.stats()['sent_bulk'] == 0
+
+    await client.close()
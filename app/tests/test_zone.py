@@ -2,6 +2,7 @@
 # -*- coding: UTF-8 -*-
 """ Module for testing the class Zone and CityZone """
 
+import random
 from src.zone import Zone, CityZone
 
 # Has speed limit 0
@@ -174,3 +175,79 @@ def test_city_zones_without_speed():
     assert city_zone.get_speed_limit(point_in_parking_zone) == 20  # Default value
     assert city_zone.get_speed_limit(point_in_zone) == 0
     assert city_zone.get_speed_limit(point_barely_outside_zone) == 20
+
+
+def test_overlapping_zones_order():
+    """ Test that the zone added first is used when zones overlap. """
+    slow_city = {**city_zone_data, 'speed_limit': 10}  # Zone covering the whole city
+
+    city_zone = CityZone(city_zone_data)
+    city_zone.add_zones_list([Zone(parking_zone, 15), Zone(slow_city)])
+
+    assert city_zone.get_speed_limit(point_in_parking_zone) == 15
+    assert city_zone.get_speed_limit(point_in_zone) == 10
+    assert city_zone.get_speed_limit(point_outside_city) == 0
+
+    # Adding a zone after a lookup should update the index
+    city_zone = CityZone(city_zone_data)
+    city_zone.add_zone(Zone(forbidden_zone))
+    assert city_zone.get_speed_limit(point_in_parking_zone) == 20
+    city_zone.add_zone(Zone(parking_zone, 15))
+    assert city_zone.get_speed_limit(point_in_parking_zone) == 15
+
+
+def test_speed_limits_for_many_points():
+    """ Test that speed limits for many points are the same as for each point. """
+    slow_city = {**city_zone_data, 'speed_limit': 10}
+    city_zone = CityZone(city_zone_data)
+    city_zone.add_zones_list([Zone(forbidden_zone), Zone(parking_zone, 15), Zone(slow_city)])
+    coords = [point_in_zone, point_in_parking_zone, point_barely_outside_zone, point_outside_city]
+
+    limits = city_zone.get_speed_limits(coords)
+
+    assert list(limits) == [city_zone.get_speed_limit(point) for point in coords]
+    assert list(limits) == [0, 15, 10, 0]
+    assert len(city_zone.get_speed_limits([])) == 0
+
+
+def test_revision():
+    """ Test that the revision changes when zones are added. """
+    city_zone = CityZone(city_zone_data)
+    assert city_zone.revision == 0
+
+    city_zone.add_zone(Zone(forbidden_zone))
+    city_zone.add_zones_list([Zone(parking_zone)])
+    assert city_zone.revision == 2
+
+
+def test_cached_speed_limits():
+    """ Test that cached speed limits are the same as exact, also for points near zone boundaries. """
+    rng = random.Random(1)
+    slow_city = {**city_zone_data, 'speed_limit': 10}
+    exact = CityZone(city_zone_data)
+    cached = CityZone(city_zone_data)
+    for city_zone in (exact, cached):
+        city_zone.add_zones_list([Zone(forbidden_zone), Zone(parking_zone, 15), Zone(slow_city)])
+    cached.enable_cache(cell_size=0.0002, max_cells=50)
+
+    coords = [point_in_zone, point_in_parking_zone, point_barely_outside_zone, point_outside_city]
+    coords += [[rng.uniform(13.497, 13.507), rng.uniform(59.378, 59.383)] for _ in range(2000)]
+    for point in coords + coords:
+        assert cached.get_speed_limit(point) == exact.get_speed_limit(point)
+
+    stats = cached.cache.stats()
+    assert stats['hits'] > 0 and stats['exact'] > 0
+    assert stats['hits'] + stats['misses'] == len(coords) * 2
+    assert stats['cells'] == 50
+
+
+def test_cache_cleared_when_zones_change():
+    """ Test that cells are classified again when a zone is added. """
+    city_zone = CityZone(city_zone_data)
+    city_zone.enable_cache()
+    assert city_zone.get_speed_limit(point_in_parking_zone) == 20
+    assert len(city_zone.cache) == 1
+
+    city_zone.add_zone(Zone(parking_zone, 15))
+    assert len(city_zone.cache) == 0
+    assert city_zone.get_speed_limit(point_in_parking_zone) == 15
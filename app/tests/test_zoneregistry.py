@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# pylint: disable=protected-access
+""" Module for testing the class ZoneRegistry """
+
+from unittest.mock import patch
+import pytest
+from src.zone import CityZone, Zone
+from src.zoneregistry import ZoneRegistry
+
+zone_data = {
+    'city_id': 'TEST',
+    'geometry': {
+        'coordinates': [
+            [[13.49, 59.37], [13.51, 59.37], [13.51, 59.39], [13.49, 59.39], [13.49, 59.37]]
+        ]
+    },
+    'speed_limit': 20,
+    'zones': [
+        {
+            'zone_id': 1,
+            'geometry': {
+                'coordinates': [
+                    [[13.50, 59.38], [13.505, 59.38], [13.505, 59.385], [13.50, 59.385], [13.50, 59.38]]
+                ]
+            },
+            'speed_limit': 0,
+        }
+    ]
+}
+
+
+def test_zones_fetched_once_per_city(create_bike):
+    """ Bikes in the same city should share one CityZone, fetched with one request. """
+    registry = ZoneRegistry()
+    bikes = [create_bike(bike_id, city_id='TEST', zone_registry=registry, rented=False) for bike_id in range(1, 4)]
+
+    with patch('src.zoneregistry.requests.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = zone_data
+        for bike in bikes:
+            bike.update_zones()
+
+        mock_get.assert_called_once()
+
+    assert registry.fetch_count == 1
+    city_zone = bikes[0]._city_zone
+    assert isinstance(city_zone, CityZone)
+    assert all(bike._city_zone is city_zone for bike in bikes)
+    assert city_zone.get_speed_limit([13.502, 59.382]) == 0
+    assert city_zone.get_speed_limit([13.495, 59.375]) == 20
+
+
+def test_failed_fetch_is_retried():
+    """ A city that couldn't be fetched should be fetched again by the next bike. """
+    registry = ZoneRegistry()
+
+    with patch('src.zoneregistry.requests.get') as mock_get:
+        mock_get.return_value.status_code = 500
+        assert registry.get('TEST', 1) is None
+
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = zone_data
+        assert registry.get('TEST', 2) is not None
+
+    assert registry.fetch_count == 2
+
+
+def test_shared_city_is_frozen():
+    """ Zones can't be added to a city that is shared between bikes. """
+    registry = ZoneRegistry()
+    city_zone = registry.add_city(zone_data)
+
+    assert city_zone.frozen
+    assert registry.get('TEST', 1) is city_zone
+    with pytest.raises(RuntimeError):
+        city_zone.add_zone(Zone(zone_data['zones'][0]))
+
+    # After refresh the city is fetched again
+    registry.refresh('TEST')
+    assert 'TEST' not in registry.cities
+
+
+def test_registry_caches():
+    """ Cities should get a speed limit cache when the registry has a cell size, cleared on refresh. """
+    registry = ZoneRegistry(cell_size=0.001, max_cells=100)
+    city_zone = registry.add_city(zone_data)
+    assert registry.stats() == {'hits': 0, 'misses': 0, 'exact': 0, 'cells': 0, 'max_cells': 100}
+
+    city_zone.get_speed_limit([13.4955, 59.3755])
+    city_zone.get_speed_limit([13.4956, 59.3756])
+    assert registry.stats()['hits'] == 1
+    assert registry.stats()['misses'] == 1
+
+    registry.refresh('TEST')
+    assert len(city_zone.cache) == 0
+    assert ZoneRegistry().add_city(zone_data).cache is None
+
+
+def test_refresh_reaches_running_bikes(create_bike):
+    """ After a refresh all bikes in the city should use the new zones once any bike has fetched them. """
+    registry = ZoneRegistry()
+    bikes = [create_bike(bike_id, city_id='OTHER', zone_registry=registry, rented=False) for bike_id in range(1, 4)]
+    for bike in bikes:
+        bike.gps.position = [13.495, 59.375]
+
+    with patch('src.zoneregistry.requests.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = zone_data
+        for bike in bikes:
+            bike.update_zones()
+        old_zone = bikes[0].city_zone
+
+        registry.refresh('OTHER')
+        assert registry.cities == {}
+        assert bikes[1].city_zone is old_zone  # Old zones are used until fetched again
+
+        mock_get.return_value.json.return_value = {**zone_data, 'speed_limit': 15}
+        bikes[0].update_zones()
+
+    for bike in bikes:
+        bike.check_state()
+        assert bike.city_zone is not old_zone
+        assert bike.speed_limit == 15
+    assert registry.fetch_count == 2